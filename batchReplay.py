@@ -0,0 +1,278 @@
+"""
+Batch replay: push recorded conversations through MBTIBot, e.g. for prompt
+regression tests and offline evaluation.
+
+    python batchReplay.py sessions.jsonl results.jsonl --workers 32 --rpm 3000 --tpm 1000000
+
+Each input line is one session:
+    {"session_id": "abc", "answers": ["2", "yes", "INFP", "reading, hiking", ...]}
+The answers are given to the bot's questions in order. A question after the
+last answer fails the session with ScriptExhausted. --workers sessions run at
+once on one event loop, each through MBTIBot.arun(). All their model requests
+pass one RateLimiter, which keeps the whole batch under --rpm requests and
+--tpm tokens per minute.
+
+Every session is appended to the output as one JSON line as soon as it ends:
+    {"session_id", "ok", "error", "result", "transcript", "metrics"}
+transcript is what the bot said and asked, with the answers. metrics has the
+wall time, the model calls by cache outcome, prompt / completion tokens,
+retries and the seconds spent waiting for the rate limiter. Lines are flushed
+one by one. Running the same command again after an interruption skips the
+sessions already in the output; --redo-failed also runs the failed ones again
+and replaces their records.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from chatApp import MBTIBot
+from instrumentation import Instrumentation
+from mbtiEngine import get_engine
+from requestCoalescing import SingleFlight, VariantPool
+
+
+class ScriptExhausted(Exception):
+    """The bot asked more questions than the session has answers."""
+
+
+class RateLimiter:
+    """
+    Async context manager around every model request of the batch (MBTIBot's llm_limiter).
+    Two token buckets refill continuously, `rpm` requests and `tpm` tokens per minute, each
+    holding at most one minute's worth. A request needs one request token and a token
+    balance that is not negative. What it really used is debited afterwards by record(),
+    an instrumentation sink, because the size of a reply is not known up front.
+    """
+
+    def __init__(self, rpm=None, tpm=None, clock=time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.clock = clock
+        self._requests = float(rpm or 0)
+        self._tokens = float(tpm or 0)
+        self._updated = clock()
+        self._lock = asyncio.Lock()   # requests are let through in arrival order
+        self.waiting = 0              # read by MBTIBot._speculate: no guesses while requests queue
+
+    def _refill(self):
+        now = self.clock()
+        elapsed, self._updated = now - self._updated, now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _delay(self):
+        delay = 0.0
+        if self.rpm and self._requests < 1:
+            delay = (1 - self._requests) * 60 / self.rpm
+        if self.tpm and self._tokens < 0:
+            delay = max(delay, -self._tokens * 60 / self.tpm)
+        return delay
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    self._refill()
+                    delay = self._delay()
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self._requests -= 1
+        finally:
+            self.waiting -= 1
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def record(self, record):
+        if self.tpm:
+            self._refill()
+            self._tokens -= record.get("prompt_tokens", 0) + record.get("completion_tokens", 0)
+
+
+class _SessionLimiter:
+    """The shared limiter, timing how long one session waits for it."""
+
+    def __init__(self, limiter, metrics):
+        self.limiter = limiter
+        self.metrics = metrics
+
+    @property
+    def waiting(self):
+        return self.limiter.waiting
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        await self.limiter.__aenter__()
+        self.metrics["limiter_wait"] += time.perf_counter() - started
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.limiter.__aexit__(*exc)
+
+
+def read_sessions(path):
+    """(session id, answers) for every line of the input file."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                answers = [str(answer) for answer in data["answers"]]
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"{path}:{number}: expected {{\"session_id\", \"answers\": [...]}} ({e})") from None
+            yield str(data.get("session_id") or data.get("id") or f"line-{number}"), answers
+
+
+def finished_sessions(path, redo_failed=False):
+    """Ids of the sessions already in the output, after cutting off a line left half-written.
+
+    With redo_failed the failed records are removed from the output, so the
+    sessions run again end up there once.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    finished = set()
+    kept = []
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("ok") or not redo_failed:
+            finished.add(record["session_id"])
+            kept.append(line)
+    if redo_failed and len(kept) < data[:end].count(b"\n"):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(line + b"\n" for line in kept))
+        os.replace(tmp, path)
+    return finished
+
+
+async def replay_session(session_id, answers, engine, limiter=None, **bot_kwargs):
+    """Run one scripted session; returns its output record."""
+    transcript = []
+    metrics = {"wall_time": 0.0, "calls": {}, "prompt_tokens": 0, "completion_tokens": 0, "retries": 0,
+               "errors": 0, "limiter_wait": 0.0}
+    script = iter(answers)
+
+    async def scripted_input(question):
+        answer = next(script, None)
+        if answer is None:
+            raise ScriptExhausted(f"no answer left for: {question!r}")
+        transcript.append({"type": "ask", "text": question, "answer": answer})
+        return answer
+
+    def collect(record):
+        cache = record.get("cache") or "bypass"
+        metrics["calls"][cache] = metrics["calls"].get(cache, 0) + 1
+        metrics["prompt_tokens"] += record.get("prompt_tokens", 0)
+        metrics["completion_tokens"] += record.get("completion_tokens", 0)
+        metrics["retries"] += record.get("retries", 0)
+        metrics["errors"] += bool(record.get("error"))
+
+    sinks = [collect] + ([limiter.record] if limiter is not None else [])
+    bot = MBTIBot(input_func=scripted_input, print_func=lambda text: transcript.append({"type": "say", "text": text}),
+                  engine=engine.replace(instrumentation=Instrumentation(sinks)),
+                  llm_limiter=_SessionLimiter(limiter, metrics) if limiter is not None else None, **bot_kwargs)
+    started = time.perf_counter()
+    record = {"session_id": session_id, "ok": True, "error": None, "result": None}
+    try:
+        record["result"] = await bot.arun()
+        if record["result"].get("rejected"):
+            record.update(ok=False, error="InputRejected")
+    except Exception as e:
+        record.update(ok=False, error=f"{type(e).__name__}: {e}")
+    metrics["wall_time"] = round(time.perf_counter() - started, 4)
+    metrics["limiter_wait"] = round(metrics["limiter_wait"], 4)
+    record.update(transcript=transcript, metrics=metrics)
+    return record
+
+
+async def areplay(sessions, output_path, engine, workers=32, limiter=None, skip=(), log=print, **bot_kwargs):
+    """Replay `sessions` ((id, answers) pairs) on `workers` concurrent sessions, appending records to output_path."""
+    queue = asyncio.Queue(maxsize=workers * 2)
+    counts = {"ran": 0, "failed": 0, "skipped": 0}
+
+    async def produce():
+        for session_id, answers in sessions:
+            if session_id in skip:
+                counts["skipped"] += 1
+                continue
+            await queue.put((session_id, answers))
+        for _ in range(workers):
+            await queue.put(None)
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def work():
+            while (item := await queue.get()) is not None:
+                record = await replay_session(*item, engine, limiter, **bot_kwargs)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                counts["ran"] += 1
+                counts["failed"] += not record["ok"]
+                if counts["ran"] % 100 == 0:
+                    log(f"{counts['ran']} sessions done, {counts['failed']} failed")
+
+        await asyncio.gather(produce(), *(work() for _ in range(workers)))
+    if engine.variant_pool is not None:
+        await engine.variant_pool.join()
+    return counts
+
+
+def _llm(args):
+    if args.fake_llm:
+        from benchmarks.fakeLLM import FakeChatModel
+
+        return FakeChatModel(latency_mean=args.fake_llm, latency_stddev=args.fake_llm / 4)
+    if args.openai_base_url or args.model:
+        from langchain_openai import ChatOpenAI
+
+        kwargs = {"model": args.model} if args.model else {}
+        return ChatOpenAI(temperature=0, base_url=args.openai_base_url, **kwargs)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="sessions, one JSON object per line")
+    parser.add_argument("output", help="results are appended here, one JSON object per session")
+    parser.add_argument("--workers", type=int, default=32, help="sessions running at once")
+    parser.add_argument("--rpm", type=float, help="model requests per minute for the whole batch")
+    parser.add_argument("--tpm", type=float, help="prompt + completion tokens per minute for the whole batch")
+    parser.add_argument("--redo-failed", action="store_true", help="run sessions that failed last time again")
+    parser.add_argument("--fused", action="store_true", help="fuse set_goal and boost_connection (see chatApp)")
+    parser.add_argument("--model", help="OpenAI model name")
+    parser.add_argument("--openai-base-url", help="send model requests here instead of api.openai.com")
+    parser.add_argument("--fake-llm", type=float, metavar="LATENCY",
+                        help="use benchmarks.fakeLLM with this mean latency instead of a real model (dry runs)")
+    args = parser.parse_args(argv)
+
+    # a pool and coalescer of its own, so a batch does not depend on what ran before it in this process
+    engine = get_engine().replace(llm_model=_llm(args), single_flight=SingleFlight(), variant_pool=VariantPool())
+    limiter = RateLimiter(args.rpm, args.tpm) if args.rpm or args.tpm else None
+    skip = finished_sessions(args.output, args.redo_failed)
+    started = time.perf_counter()
+    counts = asyncio.run(areplay(read_sessions(args.input), args.output, engine, args.workers, limiter, skip,
+                                 fuse_goal_and_boost=args.fused))
+    print(f"{counts['ran']} sessions in {time.perf_counter() - started:.1f}s, {counts['failed']} failed, "
+          f"{counts['skipped']} already done")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
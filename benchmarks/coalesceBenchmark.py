@@ -0,0 +1,107 @@
+"""
+Many concurrent MBTIBot sessions with and without request coalescing and the
+intro variant pool (requestCoalescing.py).
+
+--sessions conversations start at random times within --arrival-spread
+seconds, each a runBenchmark scenario with a random coach, sharing one
+response cache and the fake model. This runs twice:
+- off: the engine has no SingleFlight and no VariantPool;
+- on: both, fresh for the run.
+For each it reports the model requests sent (all of them and the intros), the
+time the intro took to show (p50 / p99), the coalescing ratio and the pool hit
+rate. Exits 1 when the run with both sends more requests than the one without.
+
+    python -m benchmarks.coalesceBenchmark --sessions 400 --latency 0.3
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from benchmarks.fakeLLM import FakeChatModel
+from benchmarks.runBenchmark import all_scenarios
+from chatApp import MBTIBot
+from instrumentation import Instrumentation
+from mbtiEngine import get_engine
+from requestCoalescing import SingleFlight, VariantPool
+from responseCache import ResponseCache
+
+
+async def run_session(answers, engine, start_delay):
+    await asyncio.sleep(start_delay)
+    script = iter(answers)
+
+    async def scripted_input(question):
+        await asyncio.sleep(0)
+        return next(script)
+
+    bot = MBTIBot(input_func=scripted_input, print_func=lambda text: None, engine=engine)
+    await bot.arun()
+    return [t["total_time"] for t in bot.generation_timings if t["prompt"] == "intro"]
+
+
+async def run_mode(coalescing, sessions, latency, arrival_spread, seed=0):
+    model = FakeChatModel(latency_mean=latency, latency_stddev=latency / 4)
+    calls = {}
+
+    def count(record):
+        key = (record["template"], record["cache"])
+        calls[key] = calls.get(key, 0) + 1
+
+    single_flight, variant_pool = (SingleFlight(), VariantPool()) if coalescing else (False, False)
+    engine = get_engine().replace(llm_model=model, response_cache=ResponseCache(), single_flight=single_flight,
+                                  variant_pool=variant_pool, instrumentation=Instrumentation([count]))
+    rng = random.Random(seed)
+    scenarios = list(all_scenarios())
+    runs = []
+    for _ in range(sessions):
+        answers = list(rng.choice(scenarios)[1])
+        answers[0] = rng.choice("1234")  # coach
+        runs.append(run_session(answers, engine, rng.uniform(0, arrival_spread)))
+    started = time.perf_counter()
+    intro_times = sorted(t for times in await asyncio.gather(*runs) for t in times)
+    pick = lambda q: intro_times[min(len(intro_times) - 1, int(q * len(intro_times)))] if intro_times else 0.0
+    # records that stand for a request sent to the model
+    intro_requests = sum(n for (template, cache), n in calls.items()
+                         if template == "intro" and cache not in ("hit", "coalesced", "pooled", "speculated"))
+    return {
+        "sessions": sessions,
+        "wall_time_s": time.perf_counter() - started,
+        "model_requests": model.counters["calls"],
+        "intro_requests": intro_requests,
+        "intros_shown": len(intro_times),
+        "intro_p50_s": pick(0.50),
+        "intro_p99_s": pick(0.99),
+        "single_flight": single_flight.stats() if single_flight else None,
+        "variant_pool": variant_pool.stats() if variant_pool else None,
+        "calls": {f"{template}/{cache}": n for (template, cache), n in sorted(calls.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=400)
+    parser.add_argument("--arrival-spread", type=float, default=10.0, help="seconds over which sessions start")
+    parser.add_argument("--latency", type=float, default=0.3, help="mean seconds before a reply")
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args(argv)
+
+    results = {mode: asyncio.run(run_mode(mode == "on", args.sessions, args.latency, args.arrival_spread))
+               for mode in ("off", "on")}
+    print(f"{'mode':<5} {'requests':>9} {'intro req':>10} {'intros':>7} {'intro p50':>10} {'intro p99':>10} "
+          f"{'coalesced':>10} {'pool hits':>10}")
+    for mode, r in results.items():
+        ratio = r["single_flight"]["coalescing_ratio"] if r["single_flight"] else 0.0
+        hit_rate = r["variant_pool"]["hit_rate"] if r["variant_pool"] else 0.0
+        print(f"{mode:<5} {r['model_requests']:>9} {r['intro_requests']:>10} {r['intros_shown']:>7} "
+              f"{r['intro_p50_s']:>10.3f} {r['intro_p99_s']:>10.3f} {ratio:>10.1%} {hit_rate:>10.1%}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0 if results["on"]["model_requests"] <= results["off"]["model_requests"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
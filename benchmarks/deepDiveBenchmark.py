@@ -0,0 +1,87 @@
+"""
+Prompt size per deep-dive turn, with the bounded conversation memory and with
+the whole history pasted in.
+
+One MBTIBot on the fake model asks --turns deep-dive questions in a row
+through the same calls adeep_dive() makes (it stops at four; this goes on to
+show the trend):
+- memory: conversationMemory.ConversationMemory with the deep_dive settings
+  from prompts.CONVERSATION_MEMORY, compacted between turns;
+- full: every earlier turn verbatim.
+For every turn it reports the deep_dive prompt tokens and the turn's time,
+and for the memory the summary calls made so far. Exits 1 when a memory prompt
+outgrows the first one by more than the memory budget.
+
+    python -m benchmarks.deepDiveBenchmark --turns 20
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from benchmarks.fakeLLM import FakeChatModel
+from chatApp import DEEP_DIVE_TOPICS, MBTIBot
+from conversationMemory import ConversationMemory
+from instrumentation import Instrumentation
+from prompts import CONVERSATION_MEMORY
+from responseCache import ResponseCache
+
+
+async def run_turns(turns, bounded, latency, tps):
+    records = []
+    bot = MBTIBot(input_func=lambda q: "", print_func=lambda text: None, response_cache=ResponseCache(),
+                  llm_model=FakeChatModel(latency_mean=latency, tokens_per_second=tps),
+                  instrumentation=Instrumentation([records.append]))
+    bot.state.coach = "2"
+    bot.user_mbti, bot.relationship_goal, bot.has_target = "INFP", "close friends", "yes"
+    bot.target_mbti, bot.target_hobbies = "ENTJ", "rock climbing"
+    bot.current_stage = "deep_dive"
+    config = CONVERSATION_MEMORY["deep_dive"]
+    memory = ConversationMemory(**config) if bounded else ConversationMemory(max_tokens=float("inf"),
+                                                                            keep_turns=turns)
+    rows = []
+    for turn in range(turns):
+        topic = DEEP_DIVE_TOPICS[turn % len(DEEP_DIVE_TOPICS)]
+        started = time.perf_counter()
+        reply = await bot._apredict("deep_dive", use_cache=False, persona_context=bot.persona_context,
+                                    mbti=bot.user_mbti, relationship_goal=bot.relationship_goal,
+                                    target=bot._deep_dive_target(), history=bot._memory_block(memory), topic=topic)
+        elapsed = time.perf_counter() - started
+        memory.add(topic, reply)
+        # adeep_dive() runs this while the user reads the reply, so it is not part of the turn's time
+        await memory.acompact(bot._asummarize)
+        rows.append({
+            "turn": turn + 1,
+            "prompt_tokens": [r for r in records if r["template"] == "deep_dive"][-1]["prompt_tokens"],
+            "history_tokens": memory.sizes[-1],
+            "summary_calls": sum(r["template"] == "memory_summary" for r in records),
+            "time_s": elapsed,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean seconds before a reply")
+    parser.add_argument("--tps", type=float, default=0.0, help="fake model tokens per second, 0 = instant")
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args(argv)
+
+    results = {mode: asyncio.run(run_turns(args.turns, mode == "memory", args.latency, args.tps))
+               for mode in ("memory", "full")}
+    print(f"{'turn':>4} {'memory prompt':>14} {'summaries':>10} {'time s':>7} {'full prompt':>12} {'time s':>7}")
+    for bounded, full in zip(results["memory"], results["full"]):
+        print(f"{bounded['turn']:>4} {bounded['prompt_tokens']:>14} {bounded['summary_calls']:>10} "
+              f"{bounded['time_s']:>7.3f} {full['prompt_tokens']:>12} {full['time_s']:>7.3f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    first = results["memory"][0]["prompt_tokens"]
+    limit = first + CONVERSATION_MEMORY["deep_dive"]["max_tokens"] * 1.25
+    return 0 if all(row["prompt_tokens"] <= limit for row in results["memory"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Deterministic stand-in for ChatOpenAI, used by the benchmarks.
+
+Latency before the first token and the token rate are drawn from normal
+distributions with a fixed seed. Replies are filler text capped at the call's
+max_tokens, except for the prompts whose replies MBTIBot parses: yes/no
+classification, MBTI axis tie-breaks, "TYPE : summary" guesses and the two
+sections of the fused goal/bonding reply. Each reply
+carries usage_metadata, and per-call counters are kept on the model.
+
+With prompt_cache_min_tokens set, it also acts like a provider prompt cache
+(OpenAI's: prompts from 1024 tokens on, matched in 128-token steps): the
+longest step-aligned prefix it has been sent before is reported as
+input_token_details.cache_read. Replies and timings are not affected.
+
+FaultyChatModel injects faults on top: a fraction of calls fail with a 503
+(after error_latency), a fraction stall for stall_seconds before answering,
+and `outage = True` fails every call until it is set back.
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Any
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+_WORDS = (
+    "you connect best when you share small honest moments try asking about their favourite memory "
+    "then suggest something you both enjoy and keep it light friendly and curious"
+).split()
+_AXIS = re.compile(r"better: (\w) \(.*?\) or (\w) \(")
+
+
+def count_tokens(text):
+    # close enough to tiktoken for English prose, and deterministic
+    return max(1, (len(text) + 3) // 4)
+
+
+class FakeChatModel(BaseChatModel):
+    latency_mean: float = 0.0        # seconds before the first token
+    latency_stddev: float = 0.0
+    tokens_per_second: float = 0.0   # 0 means the whole reply arrives at once
+    tokens_per_second_stddev: float = 0.0
+    default_max_tokens: int = 64
+    seed: int = 0
+    model_name: str = "fake-chat"
+    prompt_cache_min_tokens: int = 0      # 0 means no prompt cache
+    prompt_cache_block_tokens: int = 128
+
+    _rng: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default=None)
+    _counters: Any = PrivateAttr(default=None)
+    _prefixes: Any = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def reset(self):
+        """Zero the counters and restart the latency / token-rate sequence from the seed."""
+        with self._lock:
+            self._rng = random.Random(self.seed)
+            self._counters = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+            self._prefixes = set()
+
+    @property
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def _reply(self, prompt, max_tokens):
+        if "Only respond with **yes** or **no**" in prompt:
+            return "no"
+        axis = _AXIS.search(prompt)
+        if axis:
+            return axis.group(1)
+        if "MBTI_TYPE :" in prompt:
+            return "ENFP : ENFPs are warm, curious people who love new ideas and spontaneous plans."
+        n = max(1, min(max_tokens, 48))
+        start = len(prompt) % len(_WORDS)
+        filler = " ".join(_WORDS[(start + i) % len(_WORDS)] for i in range(n))
+        if "containing only [SUGGESTIONS]" in prompt:
+            # fused set_goal + boost_connection: two sections
+            return f"{filler}\n[SUGGESTIONS]\n{filler}"
+        return filler
+
+    def _cached_tokens(self, prompt):
+        """Tokens of the longest prefix of `prompt` sent before; remembers this prompt's prefixes. Holds _lock."""
+        if not self.prompt_cache_min_tokens:
+            return 0
+        cached = 0
+        # in characters, with count_tokens' four per token
+        for end in range(self.prompt_cache_min_tokens * 4, len(prompt) + 1, self.prompt_cache_block_tokens * 4):
+            prefix = hash(prompt[:end])
+            if prefix in self._prefixes:
+                cached = end // 4
+            else:
+                self._prefixes.add(prefix)
+        return cached
+
+    def _plan(self, messages, kwargs):
+        """Pick the reply and timings for one call and update the counters."""
+        prompt = "\n".join(str(m.content) for m in messages)
+        max_tokens = kwargs.get("max_tokens") or self.default_max_tokens
+        text = self._reply(prompt, max_tokens)
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(text)
+        with self._lock:
+            latency = max(0.0, self._rng.gauss(self.latency_mean, self.latency_stddev))
+            rate = 0.0
+            if self.tokens_per_second > 0:
+                rate = max(1.0, self._rng.gauss(self.tokens_per_second, self.tokens_per_second_stddev))
+            self._counters["calls"] += 1
+            self._counters["prompt_tokens"] += prompt_tokens
+            self._counters["completion_tokens"] += completion_tokens
+            cached_tokens = self._cached_tokens(prompt)
+            self._counters["cached_tokens"] += cached_tokens
+        per_token = 1.0 / rate if rate > 0 else 0.0
+        usage = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens,
+                 "input_token_details": {"cache_read": cached_tokens}}
+        return text, latency, per_token, usage
+
+    @staticmethod
+    def _chunks(text):
+        words = text.split(" ")
+        return [w + (" " if i < len(words) - 1 else "") for i, w in enumerate(words)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, latency, per_token, usage = self._plan(messages, kwargs)
+        time.sleep(latency + per_token * usage["output_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, latency, per_token, usage = self._plan(messages, kwargs)
+        await asyncio.sleep(latency + per_token * usage["output_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        text, latency, per_token, usage = self._plan(messages, kwargs)
+        time.sleep(latency)
+        chunks = self._chunks(text)
+        for i, chunk in enumerate(chunks):
+            time.sleep(per_token * count_tokens(chunk))
+            last = i == len(chunks) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk, usage_metadata=usage if last else None))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text, latency, per_token, usage = self._plan(messages, kwargs)
+        await asyncio.sleep(latency)
+        chunks = self._chunks(text)
+        for i, chunk in enumerate(chunks):
+            await asyncio.sleep(per_token * count_tokens(chunk))
+            last = i == len(chunks) - 1
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk, usage_metadata=usage if last else None))
+
+
+class FakeLLMError(Exception):
+    """What FaultyChatModel raises; carries a status code like the openai client's errors."""
+
+    def __init__(self, status_code=503):
+        super().__init__(f"fake upstream error {status_code}")
+        self.status_code = status_code
+
+
+class FaultyChatModel(FakeChatModel):
+    error_rate: float = 0.0       # fraction of calls failing with error_status
+    error_status: int = 503
+    error_latency: float = 0.05   # seconds before an error arrives
+    stall_rate: float = 0.0       # fraction of calls answering stall_seconds late
+    stall_seconds: float = 5.0
+    outage: bool = False          # every call fails while set
+    fault_seed: int = 1
+    model_name: str = "fake-chat-faulty"
+
+    _fault_rng: Any = PrivateAttr(default=None)
+
+    def reset(self):
+        super().reset()
+        with self._lock:
+            self._fault_rng = random.Random(self.fault_seed)
+            self._counters.update(errors=0, stalls=0)
+
+    def _fault(self):
+        """(extra delay, error to raise after it) for the next call."""
+        with self._lock:
+            roll = self._fault_rng.random()
+            if self.outage or roll < self.error_rate:
+                self._counters["errors"] += 1
+                return self.error_latency, FakeLLMError(self.error_status)
+            if roll < self.error_rate + self.stall_rate:
+                self._counters["stalls"] += 1
+                return self.stall_seconds, None
+        return 0.0, None
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, error = self._fault()
+        time.sleep(delay)
+        if error:
+            raise error
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, error = self._fault()
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return await super()._agenerate(messages, stop, run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, error = self._fault()
+        time.sleep(delay)
+        if error:
+            raise error
+        yield from super()._stream(messages, stop, run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        delay, error = self._fault()
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        async for chunk in super()._astream(messages, stop, run_manager, **kwargs):
+            yield chunk
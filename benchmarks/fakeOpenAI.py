@@ -0,0 +1,114 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load tests.
+
+Serves POST /v1/chat/completions (plain and streamed) with the replies, token
+counts and latency model of FakeChatModel, so the real ChatOpenAI / openai
+client code path is exercised without network access. GET /stats returns the
+call and token counters.
+
+    python -m benchmarks.fakeOpenAI --port 9000 --latency 0.3 --tps 50
+"""
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from benchmarks.fakeLLM import FakeChatModel
+from chatServer import read_request, write_response
+
+
+class FakeOpenAIServer:
+    def __init__(self, model):
+        self.model = model
+
+    async def start(self, host="127.0.0.1", port=9000):
+        self._server = await asyncio.start_server(self._handle_connection, host, port, backlog=1024)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, _, body = request
+                if method == "GET" and path == "/stats":
+                    write_response(writer, 200, self.model.counters)
+                elif method == "POST" and path.endswith("/chat/completions"):
+                    await self._completion(writer, json.loads(body))
+                else:
+                    write_response(writer, 404, {"error": {"message": "not found"}})
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _completion(self, writer, payload):
+        messages = [SimpleNamespace(content=m.get("content") or "") for m in payload.get("messages", [])]
+        max_tokens = payload.get("max_completion_tokens") or payload.get("max_tokens")
+        text, latency, per_token, usage = self.model._plan(messages, {"max_tokens": max_tokens})
+        model_name = payload.get("model", "fake-chat")
+        base = {"id": f"chatcmpl-fake-{time.monotonic_ns()}", "created": int(time.time()), "model": model_name}
+        openai_usage = {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"],
+                        "total_tokens": usage["total_tokens"]}
+
+        if not payload.get("stream"):
+            await asyncio.sleep(latency + per_token * usage["output_tokens"])
+            write_response(writer, 200, {
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": openai_usage,
+            })
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+        def event(data):
+            line = f"data: {data}\n\n".encode("utf-8")
+            writer.write(f"{len(line):x}\r\n".encode("latin-1") + line + b"\r\n")
+
+        def chunk(delta, finish_reason=None, **extra):
+            return json.dumps({**base, "object": "chat.completion.chunk", **extra,
+                               "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]})
+
+        await asyncio.sleep(latency)
+        event(chunk({"role": "assistant", "content": ""}))
+        for piece in FakeChatModel._chunks(text):
+            await asyncio.sleep(per_token * len(piece.split()))
+            event(chunk({"content": piece}))
+            await writer.drain()
+        event(chunk({}, "stop"))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            event(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": openai_usage}))
+        event("[DONE]")
+        writer.write(b"0\r\n\r\n")
+
+
+async def serve(args):
+    model = FakeChatModel(latency_mean=args.latency, latency_stddev=args.latency_stddev,
+                          tokens_per_second=args.tps, tokens_per_second_stddev=args.tps_stddev, seed=args.seed)
+    port = await FakeOpenAIServer(model).start(args.host, args.port)
+    print(f"listening on {args.host}:{port}", flush=True)
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000, help="0 picks a free port")
+    parser.add_argument("--latency", type=float, default=0.3, help="mean seconds before the first token")
+    parser.add_argument("--latency-stddev", type=float, default=0.1)
+    parser.add_argument("--tps", type=float, default=50.0, help="mean tokens per second (0 = instant)")
+    parser.add_argument("--tps-stddev", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
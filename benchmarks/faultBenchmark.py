@@ -0,0 +1,114 @@
+"""
+MBTIBot conversations against a fault-injecting model, with and without resilience.py.
+
+Every runBenchmark scenario is run --repeat times, the conversations starting
+at random times within --arrival-spread seconds, against FaultyChatModel: --error-rate of the calls fail with a 503 and
+--stall-rate of them answer --stall-seconds late. This runs in three modes:
+- off: the engine has no resilience layer;
+- on: deadlines, retries with jitter and hedging after the --hedge-quantile
+  latency;
+- outage: on, but every call fails, so the breaker opens and the
+  conversations finish on canned replies.
+For each mode it reports conversations completed and failed, the p50 / p99 /
+max conversation time and the resilience counters. The behaviour itself
+(retries, canned replies, the breaker, hedging) is asserted in
+tests/test_resilience.py; this measures what it costs and saves.
+
+    python -m benchmarks.faultBenchmark --error-rate 0.05 --stall-rate 0.03
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from benchmarks.fakeLLM import FaultyChatModel
+from benchmarks.runBenchmark import all_scenarios
+from chatApp import MBTIBot
+from mbtiEngine import get_engine
+from resilience import Resilience
+from responseCache import ResponseCache
+
+
+async def run_conversation(name, answers, engine, start_delay=0.0):
+    await asyncio.sleep(start_delay)
+    script = iter(answers)
+
+    async def scripted_input(question):
+        await asyncio.sleep(0)
+        # a degraded reply can change the questions that follow; "no" ends every loop
+        return next(script, "no")
+
+    bot = MBTIBot(input_func=scripted_input, print_func=lambda text: None, engine=engine)
+    started = time.perf_counter()
+    try:
+        await bot.arun()
+    except Exception as e:
+        return {"scenario": name, "ok": False, "error": type(e).__name__, "time": time.perf_counter() - started}
+    return {"scenario": name, "ok": True, "time": time.perf_counter() - started}
+
+
+async def run_mode(resilience, model, repeat, arrival_spread=0.0, seed=0):
+    engine = get_engine().replace(llm_model=model, response_cache=ResponseCache(), resilience=resilience)
+    model.reset()
+    rng = random.Random(seed)
+    conversations = [run_conversation(name, answers, engine, rng.uniform(0, arrival_spread))
+                     for _ in range(repeat) for name, answers in all_scenarios()]
+    started = time.perf_counter()
+    results = await asyncio.gather(*conversations)
+    wall_time = time.perf_counter() - started
+    times = sorted(r["time"] for r in results if r["ok"])
+    pick = lambda q: times[min(len(times) - 1, int(q * len(times)))] if times else 0.0
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    return {
+        "conversations": len(results),
+        "completed": len(times),
+        "failed": len(results) - len(times),
+        "errors": errors,
+        "p50_s": pick(0.50), "p99_s": pick(0.99), "max_s": times[-1] if times else 0.0,
+        "wall_time_s": wall_time,
+        "model": model.counters,
+        "resilience": resilience.stats() if resilience else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=4, help="runs of every scenario")
+    parser.add_argument("--arrival-spread", type=float, default=5.0, help="seconds over which conversations start")
+    parser.add_argument("--latency", type=float, default=0.2, help="mean seconds before a reply")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--stall-rate", type=float, default=0.03)
+    parser.add_argument("--stall-seconds", type=float, default=5.0)
+    parser.add_argument("--hedge-quantile", type=float, default=0.95)
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args(argv)
+
+    def model(**faults):
+        return FaultyChatModel(latency_mean=args.latency, latency_stddev=args.latency / 4,
+                               error_rate=args.error_rate, stall_rate=args.stall_rate,
+                               stall_seconds=args.stall_seconds, **faults)
+
+    results = {
+        "off": asyncio.run(run_mode(False, model(), args.repeat, args.arrival_spread)),
+        "on": asyncio.run(run_mode(Resilience(hedge_quantile=args.hedge_quantile), model(), args.repeat, args.arrival_spread)),
+        "outage": asyncio.run(run_mode(Resilience(), model(outage=True), args.repeat, args.arrival_spread)),
+    }
+    print(f"{'mode':<8} {'done':>5} {'failed':>6} {'p50 s':>7} {'p99 s':>7} {'max s':>7}  resilience events")
+    for mode, r in results.items():
+        events = r["resilience"]["events"] if r["resilience"] else {}
+        print(f"{mode:<8} {r['completed']:>5} {r['failed']:>6} {r['p50_s']:>7.2f} {r['p99_s']:>7.2f} "
+              f"{r['max_s']:>7.2f}  {json.dumps(events, sort_keys=True)}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    # with the layer on, no conversation may fail, even during the outage
+    return 0 if results["on"]["failed"] == 0 and results["outage"]["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
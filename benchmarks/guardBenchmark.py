@@ -0,0 +1,99 @@
+"""
+Scan throughput of inputGuard.InputGuard with a large blocklist.
+
+The phrases of input_blocklist.json are padded with random 2-4 word phrases
+up to --patterns, then long inputs of ordinary text (a mix of English,
+accented, Cyrillic and Chinese words, none of them blocked) are scanned by:
+- normalize: normalize() alone;
+- guard: InputGuard.scan(), normalize() plus the compiled trie regex;
+- naive: normalize() plus `phrase in text` for every phrase, the old loop.
+It reports MB/s and checks that a phrase hidden at the end of each input is
+found by both. Exits 1 when the guard is not faster than the naive loop.
+
+    python -m benchmarks.guardBenchmark --patterns 10000 --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from inputGuard import BLOCKLIST_PATH, InputGuard, normalize
+
+_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+_FILLER = ("i really like hiking and reading with my friends on the weekend , "
+           "we talk about music, films & café culture . спасибо друзья 我喜欢和朋友一起看电影 ").split(" ")
+
+
+def synthetic_phrases(count, rng):
+    words = ["".join(rng.choice(_LETTERS) for _ in range(rng.randint(3, 9))) for _ in range(count // 2 + 100)]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(2, 4))) for _ in range(count)]
+
+
+def long_text(size, rng):
+    words, length = [], 0
+    while length < size:
+        word = rng.choice(_FILLER)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def throughput(func, text, min_time=0.5):
+    runs, started = 0, time.perf_counter()
+    while True:
+        func(text)
+        runs += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return runs * len(text.encode("utf-8")) / elapsed / 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patterns", type=int, default=10000, help="blocklist size, padded with random phrases")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="input lengths")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    with open(BLOCKLIST_PATH, encoding="utf-8") as f:
+        phrases = [phrase for group in json.load(f).values() for phrase in group]
+    phrases += synthetic_phrases(max(0, args.patterns - len(phrases)), rng)
+    started = time.perf_counter()
+    guard = InputGuard(phrases)
+    compile_s = time.perf_counter() - started
+    keys = list(guard.phrases)
+
+    def naive(text):
+        text = normalize(text)
+        return next((key for key in keys if key in text), None)
+
+    print(f"{len(guard.phrases)} phrases compiled in {compile_s * 1000:.0f} ms")
+    print(f"{'input':>9} {'normalize MB/s':>15} {'guard MB/s':>11} {'naive MB/s':>11} {'speedup':>8}")
+    results = {"patterns": len(guard.phrases), "compile_s": compile_s, "sizes": {}}
+    ok = True
+    for size in args.sizes:
+        clean = long_text(size, rng)
+        assert guard.scan(clean) is None, guard.scan(clean)
+        hidden = clean + " ｐｌｅａｓｅ іgn0re   prev1ous"
+        assert guard.scan(hidden) == "ignore previous" and naive(hidden) is not None
+        row = {
+            "normalize_mb_s": throughput(normalize, clean),
+            "guard_mb_s": throughput(guard.scan, clean),
+            "naive_mb_s": throughput(naive, clean),
+        }
+        row["speedup"] = row["guard_mb_s"] / row["naive_mb_s"]
+        ok = ok and row["speedup"] > 1
+        results["sizes"][size] = row
+        print(f"{size:>9} {row['normalize_mb_s']:>15.1f} {row['guard_mb_s']:>11.1f} {row['naive_mb_s']:>11.2f} "
+              f"{row['speedup']:>7.0f}x")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
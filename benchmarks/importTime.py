@@ -0,0 +1,59 @@
+"""
+Cold-start check for `import chatApp`.
+
+Each sample imports the module in a fresh interpreter and reports the import
+time, plus any heavy dependency (LangChain, OpenAI, httpx) that got imported
+eagerly. Exits 1 when the median import time is over --budget or a heavy
+module was imported.
+
+    python -m benchmarks.importTime
+    python -m benchmarks.importTime --budget 0.15 --prewarm
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_openai", "openai", "httpx", "tiktoken")
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import chatApp
+imported = time.perf_counter() - started
+result = {"import": imported,
+          "heavy": sorted({m.split(".")[0] for m in sys.modules} & set(%r))}
+if %r:
+    # builds the real ChatOpenAI client and all chains; no request is sent
+    result["prewarm"] = chatApp.prewarm()
+print(json.dumps(result))
+"""
+
+
+def sample(prewarm=False):
+    out = subprocess.run([sys.executable, "-c", _PROBE % (HEAVY_MODULES, prewarm)],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=0.2, help="max median seconds for `import chatApp`")
+    parser.add_argument("--prewarm", action="store_true", help="also time chatApp.prewarm()")
+    args = parser.parse_args(argv)
+
+    samples = [sample(args.prewarm) for _ in range(args.runs)]
+    median = statistics.median(s["import"] for s in samples)
+    print(f"import chatApp: median {median * 1000:.1f} ms over {args.runs} runs (budget {args.budget * 1000:.0f} ms)")
+    if args.prewarm:
+        print(f"prewarm: median {statistics.median(s['prewarm'] for s in samples) * 1000:.1f} ms")
+    heavy = sorted({m for s in samples for m in s["heavy"]})
+    if heavy:
+        print("imported eagerly:", ", ".join(heavy))
+    return 1 if median > args.budget or heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
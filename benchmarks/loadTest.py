@@ -0,0 +1,224 @@
+"""
+Load test for chatServer.py against the local OpenAI stand-in (fakeOpenAI.py).
+
+For each session count it starts a fresh fake OpenAI API and a fresh chat
+server, then runs that many scripted conversations at once (the scenarios from
+runBenchmark.py, with a random think time before every answer). A turn is one
+request to the server: starting the session or sending a reply, until the
+next question comes back. 503 answers are retried with exponential backoff
+starting at Retry-After, and counted.
+
+    python -m benchmarks.loadTest --sessions 100,1000,10000
+    python -m benchmarks.loadTest --sessions 100 --server-url http://127.0.0.1:8080
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+from benchmarks.runBenchmark import all_scenarios
+
+
+class HttpPool:
+    """A fixed pool of keep-alive HTTP/1.1 connections to one host."""
+
+    def __init__(self, url, size=256):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(None)
+
+    async def request(self, method, path, payload=None):
+        conn = await self._idle.get()
+        body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        request = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                   f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body
+        try:
+            status_line = b""
+            if conn is not None:
+                try:
+                    conn[1].write(request)
+                    await conn[1].drain()
+                    status_line = await conn[0].readline()
+                except ConnectionError:
+                    pass
+                if not status_line:
+                    # the server closed the idle keep-alive connection, reconnect
+                    conn[1].close()
+            if not status_line:
+                conn = await asyncio.open_connection(self.host, self.port)
+                conn[1].write(request)
+                await conn[1].drain()
+                status_line = await conn[0].readline()
+            reader, writer = conn
+            status = int(status_line.split()[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            data = await reader.readexactly(int(headers.get("content-length") or 0))
+            if headers.get("connection", "").lower() == "close":
+                writer.close()
+                conn = None
+        except BaseException:
+            if conn is not None:
+                conn[1].close()
+            conn = None
+            raise
+        finally:
+            self._idle.put_nowait(conn)
+        return status, headers, json.loads(data) if data else None
+
+    async def close(self):
+        while not self._idle.empty():
+            conn = self._idle.get_nowait()
+            if conn is not None:
+                conn[1].close()
+
+
+class Stats:
+    def __init__(self):
+        self.turn_latencies = []
+        self.rejections = 0
+        self.completed = 0
+        self.failed = 0
+
+
+async def _turn(pool, stats, method, path, payload=None):
+    for attempt in itertools.count():
+        started = time.perf_counter()
+        status, headers, data = await pool.request(method, path, payload)
+        if status != 503:
+            stats.turn_latencies.append(time.perf_counter() - started)
+            return status, data
+        stats.rejections += 1
+        delay = min(30.0, float(headers.get("retry-after", 1)) * 2 ** attempt)
+        await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+
+async def run_session(pool, stats, answers, think_time, rng):
+    status, data = await _turn(pool, stats, "POST", "/sessions")
+    if status != 201:
+        stats.failed += 1
+        return
+    session_id = data["session_id"]
+    script = iter(answers)
+    while not data["done"]:
+        answer = next(script, None)
+        if answer is None:
+            # the scenario ran out of answers: the server behaved unexpectedly
+            await pool.request("DELETE", f"/sessions/{session_id}")
+            stats.failed += 1
+            return
+        await asyncio.sleep(rng.expovariate(1 / think_time) if think_time > 0 else 0)
+        status, data = await _turn(pool, stats, "POST", f"/sessions/{session_id}/reply", {"text": answer})
+        if status != 200:
+            stats.failed += 1
+            return
+    stats.completed += 1
+
+
+async def run_level(server_url, sessions, think_time, connections, ramp, seed):
+    # like real clients, every session gets its own keep-alive connection by default
+    pool = HttpPool(server_url, connections or sessions)
+    stats = Stats()
+    rng = random.Random(seed)
+    scenarios = itertools.cycle([answers for _, answers in all_scenarios()])
+
+    async def delayed(answers, delay):
+        await asyncio.sleep(delay)
+        await run_session(pool, stats, answers, think_time, rng)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(delayed(next(scenarios), ramp * i / sessions) for i in range(sessions)))
+    wall_time = time.perf_counter() - started
+    _, _, health = await pool.request("GET", "/healthz")
+    await pool.close()
+
+    latencies = sorted(stats.turn_latencies)
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+    return {
+        "sessions": sessions,
+        "completed": stats.completed,
+        "failed": stats.failed,
+        "rejections": stats.rejections,
+        "turns": len(latencies),
+        "wall_time": wall_time,
+        "turns_per_second": len(latencies) / wall_time if wall_time else 0.0,
+        "p50": pick(0.50),
+        "p99": pick(0.99),
+        "max": latencies[-1] if latencies else 0.0,
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "server": health,
+    }
+
+
+def _spawn(args):
+    """Start a module in a subprocess and return (process, port) once it prints its address."""
+    proc = subprocess.Popen([sys.executable, *args], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    line = proc.stdout.readline()
+    if not line.startswith("listening on"):
+        proc.kill()
+        raise RuntimeError(f"{args} did not start")
+    return proc, int(line.rsplit(":", 1)[1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default="100,1000,10000", help="comma-separated concurrent session counts")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean seconds before each answer")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which sessions are started")
+    parser.add_argument("--connections", type=int, default=0,
+                        help="HTTP connections from the load generator (default: one per session)")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake API: mean seconds to first token")
+    parser.add_argument("--tps", type=float, default=50.0, help="fake API: tokens per second")
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--max-waiting", type=int, default=128)
+    parser.add_argument("--server-url", help="use a running chat server instead of starting one per level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args(argv)
+
+    results = []
+    for sessions in [int(n) for n in args.sessions.split(",")]:
+        procs = []
+        try:
+            server_url = args.server_url
+            if not server_url:
+                fake, fake_port = _spawn(["-m", "benchmarks.fakeOpenAI", "--port", "0", "--latency", str(args.latency),
+                                          "--tps", str(args.tps), "--seed", str(args.seed)])
+                procs.append(fake)
+                server, port = _spawn(["chatServer.py", "--port", "0", "--openai-base-url",
+                                       f"http://127.0.0.1:{fake_port}/v1", "--max-sessions", str(sessions * 2),
+                                       "--max-in-flight", str(args.max_in_flight),
+                                       "--max-waiting", str(args.max_waiting)])
+                procs.append(server)
+                server_url = f"http://127.0.0.1:{port}"
+            result = asyncio.run(run_level(server_url, sessions, args.think_time, args.connections,
+                                           args.ramp, args.seed))
+        finally:
+            for proc in reversed(procs):
+                proc.terminate()
+                proc.wait()
+        results.append(result)
+        print(f"{sessions:>6} sessions: p50 {result['p50'] * 1000:8.1f} ms  p99 {result['p99'] * 1000:8.1f} ms  "
+              f"{result['turns_per_second']:7.1f} turns/s  completed {result['completed']}  "
+              f"failed {result['failed']}  503s {result['rejections']}", flush=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "levels": results}, f, indent=2)
+    return 0 if all(r["failed"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
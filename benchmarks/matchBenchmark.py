@@ -0,0 +1,131 @@
+"""
+Benchmark of matchIndex.MatchIndex on synthetic users.
+
+Generates N users with a random MBTI type, relationship goal and 1-5 hobbies
+from a fixed vocabulary, bulk-loads them, then measures:
+- top-k query latency (p50 / p99 / max) for random query profiles;
+- incremental upserts per second;
+- save and memory-mapped load times;
+- query latency right after load, with pages not yet in memory.
+Exits 1 when the p99 query latency is over --budget-ms.
+
+    python -m benchmarks.matchBenchmark --users 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from matchIndex import GOALS, HOBBY_BITS, MatchIndex, encode_hobbies
+from compatibilityStore import TYPES
+
+HOBBIES = [
+    "hiking", "chess", "coding", "reading", "board games", "rock climbing", "cooking", "baking", "yoga",
+    "photography", "painting", "music", "guitar", "piano", "singing", "dancing", "running", "cycling",
+    "swimming", "tennis", "football", "basketball", "video games", "anime", "movies", "theatre", "travel",
+    "camping", "fishing", "gardening", "volunteering", "writing", "poetry", "journaling", "podcasts",
+    "startups", "investing", "knitting", "pottery", "surfing", "skiing", "martial arts", "meditation",
+    "astronomy", "history", "philosophy", "languages", "coffee", "wine tasting", "karaoke",
+]
+
+
+def synthetic_users(n, seed=0):
+    """Ids, type indexes, goal indexes and encoded hobbies for n users, plus the hobby texts used."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.stack([encode_hobbies(h) for h in HOBBIES])
+    mbti = rng.integers(0, len(TYPES), n).astype(np.uint8)
+    goals = rng.integers(0, len(GOALS), n).astype(np.uint8)
+    words = np.zeros((n, HOBBY_BITS // 64), dtype=np.uint64)
+    counts = rng.integers(1, 6, n)
+    for slot in range(5):
+        picks = rng.integers(0, len(HOBBIES), n)
+        words |= np.where((counts > slot)[:, None], vocabulary[picks], np.uint64(0))
+    ids = [f"user-{i}" for i in range(n)]
+    return ids, mbti, goals, words
+
+
+def random_queries(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return [(TYPES[rng.integers(len(TYPES))], GOALS[rng.integers(len(GOALS))],
+             ", ".join(rng.choice(HOBBIES, rng.integers(1, 6), replace=False)))
+            for _ in range(n)]
+
+
+def time_queries(index, queries, k):
+    latencies = []
+    for mbti, goal, hobbies in queries:
+        started = time.perf_counter()
+        index.top_k(mbti, goal, hobbies, k)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    return {"p50_ms": pick(0.50), "p99_ms": pick(0.99), "max_ms": latencies[-1] * 1000}
+
+
+def run(users, queries, k, seed):
+    result = {"users": users, "k": k}
+    started = time.perf_counter()
+    data = synthetic_users(users, seed)
+    result["generate_s"] = time.perf_counter() - started
+
+    index = MatchIndex()
+    started = time.perf_counter()
+    index.insert_many(*data)
+    result["bulk_insert_s"] = time.perf_counter() - started
+
+    query_set = random_queries(queries, seed + 1)
+    time_queries(index, query_set[:50], k)  # warm up
+    result["query"] = time_queries(index, query_set, k)
+
+    upserts = random_queries(10000, seed + 2)
+    started = time.perf_counter()
+    for i, (mbti, goal, hobbies) in enumerate(upserts):
+        # half new users, half updates of existing ones
+        index.upsert(f"user-{i * 2 if i % 2 else users + i}", mbti, goal, hobbies)
+    result["upserts_per_s"] = len(upserts) / (time.perf_counter() - started)
+    result["query_after_upserts"] = time_queries(index, query_set, k)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "matches")
+        started = time.perf_counter()
+        index.save(path)
+        result["save_s"] = time.perf_counter() - started
+        started = time.perf_counter()
+        loaded = MatchIndex.load(path)
+        result["load_s"] = time.perf_counter() - started
+        result["query_after_load"] = time_queries(loaded, query_set, k)
+        assert len(loaded) == len(index)
+        del loaded
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--budget-ms", type=float, default=10.0, help="p99 query latency budget")
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args(argv)
+
+    result = run(args.users, args.queries, args.k, args.seed)
+    q = result["query"]
+    print(f"{args.users} users: generated in {result['generate_s']:.1f}s, bulk insert {result['bulk_insert_s']:.2f}s")
+    for label, key in (("top-k", "query"), ("after upserts", "query_after_upserts"),
+                       ("after load", "query_after_load")):
+        q = result[key]
+        print(f"  {label:<14} p50 {q['p50_ms']:6.2f} ms  p99 {q['p99_ms']:6.2f} ms  max {q['max_ms']:6.2f} ms")
+    print(f"  upserts {result['upserts_per_s']:.0f}/s, save {result['save_s']:.2f}s, load {result['load_s']:.2f}s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return 0 if result["query"]["p99_ms"] <= args.budget_ms else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
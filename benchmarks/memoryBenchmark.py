@@ -0,0 +1,77 @@
+"""
+Memory per idle session.
+
+Starts N conversations through chatServer.SessionManager on the fake model and
+drives each one to the same point: MBTI learned through the four questions,
+waiting for the user to answer the first set_goal question. The traced
+allocation growth divided by N is the cost of one idle session, including its
+asyncio task and suspended coroutine frames.
+
+    python -m benchmarks.memoryBenchmark --sessions 2000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import tracemalloc
+
+from benchmarks.fakeLLM import FakeChatModel
+from chatServer import LLMLimiter, SessionManager
+from responseCache import ResponseCache
+
+# coach, "don't know my MBTI", four answers and hobbies; the session then waits in set_goal
+ANSWERS = ["2", "no", "I like occasional gatherings, but mostly I enjoy quiet time alone",
+           "Logic, usually", "I plan ahead", "The big picture", "chess, coding"]
+
+
+async def open_sessions(manager, n):
+    sessions = []
+    for _ in range(n):
+        session, _ = await manager.create()
+        for answer in ANSWERS:
+            await session.send(answer)
+        sessions.append(session)
+    return sessions
+
+
+async def measure(n):
+    manager = SessionManager(LLMLimiter(64, 1 << 30), max_active_turns=1 << 30,
+                             llm_model=FakeChatModel(), response_cache=ResponseCache(max_entries=0))
+    # warm up: build chains, load profiles, fill module-level caches
+    warm = await open_sessions(manager, 2)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = await open_sessions(manager, n)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    assert all(s.state == "waiting" for s in sessions)
+    top = [(str(stat.traceback[0]), stat.size // n) for stat in snapshot.statistics("lineno")[:10]]
+    for session in warm + sessions:
+        session.close()
+    await asyncio.sleep(0)
+    return {"sessions": n, "bytes_per_session": (after - before) / n, "top_allocations": top}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--top", action="store_true", help="show the biggest allocation sites per session")
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args(argv)
+    result = asyncio.run(measure(args.sessions))
+    print(f"{result['sessions']} idle sessions: {result['bytes_per_session']:.0f} bytes per session")
+    if args.top:
+        for where, size in result["top_allocations"]:
+            print(f"  {size:>7} B  {where}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Prompt prefix reuse and provider-side cached tokens per stage.
+
+--sessions runBenchmark scenarios with random coaches run one after another
+on the fake model, which here acts like a provider prompt cache (see
+fakeLLM.py): a prompt prefix of at least --min-tokens it has been sent before
+is reported as cached, in --block-tokens steps. instrumentation.PrefixStats
+collects the records. For every stage it reports the requests, the distinct
+prefixes (persona, instructions and examples, see promptLayout.py), how many
+requests repeated a prefix already sent, and the prompt tokens the provider
+served from its cache.
+
+OpenAI only caches prompts from 1024 tokens on, which none of these prompts
+reach yet; the default --min-tokens is lower to show which stages would
+benefit once the personas or example budgets grow. Exits 1 when a request was
+sent without a recognisable prefix (its template does not follow the layout).
+
+    python -m benchmarks.prefixBenchmark --sessions 200 --min-tokens 128
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+
+from benchmarks.fakeLLM import FakeChatModel
+from benchmarks.runBenchmark import all_scenarios
+from chatApp import MBTIBot
+from instrumentation import Instrumentation, PrefixStats
+from mbtiEngine import get_engine
+from requestCoalescing import SingleFlight, VariantPool
+from responseCache import ResponseCache
+
+
+async def run_sessions(sessions, min_tokens, block_tokens, seed=0):
+    model = FakeChatModel(prompt_cache_min_tokens=min_tokens, prompt_cache_block_tokens=block_tokens)
+    stats = PrefixStats()
+    missing = []
+
+    def check(record):
+        if record["prompt_tokens"] and not record.get("prefix_hash"):
+            missing.append(record["template"])
+
+    engine = get_engine().replace(llm_model=model, response_cache=ResponseCache(), single_flight=SingleFlight(),
+                                  variant_pool=VariantPool(), instrumentation=Instrumentation([stats, check]))
+    rng = random.Random(seed)
+    scenarios = list(all_scenarios())
+    for _ in range(sessions):
+        answers = list(rng.choice(scenarios)[1])
+        answers[0] = rng.choice("1234")  # coach
+        script = iter(answers)
+
+        async def scripted_input(question):
+            await asyncio.sleep(0)
+            return next(script)
+
+        await MBTIBot(input_func=scripted_input, print_func=lambda text: None, engine=engine).arun()
+    await asyncio.sleep(0)
+    return stats.stats(), model.counters, sorted(set(missing))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--min-tokens", type=int, default=128, help="shortest prompt prefix the provider caches")
+    parser.add_argument("--block-tokens", type=int, default=64, help="cache granularity in tokens")
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args(argv)
+
+    stages, totals, missing = asyncio.run(run_sessions(args.sessions, args.min_tokens, args.block_tokens))
+    print(f"{'stage':<16} {'requests':>9} {'prefixes':>9} {'repeats':>8} {'prefix tok':>11} {'prompt tok':>11} "
+          f"{'cached tok':>11} {'cached':>7}")
+    for stage, s in stages.items():
+        print(f"{stage:<16} {s['requests']:>9} {s['prefixes']:>9} {s['repeat_rate']:>8.1%} "
+              f"{s['prefix_tokens']:>11} {s['prompt_tokens']:>11} {s['cached_tokens']:>11} {s['cached_share']:>7.1%}")
+    share = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+    print(f"{'total':<16} {totals['calls']:>9} {'':>9} {'':>8} {'':>11} {totals['prompt_tokens']:>11} "
+          f"{totals['cached_tokens']:>11} {share:>7.1%}")
+    if missing:
+        print("requests without a layout prefix:", ", ".join(missing))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"stages": stages, "totals": totals, "missing": missing}, f, indent=2)
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+End-to-end benchmark of MBTIBot.run() against the fake chat model.
+
+Scripted users drive every branch of the conversation:
+- knows / doesn't know their MBTI
+- no target, target with a known MBTI, target described so the bot guesses,
+  target declined
+- 0-4 deep-dive turns
+
+For each scenario and each stage it reports wall time, LLM call count and
+prompt/completion tokens, plus the scenario's peak traced allocation. Every
+scenario runs on a fresh engine (response cache, request coalescer and intro
+variant pool), so its numbers do not depend on what ran before. Results are
+written as JSON. --check compares the call and token counts with a stored
+baseline and exits 1 on regressions. --compare-fused runs every scenario again
+with set_goal and boost_connection fused into one request and compares the two.
+
+Run it from the repository root:
+    python -m benchmarks.runBenchmark --output bench.json
+    python -m benchmarks.runBenchmark --latency 0 --tps 0 --check benchmarks/baseline.json
+    python -m benchmarks.runBenchmark --latency 0.5 --tps 50 --no-alloc --compare-fused
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fakeLLM import FakeChatModel
+from chatApp import DEEP_DIVE_TOPICS, MBTIBot
+from mbtiEngine import get_engine
+from requestCoalescing import SingleFlight, VariantPool
+from responseCache import ResponseCache
+
+STAGES = ["select_coach", "learn_mbti", "set_goal", "boost_connection", "deep_dive"]
+TARGETS = ["none", "known", "described", "declined"]
+DEEP_DIVE_TURNS = [0, 1, 2, 4]
+
+
+def build_answers(knows_mbti, target, deep_turns):
+    answers = ["2"]
+    if knows_mbti:
+        answers += ["yes", "INFP", "reading, hiking"]
+    else:
+        answers += ["no", "I like occasional gatherings, but mostly I enjoy quiet time alone",
+                    "Logic, usually", "I plan ahead", "The big picture", "chess, coding"]
+    if target == "none":
+        answers += ["no", "close friends"]
+    elif target == "known":
+        answers += ["yes", "ENTJ", "rock climbing", "romantic"]
+    elif target == "described":
+        answers += ["yes", "not sure", "still not sure", "yes", "very outgoing, loves planning",
+                    "board games", "friend"]
+    elif target == "declined":
+        answers += ["yes", "no idea", "no idea", "no", "a mentor"]
+    for turn in range(deep_turns):
+        answers += ["yes", DEEP_DIVE_TOPICS[turn % len(DEEP_DIVE_TOPICS)]]
+    if deep_turns < 4:
+        answers.append("no")
+    return answers
+
+
+def all_scenarios():
+    for knows_mbti in (True, False):
+        for target in TARGETS:
+            for deep_turns in DEEP_DIVE_TURNS:
+                name = f"{'knows' if knows_mbti else 'quiz'}-{target}-deep{deep_turns}"
+                yield name, build_answers(knows_mbti, target, deep_turns)
+
+
+async def run_scenario(name, answers, model, think_time=0.0, **bot_kwargs):
+    script = iter(answers)
+
+    async def scripted_input(question):
+        # always yield to the loop, like a real user would, so background work can progress
+        await asyncio.sleep(think_time)
+        try:
+            return next(script)
+        except StopIteration:
+            raise RuntimeError(f"scenario {name!r} ran out of answers at: {question!r}") from None
+
+    model.reset()
+    stages = {}
+
+    def timed(stage, method):
+        async def wrapper():
+            before = model.counters
+            started = time.perf_counter()
+            result = await method()
+            after = model.counters
+            stages[stage] = {
+                "wall_time": time.perf_counter() - started,
+                "llm_calls": after["calls"] - before["calls"],
+                "prompt_tokens": after["prompt_tokens"] - before["prompt_tokens"],
+                "completion_tokens": after["completion_tokens"] - before["completion_tokens"],
+            }
+            return result
+        return wrapper
+
+    # MBTIBot has __slots__, so the stages are wrapped on a throwaway subclass
+    def timed_stage(stage):
+        stage_method = getattr(MBTIBot, f"a{stage}")
+        return lambda self: timed(stage, lambda: stage_method(self))()
+
+    TimedBot = type("TimedBot", (MBTIBot,), {"__slots__": (), **{f"a{stage}": timed_stage(stage) for stage in STAGES}})
+    # a cold engine of its own, so the counts depend neither on the scenarios run before nor on --no-alloc
+    engine = get_engine().replace(llm_model=model, response_cache=ResponseCache(), single_flight=SingleFlight(),
+                                  variant_pool=VariantPool())
+    bot = TimedBot(input_func=scripted_input, print_func=lambda text: None, engine=engine, **bot_kwargs)
+
+    started = time.perf_counter()
+    await bot.arun()
+    wall_time = time.perf_counter() - started
+    # the intro variants the pool generates in the background are model calls of this scenario too
+    if bot.engine.variant_pool is not None:
+        await bot.engine.variant_pool.join()
+    # let cancelled speculative calls settle before reading the totals
+    await asyncio.sleep(0)
+    totals = model.counters
+    return {
+        "wall_time": wall_time,
+        "llm_calls": totals["calls"],
+        "prompt_tokens": totals["prompt_tokens"],
+        "completion_tokens": totals["completion_tokens"],
+        "stages": stages,
+    }
+
+
+def measure_allocations(name, answers, **bot_kwargs):
+    """Peak traced memory of one scenario, on a zero-latency model so the numbers are stable."""
+    model = FakeChatModel()
+    tracemalloc.start()
+    try:
+        asyncio.run(run_scenario(name, answers, model, **bot_kwargs))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_all(model_config, think_time=0.0, allocations=True, only=None, **bot_kwargs):
+    model = FakeChatModel(**model_config)
+    results = {}
+    for name, answers in all_scenarios():
+        if only and only not in name:
+            continue
+        result = asyncio.run(run_scenario(name, answers, model, think_time, **bot_kwargs))
+        if allocations:
+            result["alloc_peak_bytes"] = measure_allocations(name, answers, **bot_kwargs)
+        results[name] = result
+    return {
+        "config": {"model": model_config, "think_time": think_time},
+        "totals": {
+            key: sum(r[key] for r in results.values())
+            for key in ("wall_time", "llm_calls", "prompt_tokens", "completion_tokens")
+        },
+        "scenarios": results,
+    }
+
+
+def check_against(results, baseline, token_tolerance=0.02):
+    """Return a list of regressions in call counts or prompt size compared with `baseline`."""
+    problems = []
+    for name, base in baseline["scenarios"].items():
+        current = results["scenarios"].get(name)
+        if current is None:
+            continue
+        if current["llm_calls"] > base["llm_calls"]:
+            problems.append(f"{name}: llm_calls {base['llm_calls']} -> {current['llm_calls']}")
+        limit = base["prompt_tokens"] * (1 + token_tolerance)
+        if current["prompt_tokens"] > limit:
+            problems.append(f"{name}: prompt_tokens {base['prompt_tokens']} -> {current['prompt_tokens']}")
+    return problems
+
+
+def compare_fused(two_call, fused):
+    """Wall time, calls and prompt tokens of set_goal + boost_connection, per scenario and in total."""
+    def goal_and_boost(result, key):
+        return sum(result["stages"][stage][key] for stage in ("set_goal", "boost_connection"))
+
+    rows = {}
+    for name, base in two_call["scenarios"].items():
+        if name in fused["scenarios"]:
+            rows[name] = {
+                mode: {key: goal_and_boost(result["scenarios"][name], key)
+                       for key in ("wall_time", "llm_calls", "prompt_tokens")}
+                for mode, result in (("two_call", two_call), ("fused", fused))
+            }
+    return rows
+
+
+def print_comparison(rows):
+    print(f"\nset_goal + boost_connection{'two-call s':>13}{'fused s':>9}{'calls':>9}{'prompt':>13}")
+    totals = {mode: {"wall_time": 0.0, "llm_calls": 0, "prompt_tokens": 0} for mode in ("two_call", "fused")}
+    for name, row in rows.items():
+        a, b = row["two_call"], row["fused"]
+        print(f"{name:<28}{a['wall_time']:>11.3f}{b['wall_time']:>9.3f}{a['llm_calls']:>5} ->{b['llm_calls']:>2}"
+              f"{a['prompt_tokens']:>7} ->{b['prompt_tokens']:>4}")
+        for mode in totals:
+            for key in totals[mode]:
+                totals[mode][key] += row[mode][key]
+    a, b = totals["two_call"], totals["fused"]
+    print(f"{'TOTAL':<28}{a['wall_time']:>11.3f}{b['wall_time']:>9.3f}{a['llm_calls']:>5} ->{b['llm_calls']:>2}"
+          f"{a['prompt_tokens']:>7} ->{b['prompt_tokens']:>4}")
+
+
+def print_summary(results):
+    print(f"{'scenario':<28}{'wall s':>9}{'calls':>7}{'prompt':>9}{'compl':>8}{'peak KiB':>10}")
+    for name, r in results["scenarios"].items():
+        peak = r.get("alloc_peak_bytes")
+        print(f"{name:<28}{r['wall_time']:>9.3f}{r['llm_calls']:>7}{r['prompt_tokens']:>9}"
+              f"{r['completion_tokens']:>8}{(peak or 0) / 1024:>10.0f}")
+    t = results["totals"]
+    print(f"{'TOTAL':<28}{t['wall_time']:>9.3f}{t['llm_calls']:>7}{t['prompt_tokens']:>9}{t['completion_tokens']:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.02, help="mean seconds before the first token")
+    parser.add_argument("--latency-stddev", type=float, default=0.005)
+    parser.add_argument("--tps", type=float, default=1000.0, help="mean tokens per second (0 = instant)")
+    parser.add_argument("--tps-stddev", type=float, default=100.0)
+    parser.add_argument("--think-time", type=float, default=0.0, help="seconds the scripted user takes per answer")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="run only scenarios whose name contains this")
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--check", help="baseline JSON to compare call counts and prompt tokens with")
+    parser.add_argument("--compare-fused", action="store_true",
+                        help="also run with set_goal and boost_connection fused into one request")
+    args = parser.parse_args(argv)
+
+    model_config = {
+        "latency_mean": args.latency, "latency_stddev": args.latency_stddev,
+        "tokens_per_second": args.tps, "tokens_per_second_stddev": args.tps_stddev,
+        "seed": args.seed,
+    }
+    results = run_all(model_config, args.think_time, allocations=not args.no_alloc, only=args.only)
+    print_summary(results)
+    if args.compare_fused:
+        fused = run_all(model_config, args.think_time, allocations=False, only=args.only, fuse_goal_and_boost=True)
+        results["fused_comparison"] = compare_fused(results, fused)
+        print_comparison(results["fused_comparison"])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.check:
+        with open(args.check, encoding="utf-8") as f:
+            problems = check_against(results, json.load(f))
+        for problem in problems:
+            print("REGRESSION", problem)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Throughput of workerPool.py at 1, 2, 4 and 8 workers.
+
+For every worker count it starts a fresh fake OpenAI API (fakeOpenAI.py) and
+a fresh workerPool.py front with its own shared directory. Then it runs the
+loadTest.py session level against the front: --sessions scripted
+conversations, started over --ramp seconds, with a random think time before
+every answer. It reports turns per second, the turn latency (p50 / p99) and
+the speedup over one worker.
+
+The front and the fake API are single processes too, so more workers than
+free cores (os.cpu_count() is printed) only add scheduling overhead. Exits 1
+when a conversation failed.
+
+    python -m benchmarks.workerBenchmark --workers 1,2,4,8 --sessions 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks.loadTest import _spawn, run_level
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4,8", help="comma-separated worker counts")
+    parser.add_argument("--sessions", type=int, default=400, help="conversations per worker count")
+    parser.add_argument("--think-time", type=float, default=0.2, help="mean seconds before each answer")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which sessions are started")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake API: mean seconds to first token")
+    parser.add_argument("--tps", type=float, default=0.0, help="fake API: tokens per second (0 = instant)")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="per worker")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results JSON here")
+    args = parser.parse_args(argv)
+
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'turns/s':>9} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'completed':>10} {'failed':>7} "
+          f"{'503s':>6}")
+    results = []
+    for workers in [int(n) for n in args.workers.split(",")]:
+        procs = []
+        shared_dir = tempfile.mkdtemp(prefix="mbti-bench-")
+        try:
+            fake, fake_port = _spawn(["-m", "benchmarks.fakeOpenAI", "--port", "0", "--latency", str(args.latency),
+                                      "--tps", str(args.tps), "--seed", str(args.seed)])
+            procs.append(fake)
+            front, port = _spawn(["workerPool.py", "--workers", str(workers), "--port", "0", "--shared-dir", shared_dir,
+                                  "--openai-base-url", f"http://127.0.0.1:{fake_port}/v1",
+                                  "--max-sessions", str(args.sessions * 2), "--max-in-flight", str(args.max_in_flight)])
+            procs.append(front)
+            result = asyncio.run(run_level(f"http://127.0.0.1:{port}", args.sessions, args.think_time, 0,
+                                           args.ramp, args.seed))
+        finally:
+            for proc in reversed(procs):
+                proc.terminate()
+                proc.wait()
+            shutil.rmtree(shared_dir, ignore_errors=True)
+        result["workers"] = workers
+        result["speedup"] = result["turns_per_second"] / results[0]["turns_per_second"] if results else 1.0
+        results.append(result)
+        print(f"{workers:>7} {result['turns_per_second']:>9.1f} {result['speedup']:>7.2f}x {result['p50'] * 1000:>8.1f} "
+              f"{result['p99'] * 1000:>8.1f} {result['completed']:>10} {result['failed']:>7} {result['rejections']:>6}",
+              flush=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "cpus": os.cpu_count(), "levels": results}, f, indent=2)
+    return 0 if all(r["failed"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
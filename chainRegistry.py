@@ -0,0 +1,102 @@
+"""
+Process-wide registry of prompt templates and LLMChains.
+
+Chains are built on first use and then shared by every MBTIBot in the process.
+They are keyed by prompt name and model parameters.
+All chains built on the default model share one ChatOpenAI instance, so they also
+share its OpenAI client and HTTP connection pool. Per-prompt settings such as
+temperature and max_tokens are passed as call-time ``llm_kwargs``.
+
+Nothing from LangChain or OpenAI is imported until the first chain or model is
+built, which keeps `import chatApp` fast for short-lived workers and CLI runs.
+Long-running workers can call prewarm() at startup to pay that cost up front.
+"""
+import threading
+import time
+import warnings
+
+from prompts import PROMPT_BUILDERS, PROMPT_PARAMS, build_prompt
+
+
+def _chat_openai():
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(temperature=0)
+
+
+def _llm_chain_class():
+    from langchain.chains import LLMChain
+    from langchain_core._api.deprecation import LangChainDeprecationWarning
+
+    # suppress the deprecation warnings
+    warnings.filterwarnings("ignore", category=LangChainDeprecationWarning)
+    return LLMChain
+
+
+class ChainRegistry:
+    def __init__(self, default_llm_factory=None):
+        # 默认模型只在第一次需要时创建
+        self._default_llm_factory = default_llm_factory or _chat_openai
+        self._default_llm = None
+        self._prompts = {}
+        self._chains = {}
+        self._lock = threading.Lock()
+
+    def default_llm(self):
+        """Return the shared ChatOpenAI used when a bot is not given its own model."""
+        with self._lock:
+            if self._default_llm is None:
+                self._default_llm = self._default_llm_factory()
+            return self._default_llm
+
+    def get_prompt(self, name):
+        with self._lock:
+            prompt = self._prompts.get(name)
+            if prompt is None:
+                prompt = self._prompts[name] = build_prompt(name)
+            return prompt
+
+    def get_chain(self, name, llm_model=None, **overrides):
+        """
+        Return the chain for prompt `name`, creating it on first use.
+        `llm_model` is the bot's own model (None means the shared default) and
+        `overrides` replace the default temperature / max_tokens from PROMPT_PARAMS.
+        """
+        llm = llm_model if llm_model is not None else self.default_llm()
+        params = {**PROMPT_PARAMS.get(name, {}), **overrides}
+        # the chain keeps a reference to llm, so id(llm) cannot be reused while it is cached
+        key = (name, id(llm), tuple(sorted(params.items())))
+        chain = self._chains.get(key)
+        if chain is None:
+            prompt = self.get_prompt(name)
+            with self._lock:
+                chain = self._chains.get(key)
+                if chain is None:
+                    LLMChain = _llm_chain_class()
+                    chain = self._chains[key] = LLMChain(llm=llm, prompt=prompt, llm_kwargs=params)
+        return chain
+
+    def prewarm(self, names=None, llm_model=None):
+        """
+        Import LangChain, build the model client and every chain in `names`
+        (default: all prompts) so the first real request does not pay for it.
+        Returns the seconds spent.
+        """
+        started = time.perf_counter()
+        for name in names or PROMPT_BUILDERS:
+            self.get_chain(name, llm_model=llm_model)
+        return time.perf_counter() - started
+
+    def clear(self):
+        with self._lock:
+            self._prompts.clear()
+            self._chains.clear()
+            self._default_llm = None
+
+
+_registry = ChainRegistry()
+
+
+def get_chain_registry():
+    """Return the registry shared by all MBTIBot instances in this process."""
+    return _registry
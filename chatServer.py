@@ -0,0 +1,569 @@
+"""
+HTTP server hosting many MBTIBot conversations in one process.
+
+Every session runs MBTIBot.arun() as its own task. Whenever the bot asks a
+question the session pauses and the question (plus everything the bot said
+since the last one) is returned to the client; the client's reply resumes it.
+
+    POST   /sessions               start a session       -> {"session_id", "resume_token", "messages", "done"}
+                                   {"session_id": "...", "resume_token": "..."} resumes a checkpointed
+                                   one (with --session-store); without the session's token it is a 404
+    POST   /sessions/<id>/reply    {"text": "..."}       -> {"messages", "done"}
+    DELETE /sessions/<id>          close a session
+    GET    /sessions/<id>/matches  ?k=10, other users to connect with (with --match-index)
+                                   -> {"matches": [{"user", "mbti", "goal", "score"}]}
+    GET    /healthz                session / LLM queue / resilience counters
+    GET    /metrics                Prometheus metrics (with --metrics)
+
+Messages are {"type": "say" | "ask", "text": ...}, {"type": "done", "result": {...}}
+or {"type": "error", "text": ...}.
+
+Model requests from all sessions share one LLMLimiter. Calls beyond
+--max-in-flight wait in a queue. Once --max-waiting calls are queued, or
+--max-active-turns turns are being processed (the process is CPU-bound on the
+OpenAI client well before the queue fills), the server answers with 503 +
+Retry-After. New sessions are turned away at half those limits, so that under
+overload the conversations already in progress keep moving.
+Sessions are closed after --idle-timeout seconds without a reply, or when a turn
+takes longer than --turn-timeout. On SIGTERM / SIGINT the server stops taking
+new sessions, lets the open ones finish for up to --drain-timeout and exits.
+Model requests have per-stage deadlines, retries and a circuit breaker
+(resilience.py); --hedge-quantile turns on hedged requests and
+--fallback-model answers with a cheaper model while the breaker is open.
+--response-cache keeps the cached model responses in a SQLite file that
+several servers can share; workerPool.py runs one server per core that way.
+
+    python chatServer.py --port 8080
+    python chatServer.py --port 8080 --openai-base-url http://127.0.0.1:9000/v1
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import time
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+from chatApp import MBTIBot, prewarm
+from instrumentation import PrometheusExporter, get_instrumentation
+from mbtiEngine import get_engine
+from resilience import Resilience
+from responseCache import ResponseCache
+
+log = logging.getLogger("chatServer")
+
+MAX_BODY = 64 * 1024
+_REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+            503: "Service Unavailable", 504: "Gateway Timeout"}
+
+
+class ServerBusy(Exception):
+    def __init__(self, reason, retry_after=1):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class SessionBusy(Exception):
+    """A reply arrived while the session was not waiting for one."""
+
+
+class TurnTimeout(Exception):
+    pass
+
+
+class SessionExpired(Exception):
+    """Raised inside the bot when the user did not answer within the idle timeout."""
+
+
+class LLMLimiter:
+    """
+    Caps the model requests in flight across all sessions. Requests beyond the cap
+    wait in FIFO order; `saturated` tells the server to push back on new work.
+    """
+
+    def __init__(self, max_in_flight=64, max_waiting=128):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    @property
+    def saturated(self):
+        return self.waiting >= self.max_waiting
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+class Session:
+    __slots__ = ("id", "manager", "bot", "state", "last_active", "result", "_outbox", "_turn", "_reply", "_task")
+
+    def __init__(self, session_id, manager):
+        self.id = session_id
+        self.manager = manager
+        self.bot = MBTIBot(input_func=self._ask, print_func=self._say, llm_limiter=manager.limiter,
+                           session_id=session_id, session_store=manager.session_store, engine=manager.engine,
+                           fuse_goal_and_boost=manager.fuse_goal_and_boost)
+        # checkpointed with the state; a resumed session gets the token of its checkpoint back in arun()
+        self.bot.state.resume_token = secrets.token_urlsafe(16)
+        self.state = "running"   # running -> waiting <-> running -> done
+        self.last_active = time.monotonic()
+        self.result = None
+        self._outbox = []
+        self._turn = None    # resolved with the turn's messages when the bot asks or finishes
+        self._reply = None   # resolved with the user's answer
+        self._task = None
+
+    async def _say(self, text):
+        self._outbox.append({"type": "say", "text": str(text)})
+
+    async def _ask(self, question):
+        self._outbox.append({"type": "ask", "text": question})
+        self._reply = asyncio.get_running_loop().create_future()
+        self.state = "waiting"
+        self._end_turn()
+        try:
+            return await asyncio.wait_for(self._reply, self.manager.idle_timeout)
+        except asyncio.TimeoutError:
+            raise SessionExpired(self.id) from None
+
+    def _end_turn(self):
+        if self._turn is not None and not self._turn.done():
+            messages, self._outbox = self._outbox, []
+            self._turn.set_result(messages)
+
+    async def _run(self):
+        try:
+            self.result = await self.bot.arun()
+            if self.result.get("rejected"):
+                log.info("session %s ended after repeated blocked input", self.id)
+                self._outbox.append({"type": "error", "text": "Please start a new session."})
+            else:
+                self._outbox.append({"type": "done", "result": self.result})
+        except SessionExpired:
+            log.info("session %s expired", self.id)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            log.exception("session %s failed", self.id)
+            self._outbox.append({"type": "error", "text": "Sorry, something went wrong. Please start a new session."})
+        finally:
+            # prefetches for a conversation that is over would only hold limiter slots
+            self.bot.speculator.cancel_unused()
+            self.state = "done"
+            self._end_turn()
+            self.manager.forget(self)
+
+    async def start(self):
+        self._turn = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run())
+        return await self._wait_turn()
+
+    async def send(self, text):
+        if self.state != "waiting" or self._reply.done():
+            raise SessionBusy(self.id)
+        self.state = "running"
+        self.last_active = time.monotonic()
+        self._turn = asyncio.get_running_loop().create_future()
+        self._reply.set_result(text)
+        return await self._wait_turn()
+
+    async def _wait_turn(self):
+        try:
+            messages = await asyncio.wait_for(asyncio.shield(self._turn), self.manager.turn_timeout)
+        except asyncio.TimeoutError:
+            self.close()
+            raise TurnTimeout(self.id) from None
+        self.last_active = time.monotonic()
+        return messages
+
+    def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    @property
+    def done(self):
+        return self.state == "done"
+
+    @property
+    def resume_token(self):
+        return self.bot.state.resume_token
+
+
+class SessionManager:
+    def __init__(self, limiter=None, idle_timeout=300.0, turn_timeout=120.0, max_sessions=20000,
+                 max_active_turns=256, session_store=None, engine=None, fuse_goal_and_boost=False,
+                 **engine_kwargs):
+        self.limiter = limiter or LLMLimiter()
+        # one engine (profiles, chains, clients) for all sessions; llm_model=... etc. swap parts of it
+        self.engine = engine or get_engine()
+        if engine_kwargs:
+            self.engine = self.engine.replace(**engine_kwargs)
+        # with a store, sessions are checkpointed after every stage and can be resumed after a restart
+        self.session_store = session_store
+        self.fuse_goal_and_boost = fuse_goal_and_boost
+        self.idle_timeout = idle_timeout
+        self.turn_timeout = turn_timeout
+        self.max_sessions = max_sessions
+        self.max_active_turns = max_active_turns
+        self.active_turns = 0
+        self.sessions = {}
+        self.draining = False
+        self.rejected = 0
+
+    def _admit(self, new_session):
+        if new_session:
+            if self.draining:
+                raise ServerBusy("draining", retry_after=5)
+            if len(self.sessions) >= self.max_sessions:
+                raise ServerBusy("too many sessions", retry_after=5)
+            # shed new conversations first so the ones in progress can finish
+            if (self.limiter.waiting >= max(1, self.limiter.max_waiting // 2)
+                    or self.active_turns >= max(1, self.max_active_turns // 2)):
+                raise ServerBusy("server busy", retry_after=2)
+        elif self.limiter.saturated or self.active_turns >= self.max_active_turns:
+            raise ServerBusy("server busy")
+
+    async def _turn(self, session, coro):
+        self.active_turns += 1
+        try:
+            return session, await coro
+        finally:
+            self.active_turns -= 1
+
+    async def create(self, session_id=None, resume_token=None):
+        """
+        Start a session. A `session_id` with a checkpoint in the store is resumed only with the
+        resume_token it was given when it started; anyone may know a session id (see _matches).
+        """
+        if session_id is not None and session_id in self.sessions:
+            raise SessionBusy(session_id)
+        if session_id is not None and self.session_store is not None:
+            saved = self.session_store.load(session_id)
+            if saved is not None and not (resume_token and saved.resume_token
+                                          and hmac.compare_digest(str(resume_token), saved.resume_token)):
+                raise SessionNotFound(session_id)
+        try:
+            self._admit(new_session=True)
+        except ServerBusy:
+            self.rejected += 1
+            raise
+        session = Session(session_id or uuid.uuid4().hex, self)
+        self.sessions[session.id] = session
+        return await self._turn(session, session.start())
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise SessionNotFound(session_id)
+        return session
+
+    async def reply(self, session_id, text):
+        session = self.get(session_id)
+        try:
+            self._admit(new_session=False)
+        except ServerBusy:
+            self.rejected += 1
+            raise
+        return await self._turn(session, session.send(text))
+
+    def close(self, session_id):
+        self.get(session_id).close()
+
+    def forget(self, session):
+        self.sessions.pop(session.id, None)
+
+    async def drain(self, timeout=30.0):
+        """Stop accepting sessions, give the open ones `timeout` seconds to finish, then close them."""
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        while self.sessions and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        tasks = [s._task for s in self.sessions.values() if s._task is not None]
+        for session in list(self.sessions.values()):
+            session.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self):
+        waiting = sum(1 for s in self.sessions.values() if s.state == "waiting")
+        return {
+            "sessions": len(self.sessions),
+            "waiting_for_user": waiting,
+            "running": len(self.sessions) - waiting,
+            "active_turns": self.active_turns,
+            "llm_in_flight": self.limiter.in_flight,
+            "llm_waiting": self.limiter.waiting,
+            "rejected": self.rejected,
+            "draining": self.draining,
+            "resilience": self.engine.resilience.stats() if self.engine.resilience else None,
+        }
+
+
+async def read_request(reader, timeout=None):
+    """Read one HTTP/1.1 request; returns (method, path[?query], headers, body) or None when the client went away."""
+    line = await asyncio.wait_for(reader.readline(), timeout)
+    if not line:
+        return None
+    method, target, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY:
+        raise ValueError("request body too large")
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    return method, url.path + (f"?{url.query}" if url.query else ""), headers, body
+
+
+def write_response(writer, status, body=b"", content_type="application/json", headers=None, keep_alive=True):
+    if not isinstance(body, bytes):
+        body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+             f"Content-Type: {content_type}",
+             f"Content-Length: {len(body)}",
+             "Connection: keep-alive" if keep_alive else "Connection: close"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+
+
+class ChatServer:
+    def __init__(self, manager, exporter=None, keep_alive_timeout=75.0):
+        self.manager = manager
+        self.exporter = exporter
+        self.keep_alive_timeout = keep_alive_timeout
+        self._server = None
+        self._connections = {}   # writer -> handler task
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self._server = await asyncio.start_server(self._handle_connection, host, port, backlog=1024)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def shutdown(self, drain_timeout=30.0):
+        self._server.close()
+        await self.manager.drain(drain_timeout)
+        handlers = list(self._connections.values())
+        for writer in list(self._connections):
+            writer.close()
+        # closed connections read EOF and let their handlers return normally
+        await asyncio.gather(*handlers, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                request = await read_request(reader, self.keep_alive_timeout)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload, extra = await self._dispatch(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close" and not self.manager.draining
+                if isinstance(payload, str):
+                    write_response(writer, status, payload.encode("utf-8"), "text/plain; version=0.0.4",
+                                   extra, keep_alive)
+                else:
+                    write_response(writer, status, b"" if payload is None else payload, headers=extra,
+                                   keep_alive=keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ValueError:
+            write_response(writer, 413, {"error": "request too large"}, keep_alive=False)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        path, _, query = path.partition("?")
+        parts = path.strip("/").split("/")
+        try:
+            if parts == ["healthz"] and method == "GET":
+                return 200, self.manager.stats(), None
+            if parts == ["metrics"] and method == "GET":
+                if self.exporter is None:
+                    return 404, {"error": "metrics are disabled"}, None
+                resilience = self.manager.engine.resilience
+                return 200, self.exporter.render() + (resilience.render() if resilience else ""), None
+            if parts == ["sessions"] and method == "POST":
+                try:
+                    request = json.loads(body or b"{}")
+                    session_id, resume_token = request.get("session_id"), request.get("resume_token")
+                except (ValueError, AttributeError):
+                    return 400, {"error": "invalid JSON body"}, None
+                session, messages = await self.manager.create(session_id and str(session_id),
+                                                              resume_token and str(resume_token))
+                return 201, {"session_id": session.id, "resume_token": session.resume_token,
+                             "messages": messages, "done": session.done}, None
+            if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "reply" and method == "POST":
+                try:
+                    text = json.loads(body or b"{}")["text"]
+                except (ValueError, KeyError, TypeError):
+                    return 400, {"error": 'expected {"text": ...}'}, None
+                session, messages = await self.manager.reply(parts[1], str(text))
+                return 200, {"messages": messages, "done": session.done}, None
+            if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "matches" and method == "GET":
+                return await self._matches(parts[1], parse_qs(query))
+            if len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+                self.manager.close(parts[1])
+                return 204, None, None
+            return 404, {"error": "not found"}, None
+        except ServerBusy as e:
+            return 503, {"error": str(e)}, {"Retry-After": e.retry_after}
+        except SessionNotFound:
+            return 404, {"error": "unknown or finished session"}, None
+        except SessionBusy:
+            return 409, {"error": "the session is busy or already open"}, None
+        except TurnTimeout:
+            return 504, {"error": "the turn took too long, the session was closed"}, None
+
+    async def _matches(self, session_id, params):
+        index = self.manager.engine.match_index
+        if index is None:
+            return 404, {"error": "user matching is disabled"}, None
+        try:
+            k = min(max(int(params.get("k", ["10"])[0]), 1), 100)
+        except ValueError:
+            return 400, {"error": "k must be an integer"}, None
+        # on a worker thread: the index may be locked by a compaction running in the background
+        matches = await asyncio.to_thread(self._find_matches, index, session_id, k)
+        if matches is None:
+            return 404, {"error": "the session has not set a goal yet"}, None
+        return 200, {"matches": matches}, None
+
+    @staticmethod
+    def _find_matches(index, session_id, k):
+        if session_id not in index:
+            return None
+        matches = []
+        for user_id, score in index.top_k_for(session_id, k):
+            profile = index.profile(user_id)
+            # a session id lets anyone reply in that session, so other users only see a digest of it
+            matches.append({"user": hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:12],
+                            "mbti": profile["mbti"], "goal": profile["goal"], "score": round(score, 3)})
+        return matches
+
+
+def _openai_model(base_url, max_connections, model=None):
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+    # no more connections than the limiter lets requests through: httpcore scans the whole pool
+    # on every request, which becomes the server's main CPU cost with the default 1000 connections
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    kwargs = {"model": model} if model else {}
+    return ChatOpenAI(temperature=0, base_url=base_url, http_async_client=httpx.AsyncClient(limits=limits), **kwargs)
+
+
+async def serve(args, engine=None, on_listening=None):
+    """
+    Run the server until SIGINT / SIGTERM. `engine` replaces the process-wide one (workerPool.py
+    passes one built from the shared profiles); `on_listening(port)` is called instead of printing the address.
+    """
+    exporter = None
+    if args.metrics:
+        exporter = get_instrumentation().add_sink(PrometheusExporter())
+    llm_model = _openai_model(args.openai_base_url, args.max_in_flight) if args.openai_base_url else None
+    fallback_llm = None
+    if args.fallback_model:
+        fallback_llm = _openai_model(args.openai_base_url, args.max_in_flight, model=args.fallback_model)
+    resilience = Resilience(hedge_quantile=args.hedge_quantile, fallback_llm=fallback_llm)
+    log.info("prewarmed in %.2fs", prewarm(llm_model=llm_model))
+    session_store = None
+    if args.session_store:
+        from sessionStore import open_session_store
+        session_store = open_session_store(args.session_store)
+    response_cache = None
+    if args.response_cache:
+        # SQLite file that several servers (e.g. the workers of workerPool.py) can share
+        response_cache = ResponseCache(sqlite_path=args.response_cache)
+    match_index = None
+    if args.match_index:
+        from matchIndex import MatchIndex
+        match_index = MatchIndex.load(args.match_index) if os.path.isdir(args.match_index) else MatchIndex()
+        log.info("match index: %d users", len(match_index))
+    manager = SessionManager(LLMLimiter(args.max_in_flight, args.max_waiting), idle_timeout=args.idle_timeout,
+                             turn_timeout=args.turn_timeout, max_sessions=args.max_sessions,
+                             max_active_turns=args.max_active_turns, session_store=session_store,
+                             engine=engine, fuse_goal_and_boost=args.fused, llm_model=llm_model,
+                             match_index=match_index, resilience=resilience, response_cache=response_cache)
+    server = ChatServer(manager, exporter)
+    port = await server.start(args.host, args.port)
+    if on_listening is not None:
+        on_listening(port)
+    else:
+        # the load test reads the port from this line
+        print(f"listening on {args.host}:{port}", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    log.info("draining %d sessions", len(manager.sessions))
+    await server.shutdown(args.drain_timeout)
+    if match_index is not None:
+        match_index.save(args.match_index)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="0 picks a free port")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="model requests running at once")
+    parser.add_argument("--max-waiting", type=int, default=128, help="queued model requests before answering 503")
+    parser.add_argument("--max-sessions", type=int, default=20000)
+    parser.add_argument("--max-active-turns", type=int, default=256, help="turns processed at once before answering 503")
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="seconds a session waits for a reply")
+    parser.add_argument("--turn-timeout", type=float, default=120.0, help="seconds one turn may take")
+    parser.add_argument("--drain-timeout", type=float, default=30.0)
+    parser.add_argument("--openai-base-url", help="send model requests here instead of api.openai.com")
+    parser.add_argument("--session-store", help="checkpoint sessions to this .db file or directory")
+    parser.add_argument("--response-cache", help="keep cached model responses in this SQLite file")
+    parser.add_argument("--metrics", action="store_true", help="serve Prometheus metrics on /metrics")
+    parser.add_argument("--fused", action="store_true",
+                        help="one model request for the connection insight and the bonding suggestions")
+    parser.add_argument("--hedge-quantile", type=float,
+                        help="duplicate a model request still running after this latency quantile, e.g. 0.95")
+    parser.add_argument("--fallback-model", help="cheaper model answering while the main one is failing")
+    parser.add_argument("--match-index", help="directory of the user matching index, loaded at start and saved on exit")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    # one line per model request is too much at this volume
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
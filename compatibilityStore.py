@@ -0,0 +1,315 @@
+"""
+Precomputed MBTI compatibility for set_goal's "no specific target" path.
+
+A relationship goal such as "close friends" or "a mentor" is bucketed into one
+of CATEGORIES. For every category there is a 16x16 compatibility matrix (row:
+the user's type, column: the other type), scored by fixed per-axis rules, so
+the top matches for a user are known without asking the LLM. For every
+(user type, category, coach) there is also a blurb written ahead of time in
+that coach's voice by a batch job. At run time the bot shows the stored blurb.
+If there is no usable blurb, it sends the short compatibility_blurb prompt
+seeded with the stored matches instead of asking the LLM to work out the
+matches itself.
+
+The store is one JSON file, loaded once per process by the engine. Lookups
+are dict and list indexing.
+
+    python compatibilityStore.py build      # score the matrices and write every blurb
+    python compatibilityStore.py refresh    # only the blurbs that are missing or stale
+    python compatibilityStore.py status     # exit 1 when the store should be refreshed
+
+Staleness: the store records STORE_VERSION, the build time and model, and
+for each blurb a fingerprint of the persona context it was written for.
+Blurbs whose persona changed (assistant_profiles.json was edited) are not
+used and are regenerated by refresh. A store with another STORE_VERSION is
+ignored entirely. Bump it when the scoring rules or the blurb prompt change.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+from mbtiScorer import MBTI_TYPES
+
+STORE_VERSION = 2
+STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "compatibility_store.json")
+MAX_AGE_DAYS = 90
+
+TYPES = sorted(MBTI_TYPES)
+_TYPE_INDEX = {t: i for i, t in enumerate(TYPES)}
+
+# category -> (label used in the prompt, goal phrases). A goal is scored on every category: each
+# phrase found as whole words counts once, longest phrase first, so "business partner" is professional
+# and "partner" on its own is romantic. A plural of the last word counts too ("colleagues").
+CATEGORIES = {
+    "professional": ("professional", [
+        "professional", "work", "colleague", "coworker", "co-worker", "career", "business", "networking",
+        "cofounder", "co-founder", "client", "business partner", "work friend",
+    ]),
+    "mentor": ("mentor", [
+        "mentor", "mentee", "guidance", "teacher", "coach", "advisor", "role model",
+    ]),
+    "romantic": ("romantic", [
+        "romantic", "romance", "partner", "date", "dating", "in love", "fall in love", "girlfriend", "boyfriend",
+        "spouse", "soulmate", "crush", "marriage", "relationship with someone special",
+    ]),
+    "friend": ("friendship", [
+        "friend", "friendship", "close friends", "buddy", "buddies", "pal", "companion", "hang out",
+        "social circle",
+    ]),
+}
+# phrases that contain a category word but say nothing about the kind of connection
+NEUTRAL_PHRASES = [
+    "work out", "working out", "works out", "team up", "teaming up", "love to", "would love", "i'd love",
+    "loves to", "love it", "guide me", "date back",
+]
+
+
+def _phrase_table():
+    table = {tuple(phrase.split()): None for phrase in NEUTRAL_PHRASES}
+    for category, (_, phrases) in CATEGORIES.items():
+        table.update((tuple(phrase.split()), category) for phrase in phrases)
+    return table, max(len(phrase) for phrase in table)
+
+
+_PHRASES, _LONGEST_PHRASE = _phrase_table()
+
+# per category and axis (E/I, S/N, T/F, J/P): (points when both share the letter, points when they differ)
+SCORING_RULES = {
+    "friend": ((0.6, 0.4), (1.0, 0.2), (0.6, 0.5), (0.6, 0.4)),
+    "romantic": ((0.4, 0.8), (1.0, 0.3), (0.5, 0.6), (0.5, 0.6)),
+    "mentor": ((0.5, 0.5), (0.8, 0.4), (0.4, 0.7), (0.4, 0.7)),
+    "professional": ((0.5, 0.5), (0.6, 0.5), (0.4, 0.8), (0.8, 0.3)),
+}
+TOP_MATCHES = 3
+
+_WORD = re.compile(r"[a-z][a-z'-]*")
+
+
+def _match_phrase(words, start):
+    """(length, category) of the longest phrase at words[start], (0, None) when none starts there."""
+    for length in range(min(_LONGEST_PHRASE, len(words) - start), 0, -1):
+        phrase = tuple(words[start:start + length])
+        for candidate in (phrase, phrase[:-1] + (phrase[-1][:-1],) if phrase[-1].endswith("s") else None):
+            if candidate in _PHRASES:
+                return length, _PHRASES[candidate]
+    return 0, None
+
+
+def bucket_goal(goal):
+    """
+    The category of a free-text relationship goal, or None when no category clearly wins
+    (nothing matched, or a tie); the caller then asks the LLM instead.
+    """
+    words = _WORD.findall((goal or "").lower())
+    scores = {}
+    i = 0
+    while i < len(words):
+        length, category = _match_phrase(words, i)
+        if category is not None:
+            scores[category] = scores.get(category, 0) + 1
+        i += length or 1
+    if not scores:
+        return None
+    ranked = sorted(scores.values(), reverse=True)
+    if len(ranked) > 1 and ranked[0] == ranked[1]:
+        return None
+    return max(scores, key=scores.get)
+
+
+def score(user_mbti, other_mbti, category):
+    rules = SCORING_RULES[category]
+    points = sum(same if a == b else differ for (same, differ), a, b in zip(rules, user_mbti, other_mbti))
+    return round(points / sum(max(rule) for rule in rules), 3)
+
+
+def build_matrices():
+    return {category: [[score(user, other, category) for other in TYPES] for user in TYPES]
+            for category in SCORING_RULES}
+
+
+def persona_fingerprint(persona_context):
+    return hashlib.sha1(persona_context.encode("utf-8")).hexdigest()[:12]
+
+
+def _blurb_key(user_mbti, category, coach):
+    return f"{user_mbti}|{category}|{coach}"
+
+
+class CompatibilityStore:
+    def __init__(self, data):
+        self.version = data.get("version")
+        self.built_at = data.get("built_at", 0.0)
+        self.model = data.get("model")
+        self.matrices = data.get("matrices", {})
+        self.blurbs = data.get("blurbs", {})   # "INFP|friend|2" -> {"text": ..., "persona": fingerprint}
+        # best matches per (category, type), worked out once here so lookups are O(1)
+        self._top = {
+            (category, user): [TYPES[j] for j in sorted(range(len(TYPES)), key=lambda j: -row[j])[:TOP_MATCHES]]
+            for category, matrix in self.matrices.items() for user, row in zip(TYPES, matrix)
+        }
+
+    @classmethod
+    def load(cls, path=STORE_PATH):
+        """The store at `path`, or None if there is none or it was built with another STORE_VERSION."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        store = cls(data)
+        return store if store.version == STORE_VERSION else None
+
+    def save(self, path=STORE_PATH):
+        data = {"version": self.version, "built_at": self.built_at, "model": self.model,
+                "matrices": self.matrices, "blurbs": self.blurbs}
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+    def category_for(self, user_mbti, goal):
+        """The category to answer `goal` from, or None when the store cannot answer it."""
+        if user_mbti not in _TYPE_INDEX:
+            return None
+        category = bucket_goal(goal)
+        return category if category in self.matrices else None
+
+    def matches(self, user_mbti, category):
+        return self._top.get((category, user_mbti))
+
+    def compatibility(self, user_mbti, other_mbti, category):
+        return self.matrices[category][_TYPE_INDEX[user_mbti]][_TYPE_INDEX[other_mbti]]
+
+    def blurb(self, user_mbti, category, coach, persona_context):
+        """The pre-written blurb, unless it is missing or was written for a different persona."""
+        entry = self.blurbs.get(_blurb_key(user_mbti, category, coach))
+        if entry is None or entry.get("persona") != persona_fingerprint(persona_context):
+            return None
+        return entry["text"]
+
+    def blurb_inputs(self, user_mbti, category, persona_context):
+        """Inputs of the compatibility_blurb prompt, seeded with the stored matches."""
+        return {
+            "persona_context": persona_context,
+            "mbti": user_mbti,
+            "category": CATEGORIES[category][0],
+            "matches": ", ".join(self.matches(user_mbti, category)),
+        }
+
+    def stale_blurbs(self, persona_contexts):
+        """Keys of the blurbs that are missing or were written for a persona that has since changed."""
+        stale = []
+        for coach, persona in persona_contexts.items():
+            fingerprint = persona_fingerprint(persona)
+            for user in TYPES:
+                for category in self.matrices:
+                    entry = self.blurbs.get(_blurb_key(user, category, coach))
+                    if entry is None or entry.get("persona") != fingerprint:
+                        stale.append(_blurb_key(user, category, coach))
+        return stale
+
+    def staleness(self, persona_contexts, max_age_days=MAX_AGE_DAYS, now=None):
+        """Reasons to refresh the store; empty when it is fresh."""
+        reasons = []
+        if self.version != STORE_VERSION:
+            reasons.append(f"built with store version {self.version}, current is {STORE_VERSION}")
+        if self.matrices != build_matrices():
+            reasons.append("compatibility matrices differ from the current scoring rules")
+        age_days = ((now or time.time()) - self.built_at) / 86400
+        if age_days > max_age_days:
+            reasons.append(f"built {age_days:.0f} days ago (max {max_age_days})")
+        stale = self.stale_blurbs(persona_contexts)
+        if stale:
+            reasons.append(f"{len(stale)} blurbs missing or written for a changed persona")
+        return reasons
+
+
+async def abuild(engine, store=None, concurrency=8, log=print):
+    """
+    Score the matrices and write the blurbs with the engine's model. With an existing
+    `store`, its blurbs that are still valid are kept and only the rest are generated.
+    """
+    previous = store if store is not None and store.version == STORE_VERSION else None
+    llm = engine.llm_model if engine.llm_model is not None else engine.chain_registry.default_llm()
+    store = CompatibilityStore({
+        "version": STORE_VERSION,
+        "built_at": time.time(),
+        "model": getattr(llm, "model_name", None) or type(llm).__name__,
+        "matrices": build_matrices(),
+        "blurbs": dict(previous.blurbs) if previous is not None else {},
+    })
+    if previous is not None and previous.matrices != store.matrices:
+        # the matches changed, so every blurb mentions the wrong types
+        store.blurbs = {}
+    todo = store.stale_blurbs(engine.persona_contexts)
+    log(f"writing {len(todo)} blurbs")
+    chain = engine.chain_registry.get_chain("compatibility_blurb", llm_model=engine.llm_model)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def write(key):
+        user, category, coach = key.split("|")
+        persona = engine.persona_contexts[coach]
+        async with semaphore:
+            text = await chain.apredict(**store.blurb_inputs(user, category, persona))
+        store.blurbs[key] = {"text": text.strip(), "persona": persona_fingerprint(persona)}
+
+    await asyncio.gather(*(write(key) for key in todo))
+    return store
+
+
+def _engine(openai_base_url=None):
+    from mbtiEngine import get_engine
+
+    engine = get_engine()
+    if openai_base_url:
+        from langchain_openai import ChatOpenAI
+
+        engine = engine.replace(llm_model=ChatOpenAI(temperature=0, base_url=openai_base_url))
+    return engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("build", "refresh", "status"))
+    parser.add_argument("--path", default=STORE_PATH)
+    parser.add_argument("--concurrency", type=int, default=8, help="blurb requests running at once")
+    parser.add_argument("--max-age-days", type=float, default=MAX_AGE_DAYS, help="status: older stores are stale")
+    parser.add_argument("--openai-base-url", help="send model requests here instead of api.openai.com")
+    args = parser.parse_args(argv)
+
+    # raw JSON, so status can also report a store from another version
+    try:
+        with open(args.path, encoding="utf-8") as f:
+            existing = CompatibilityStore(json.load(f))
+    except FileNotFoundError:
+        existing = None
+
+    if args.command == "status":
+        if existing is None:
+            print(f"{args.path}: missing")
+            return 1
+        reasons = existing.staleness(_engine().persona_contexts, args.max_age_days)
+        built = time.strftime("%Y-%m-%d %H:%M", time.localtime(existing.built_at))
+        print(f"{args.path}: version {existing.version}, built {built} with {existing.model}, "
+              f"{len(existing.blurbs)} blurbs")
+        for reason in reasons:
+            print(f"stale: {reason}")
+        if not reasons:
+            print("fresh")
+        return 1 if reasons else 0
+
+    started = time.perf_counter()
+    engine = _engine(args.openai_base_url)
+    store = asyncio.run(abuild(engine, existing if args.command == "refresh" else None, args.concurrency))
+    store.save(args.path)
+    print(f"wrote {args.path} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Bounded memory of a multi-turn stage, e.g. the deep-dive follow-ups.
+
+The last `keep_turns` turns are kept word for word. Older turns are folded,
+one at a time, into a rolling summary: the summarizer gets the summary so far
+and the one turn to add, never the whole history, so each fold costs the same.
+Turns are also folded early when the rendered memory would go over
+`max_tokens` (estimated), so the prompt a turn sends stays about the same size
+however long the conversation gets. `sizes` has the estimated size of what
+render() returned for every turn.
+
+    memory = ConversationMemory(max_tokens=400, keep_turns=2)
+    memory.add("conversation", reply)
+    await memory.acompact(summarize)    # async summarize(summary, turn_text) -> new summary
+    prompt_inputs["history"] = memory.render()
+"""
+
+
+def estimate_tokens(text):
+    # same estimate as exampleBank's, without importing NumPy with it
+    return max(1, (len(text) + 3) // 4)
+
+
+class ConversationMemory:
+    __slots__ = ("max_tokens", "keep_turns", "summary", "turns", "sizes", "folds")
+
+    def __init__(self, max_tokens=400, keep_turns=2):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary = ""
+        self.turns = []   # (user message, reply)
+        self.sizes = []   # estimated tokens of each render()
+        self.folds = 0
+
+    def add(self, user, reply):
+        self.turns.append((user, reply))
+
+    @staticmethod
+    def format_turn(user, reply):
+        return f"User: {user}\nCoach: {reply}"
+
+    def tokens(self):
+        return estimate_tokens(self.summary) + sum(estimate_tokens(self.format_turn(*turn)) for turn in self.turns)
+
+    def needs_compacting(self):
+        # the newest turn always stays verbatim
+        return len(self.turns) > 1 and (len(self.turns) > self.keep_turns or self.tokens() > self.max_tokens)
+
+    async def acompact(self, summarize):
+        """Fold the oldest turns into the summary until the memory fits. Returns the number folded."""
+        folded = 0
+        while self.needs_compacting():
+            turn = self.format_turn(*self.turns[0])
+            try:
+                summary = await summarize(self.summary, turn)
+            except Exception:
+                summary = None
+            if not summary:
+                # no summarizer right now: keep at least what was asked
+                summary = f"{self.summary} The user asked about: {self.turns[0][0]}.".strip()
+            self.summary = summary.strip()
+            del self.turns[0]
+            folded += 1
+        self.folds += folded
+        return folded
+
+    def render(self):
+        """The memory as prompt text; empty before the first turn."""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation: {self.summary}")
+        parts += [self.format_turn(*turn) for turn in self.turns]
+        text = "\n\n".join(parts)
+        self.sizes.append(estimate_tokens(text) if text else 0)
+        return text
@@ -0,0 +1,148 @@
+"""
+Few-shot examples chosen per request from an example bank.
+
+example_bank.json holds the examples for every few-shot prompt (one quiz
+example per MBTI type, one target guess per type, yes/no pairs). Each section
+gets an ExampleIndex: hashed word and word-pair counts, IDF-weighted and
+L2-normalised into NumPy vectors, so picking the k nearest examples for a
+request is one matrix-vector product. BankExampleSelector plugs an index into
+a FewShotPromptTemplate; only the nearest examples that fit the section's
+token budget (prompts.EXAMPLE_SELECTION) are sent.
+
+Imported by the prompt builders when the first chain is built, so NumPy and
+LangChain are not loaded at import time of chatApp.
+"""
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+from langchain_core.example_selectors import BaseExampleSelector
+
+EXAMPLE_BANK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example_bank.json")
+
+_WORD = re.compile(r"[a-z0-9']+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_whitespace(text):
+    """Strip indentation and trailing spaces from every line and collapse runs of blank lines."""
+    text = "\n".join(line.strip() for line in text.strip().splitlines())
+    return _BLANK_LINES.sub("\n\n", text)
+
+
+def estimate_tokens(text):
+    # about four characters per token for English prose; only used to fit the budget
+    return max(1, (len(text) + 3) // 4)
+
+
+def _hashed_counts(text, dim):
+    counts = np.zeros(dim, dtype=np.float32)
+    words = _WORD.findall(text.lower())
+    for word in words:
+        counts[zlib.crc32(word.encode()) % dim] += 1.0
+    for first, second in zip(words, words[1:]):
+        counts[zlib.crc32(f"{first} {second}".encode()) % dim] += 0.5
+    return counts
+
+
+class ExampleIndex:
+    """Nearest-neighbour lookup over one section of the bank."""
+
+    def __init__(self, examples, fields, dim=1024):
+        # fields: {input variable: weight}, compared between the request's inputs and each example
+        self.examples = [{key: normalize_whitespace(str(value)) for key, value in example.items()}
+                         for example in examples]
+        self.fields = dict(fields)
+        self.dim = dim
+        self.costs = np.array([sum(estimate_tokens(value) for value in example.values())
+                               for example in self.examples])
+        counts = {field: np.stack([_hashed_counts(example.get(field, ""), dim) for example in self.examples])
+                  for field in self.fields}
+        # per hashed feature: in how many example fields it occurs
+        document_frequency = sum((c > 0).sum(axis=0) for c in counts.values())
+        self.idf = np.log((1 + len(self.examples) * len(self.fields)) / (1 + document_frequency)) + 1.0
+        self.vectors = self._combine({field: c * self.idf for field, c in counts.items()})
+
+    def _combine(self, weighted):
+        total = 0
+        for field, rows in weighted.items():
+            norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+            total = total + self.fields[field] * rows / np.maximum(norms, 1e-9)
+        norms = np.linalg.norm(total, axis=-1, keepdims=True)
+        return (total / np.maximum(norms, 1e-9)).astype(np.float32)
+
+    def add(self, example):
+        """Add one example (in memory only); the IDF weights of the bank are kept as they are."""
+        example = {key: normalize_whitespace(str(value)) for key, value in example.items()}
+        vector = self._combine({field: _hashed_counts(example.get(field, ""), self.dim)[None, :] * self.idf
+                                for field in self.fields})
+        self.examples.append(example)
+        self.costs = np.append(self.costs, sum(estimate_tokens(value) for value in example.values()))
+        self.vectors = np.vstack([self.vectors, vector])
+
+    def vectorize(self, inputs):
+        return self._combine({field: _hashed_counts(normalize_whitespace(str(inputs.get(field) or "")), self.dim)
+                              * self.idf for field in self.fields})
+
+    def select(self, inputs, k, max_tokens):
+        """Up to k examples closest to `inputs` whose estimated size fits within max_tokens, nearest last."""
+        scores = self.vectors @ self.vectorize(inputs)
+        chosen, spent = [], 0
+        # stable sort: equal scores keep the bank's order
+        for i in np.argsort(-scores, kind="stable"):
+            if len(chosen) == k:
+                break
+            if spent + self.costs[i] <= max_tokens:
+                chosen.append(i)
+                spent += self.costs[i]
+        # the closest example goes right before the request
+        return [self.examples[i] for i in reversed(chosen)]
+
+
+class BankExampleSelector(BaseExampleSelector):
+    """LangChain example selector backed by an ExampleIndex."""
+
+    def __init__(self, index, k, max_tokens):
+        self.index = index
+        self.k = k
+        self.max_tokens = max_tokens
+
+    def add_example(self, example):
+        # shared by every selector on this section; example_bank.json is not changed
+        self.index.add(example)
+
+    def select_examples(self, input_variables):
+        return self.index.select(input_variables, self.k, self.max_tokens)
+
+    async def aselect_examples(self, input_variables):
+        # a few microseconds of NumPy, no need for the default thread hop
+        return self.select_examples(input_variables)
+
+
+class ExampleBank:
+    def __init__(self, path=EXAMPLE_BANK_PATH):
+        with open(path, encoding="utf-8") as f:
+            self.sections = json.load(f)
+        self._indexes = {}
+
+    def index(self, section, fields):
+        key = (section, tuple(sorted(fields.items())))
+        if key not in self._indexes:
+            self._indexes[key] = ExampleIndex(self.sections[section], fields)
+        return self._indexes[key]
+
+    def selector(self, section, fields, k, max_tokens):
+        return BankExampleSelector(self.index(section, fields), k, max_tokens)
+
+
+_bank = None
+
+
+def get_example_bank():
+    """The process-wide example bank, loaded on first use."""
+    global _bank
+    if _bank is None:
+        _bank = ExampleBank()
+    return _bank
@@ -0,0 +1,208 @@
+"""
+Input guard: rejects user answers that try to steer the coach out of its role
+("ignore previous instructions", "pretend you're ...", "显示你的提示词").
+
+The phrases live in input_blocklist.json, one list per language. They are
+compiled once into a regex built from a trie of the phrases (two, in fact: one
+for whole-word phrases, one for Chinese, Japanese and Korean), so a scan is a
+pass over the answer whatever the number of phrases. Answers and phrases
+go through the same normalize() first, which undoes the usual obfuscations:
+    full-width / styled letters  ｉｇｎｏｒｅ, 𝐢𝐠𝐧𝐨𝐫𝐞   -> ignore   (NFKD)
+    accents                      ïgnöre              -> ignore
+    Cyrillic / Greek look-alikes іgnоrе             -> ignore
+    leetspeak                    1gn0r3              -> ignore
+    zero-width characters        ig<U+200B>nore      -> ignore
+    punctuation and spacing      i.g.n.o.r.e, i g n o r e -> ignore
+                                 ignore, previous        -> ignore previous
+Punctuation that ends a sentence (. ; ! ? and line breaks) is kept as a " . "
+boundary, so no phrase matches across two sentences; commas and colons are
+spacing like any other. Phrases in scripts written with spaces only match whole
+words, so "switch to developer mode" is not found in "switch to developer modes".
+Letters spelled out one by one lose the spaces between words as well
+("i g n o r e p r e v i o u s" -> "ignoreprevious"), so such runs are also
+searched for the phrases with their spaces taken out.
+
+    guard = get_input_guard()
+    guard.scan("Please IGN0RE previous orders")   # -> "ignore previous"
+"""
+import json
+import os
+import re
+import unicodedata
+
+BLOCKLIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "input_blocklist.json")
+# answers asked for before the question is given up on
+MAX_ATTEMPTS = 3
+
+
+class InputRejected(Exception):
+    """Every attempt at answering a question contained a blocked phrase."""
+
+
+# runs of punctuation and spaces, except the single spaces that are already fine
+_SEPARATORS = re.compile(r"[^\w ][\W_]*|_[\W_]*| [\W_]+")
+# punctuation that ends a sentence
+_SENTENCE_MARK = re.compile(r"[.;!?¡¿\n。]")
+_SINGLE_BEFORE = re.compile(r"\W\w")
+_SINGLE_AFTER = re.compile(r"\w\W?")
+# three or more single characters in a row: " i g n o r e"
+_SPELLED_OUT = re.compile(r" \w(?: \w(?![^ ])){2,}")
+# scripts written without spaces between words (Han, kana, Hangul): no word boundaries there
+_UNSPACED = re.compile(r"[\u1100-\u11ff\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+_FOLD = {
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "ё": "e", "і": "i", "ї": "i", "ј": "j", "к": "k", "м": "m", "н": "h",
+    "о": "o", "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w",
+    # Greek
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "τ": "t",
+    "υ": "u", "χ": "x", "ω": "w",
+    # Latin look-alikes NFKD leaves alone
+    "ı": "i", "ɡ": "g", "ł": "l", "ø": "o", "đ": "d",
+    # leetspeak
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s",
+    # invisible characters
+    "\u200b": "", "\u200c": "", "\u200d": "", "\u2060": "", "\ufeff": "", "\u00ad": "",
+}
+# the folded characters and the accents NFKD splits off
+_FOLDABLE = re.compile("[" + re.escape("".join(_FOLD)) + "\u0300-\u036f]")
+
+
+def _fold(match):
+    return _FOLD.get(match.group(), "")
+
+
+def _separate(match):
+    run = match.group()
+    if _SENTENCE_MARK.search(run) is None:
+        return " "
+    # dots between single characters (i.g.n.o.r.e) hide a word, they do not end a sentence
+    text, start, end = match.string, match.start(), match.end()
+    if _SINGLE_BEFORE.fullmatch(text, max(start - 2, 0), start) and _SINGLE_AFTER.fullmatch(text, end, end + 2):
+        return " "
+    return " . "
+
+
+def _join(match):
+    return " " + match.group().replace(" ", "")
+
+
+def _spaced(text):
+    """normalize() up to, not including, putting spelled-out words back together."""
+    # a regex only touching the characters to fold beats str.translate on long non-ASCII text
+    text = _FOLDABLE.sub(_fold, unicodedata.normalize("NFKD", text).casefold())
+    if not text.isascii():
+        # put Hangul and kana back together
+        text = unicodedata.normalize("NFC", text)
+    return _SEPARATORS.sub(_separate, " " + text)
+
+
+def normalize(text):
+    """
+    The form answers and phrases are matched in (see the module docstring): lower case,
+    ASCII look-alikes folded, words separated by single spaces (" . " at sentence punctuation)
+    and a space before the first.
+    """
+    return _SPELLED_OUT.sub(_join, _spaced(text))
+
+
+def _word_edge(char):
+    return char.isalnum() and not _UNSPACED.match(char)
+
+
+def _compile(phrases, whole_words=True):
+    """
+    One regex matching any of the (normalized) phrases; alternatives share their prefixes.
+    With whole_words=False a phrase also matches at the start of a longer word.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def branch(node, last):
+        alternatives = []
+        if "" in node:
+            # end of a phrase; tried before the longer phrases it starts
+            alternatives.append(r"(?!\w)" if whole_words and _word_edge(last) else "")
+        for char in sorted(key for key in node if key):
+            alternatives.append(re.escape(char) + branch(node[char], char))
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return "(?:" + "|".join(alternatives) + ")"
+
+    return re.compile(branch(trie, ""))
+
+
+def _compile_all(phrases):
+    """
+    Normalized text has a space before every word, so phrases that have to start a word are
+    searched for as " " + phrase: a regex starting with one literal character lets the regex
+    engine skip ahead to the next space. Phrases in unspaced scripts get a regex of their own.
+    """
+    words = [" " + phrase for phrase in phrases if _word_edge(phrase[0])]
+    others = [phrase for phrase in phrases if not _word_edge(phrase[0])]
+    return [_compile(group) for group in (words, others) if group]
+
+
+class InputGuard:
+    def __init__(self, phrases, max_attempts=MAX_ATTEMPTS):
+        # normalized form -> phrase as written in the blocklist
+        self.phrases = {}
+        for phrase in phrases:
+            key = normalize(phrase).strip()
+            if key:
+                self.phrases.setdefault(key, phrase)
+        self.max_attempts = max_attempts
+        self._patterns = _compile_all(self.phrases)
+        # the same phrases without spaces, for words spelled out letter by letter
+        self.unspaced = {}
+        for key, phrase in self.phrases.items():
+            if _word_edge(key[0]):
+                self.unspaced.setdefault(key.replace(" ", ""), phrase)
+        self._unspaced = _compile(self.unspaced, whole_words=False) if self.unspaced else None
+
+    @classmethod
+    def from_file(cls, path=BLOCKLIST_PATH, **kwargs):
+        """Load a blocklist file: {"en": [...], "zh": [...], ...} or a plain list."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = [phrase for phrases in data.values() for phrase in phrases]
+        return cls(data, **kwargs)
+
+    def scan(self, text):
+        """The first blocked phrase found in `text`, or None."""
+        if not self._patterns or not text:
+            return None
+        text = _spaced(text)
+        runs = []
+
+        def join(match):
+            runs.append(match.group().replace(" ", ""))
+            return " " + runs[-1]
+
+        text = _SPELLED_OUT.sub(join, text)
+        for pattern in self._patterns:
+            match = pattern.search(text)
+            if match:
+                return self.phrases[match.group().lstrip(" ")]
+        for run in runs:
+            # a spelled-out run is one word now, whatever words it spelled
+            match = self._unspaced.search(run) if self._unspaced else None
+            if match:
+                return self.unspaced[match.group()]
+        return None
+
+
+_guard = None
+
+
+def get_input_guard():
+    """The guard shared by all MBTIBot instances in this process, compiled on first use."""
+    global _guard
+    if _guard is None:
+        _guard = InputGuard.from_file()
+    return _guard
@@ -0,0 +1,189 @@
+"""
+Per-call instrumentation for the LLM calls MBTIBot makes.
+
+Every call produces one record:
+    stage, template, latency, retries, prompt_tokens, completion_tokens, cached_tokens,
+    prefix_hash, prefix_tokens, cache, error
+`cache` is one of "hit", "miss", "bypass" (prompt not cached), "speculated"
+(served by a speculative prefetch), "speculative" (the prefetch call itself),
+"precomputed" (answered from the compatibility store, no request made),
+"coalesced" (waited for another session's identical request), "pooled"
+(served from the variant pool) or "pool_fill" (a request filling the pool).
+`cached_tokens` are the prompt tokens the provider served from its prompt cache;
+`prefix_hash` identifies the prompt's prefix before the user's data (see
+promptLayout.py) and is None for records without a request.
+
+Records are handed to sinks, which are plain callables taking the record dict.
+Three sinks come with this module: PrometheusExporter, which aggregates records
+into Prometheus text format, JsonLinesSink, which appends one JSON object
+per call, and PrefixStats, which tracks prompt prefixes and cached tokens per
+stage. When the layer is disabled MBTIBot skips all timing and token
+collection, so the only cost is one attribute check per call. Token counts
+come from usageCallback.UsageCallback, which is only imported once enabled.
+"""
+import json
+import os
+import threading
+import time
+
+
+class Instrumentation:
+    def __init__(self, sinks=None, enabled=None):
+        self.sinks = list(sinks or [])
+        # enabled by default as soon as there is somewhere to send records
+        self.enabled = bool(self.sinks) if enabled is None else enabled
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        self.enabled = True
+        return sink
+
+    def record(self, **fields):
+        if not self.enabled:
+            return
+        fields.setdefault("timestamp", time.time())
+        for sink in self.sinks:
+            sink(fields)
+
+
+class PrometheusExporter:
+    """Sink that keeps counters and a latency histogram and renders them in Prometheus text format."""
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, prefix="mbti_llm"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._calls = {}       # (stage, template, cache) -> count
+        self._errors = {}      # (stage, template, error) -> count
+        self._retries = {}     # (stage, template) -> count
+        self._tokens = {}      # (stage, template, kind) -> count
+        self._latency = {}     # (stage, template) -> [bucket counts..., sum, count]
+
+    def __call__(self, record):
+        stage, template = record.get("stage") or "", record.get("template") or ""
+        with self._lock:
+            key = (stage, template, record.get("cache") or "")
+            self._calls[key] = self._calls.get(key, 0) + 1
+            if record.get("error"):
+                key = (stage, template, record["error"])
+                self._errors[key] = self._errors.get(key, 0) + 1
+            self._retries[(stage, template)] = self._retries.get((stage, template), 0) + record.get("retries", 0)
+            for kind in ("prompt", "completion", "cached"):
+                key = (stage, template, kind)
+                self._tokens[key] = self._tokens.get(key, 0) + record.get(f"{kind}_tokens", 0)
+            hist = self._latency.setdefault((stage, template), [0] * len(self.BUCKETS) + [0.0, 0])
+            latency = record.get("latency", 0.0)
+            for i, bound in enumerate(self.BUCKETS):
+                if latency <= bound:
+                    hist[i] += 1
+            hist[-2] += latency
+            hist[-1] += 1
+
+    @staticmethod
+    def _labels(**labels):
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+    def render(self):
+        p = self.prefix
+        lines = []
+        with self._lock:
+            lines += [f"# HELP {p}_calls_total LLM calls by stage, prompt template and cache outcome.",
+                      f"# TYPE {p}_calls_total counter"]
+            for (stage, template, cache), n in sorted(self._calls.items()):
+                lines.append(f"{p}_calls_total{self._labels(stage=stage, template=template, cache=cache)} {n}")
+            lines += [f"# HELP {p}_errors_total Failed LLM calls.", f"# TYPE {p}_errors_total counter"]
+            for (stage, template, error), n in sorted(self._errors.items()):
+                lines.append(f"{p}_errors_total{self._labels(stage=stage, template=template, error=error)} {n}")
+            lines += [f"# HELP {p}_retries_total Retried LLM requests.", f"# TYPE {p}_retries_total counter"]
+            for (stage, template), n in sorted(self._retries.items()):
+                lines.append(f"{p}_retries_total{self._labels(stage=stage, template=template)} {n}")
+            lines += [f"# HELP {p}_tokens_total Prompt, completion and cached prompt tokens.", f"# TYPE {p}_tokens_total counter"]
+            for (stage, template, kind), n in sorted(self._tokens.items()):
+                lines.append(f"{p}_tokens_total{self._labels(stage=stage, template=template, kind=kind)} {n}")
+            lines += [f"# HELP {p}_latency_seconds LLM call latency.", f"# TYPE {p}_latency_seconds histogram"]
+            for (stage, template), hist in sorted(self._latency.items()):
+                for bound, n in zip(self.BUCKETS, hist):
+                    labels = self._labels(stage=stage, template=template, le=bound)
+                    lines.append(f"{p}_latency_seconds_bucket{labels} {n}")
+                labels = self._labels(stage=stage, template=template, le="+Inf")
+                lines.append(f"{p}_latency_seconds_bucket{labels} {hist[-1]}")
+                labels = self._labels(stage=stage, template=template)
+                lines.append(f"{p}_latency_seconds_sum{labels} {hist[-2]}")
+                lines.append(f"{p}_latency_seconds_count{labels} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write the current metrics to `path` (e.g. for node_exporter's textfile collector)."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+class JsonLinesSink:
+    """Sink that appends every record to a JSON-lines file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrefixStats:
+    """
+    Sink that tracks the prompt prefixes sent per stage and the cached tokens the provider reported.
+    A request whose prefix was already sent is a repeat: the provider could serve that prefix from its cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = set()   # (template, prefix hash)
+        self._stages = {}    # stage -> counters
+
+    def __call__(self, record):
+        if not record.get("prefix_hash"):
+            return
+        key = (record.get("template"), record["prefix_hash"])
+        with self._lock:
+            stats = self._stages.setdefault(record.get("stage") or "", {
+                "requests": 0, "prefixes": 0, "repeats": 0,
+                "prompt_tokens": 0, "prefix_tokens": 0, "cached_tokens": 0})
+            stats["requests"] += 1
+            if key in self._seen:
+                stats["repeats"] += 1
+            else:
+                self._seen.add(key)
+                stats["prefixes"] += 1
+            stats["prompt_tokens"] += record.get("prompt_tokens", 0)
+            stats["prefix_tokens"] += record.get("prefix_tokens", 0)
+            stats["cached_tokens"] += record.get("cached_tokens", 0)
+
+    def stats(self):
+        """Per stage: requests, distinct prefixes, repeats, tokens and the share of prompt tokens cached."""
+        with self._lock:
+            result = {}
+            for stage, stats in sorted(self._stages.items()):
+                result[stage] = dict(stats)
+                result[stage]["repeat_rate"] = stats["repeats"] / stats["requests"]
+                result[stage]["cached_share"] = (stats["cached_tokens"] / stats["prompt_tokens"]
+                                                 if stats["prompt_tokens"] else 0.0)
+            return result
+
+
+_instrumentation = Instrumentation()
+
+
+def get_instrumentation():
+    """Return the process-wide instrumentation (disabled until a sink is added)."""
+    return _instrumentation
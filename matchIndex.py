@@ -0,0 +1,342 @@
+"""
+User-to-user matchmaking over MBTI type, relationship goal and hobbies.
+
+Profiles are stored column by column in NumPy arrays (row = user): the type
+index, the goal category (compatibilityStore.CATEGORIES, or "other"), the
+hobbies as a HOBBY_BITS-bit hashed set packed into uint64 words, and the
+number of set bits.
+
+Rows live in two segments:
+- the main segment, sorted by (goal, type). Its inverted index is an array of
+  offsets, so all users with one goal, or one goal and type, are a contiguous
+  slice;
+- a small delta segment holding rows added since the last compact(), indexed
+  by per-(goal, type) posting lists.
+An update that changes goal or type retires the old row and appends a new one.
+compact() merges the delta into the main segment. It runs automatically when
+the delta grows past a fraction of the main segment, and on save().
+
+The index can be used from several threads; a lock makes every call atomic.
+On an event loop use aupsert(): the update runs on a worker thread and a
+compaction it makes due runs as a single background task, so a loop serving
+many sessions is never stalled by it (or by building the id -> row map).
+
+top_k() only looks at users with the same goal. It visits their type slices
+from the most to the least compatible type (the matrices from
+compatibilityStore.py) and scores each slice in one vectorized pass:
+
+    score = TYPE_WEIGHT * compatibility(type, other type) + HOBBY_WEIGHT * hobby Jaccard
+
+It stops once a type's best possible score cannot beat the current k-th best.
+
+save() writes one .npy file per column into a directory. load() maps them
+copy-on-write, so opening a large index reads nothing up front. The user id ->
+row map is only built when something needs it (upsert, remove, top_k_for,
+exclude).
+
+    index = MatchIndex.load("matches") if os.path.isdir("matches") else MatchIndex()
+    index.upsert("u1", "INFP", "close friends", "hiking, board games")
+    index.top_k("INTJ", "friend", "chess, hiking", k=10)
+"""
+import asyncio
+import json
+import os
+import re
+import shutil
+import threading
+import zlib
+from array import array
+
+import numpy as np
+
+from compatibilityStore import CATEGORIES, SCORING_RULES, TYPES, bucket_goal, score
+
+INDEX_VERSION = 1
+HOBBY_BITS = 256
+ID_WIDTH = 48          # bytes per stored user id
+TYPE_WEIGHT = 0.6
+HOBBY_WEIGHT = 0.4
+# compact once the delta segment is this large compared with the main segment
+DELTA_FRACTION = 0.05
+MIN_DELTA = 10000
+
+GOALS = tuple(CATEGORIES) + ("other",)
+_TYPE_INDEX = {t: i for i, t in enumerate(TYPES)}
+_GOAL_INDEX = {g: i for i, g in enumerate(GOALS)}
+_BUCKETS = len(GOALS) * len(TYPES)
+# goal x user type x other type; goals without a category are matched like friendships
+_COMPATIBILITY = np.array([
+    [[score(user, other, goal if goal in SCORING_RULES else "friend") for other in TYPES] for user in TYPES]
+    for goal in GOALS
+], dtype=np.float32)
+
+_HOBBY_SPLIT = re.compile(r"\s*(?:,|;|/|\band\b|&|\n)\s*")
+_WORD = re.compile(r"[a-z0-9']+")
+_COLUMNS = ("ids", "mbti", "goal", "hobbies", "hobby_count")
+
+
+def encode_hobbies(text, bits=HOBBY_BITS):
+    """Hash every hobby phrase and every word in it into a `bits`-bit set (uint64 words)."""
+    words = np.zeros(bits // 64, dtype=np.uint64)
+    for phrase in _HOBBY_SPLIT.split((text or "").lower()):
+        tokens = _WORD.findall(phrase)
+        for token in set(tokens) | ({" ".join(tokens)} if len(tokens) > 1 else set()):
+            bit = zlib.crc32(token.encode()) % bits
+            words[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+    return words
+
+
+def goal_index(goal):
+    """Goal category index for a category name or free-text goal."""
+    if goal in _GOAL_INDEX:
+        return _GOAL_INDEX[goal]
+    return _GOAL_INDEX[bucket_goal(goal) or "other"]
+
+
+def _popcount(words):
+    return np.bitwise_count(words).sum(axis=-1, dtype=np.uint16)
+
+
+class MatchIndex:
+    def __init__(self, capacity=1024, hobby_bits=HOBBY_BITS):
+        self.hobby_bits = hobby_bits
+        self._ids = np.zeros(capacity, dtype=f"S{ID_WIDTH}")
+        self._mbti = np.zeros(capacity, dtype=np.uint8)
+        self._goal = np.zeros(capacity, dtype=np.uint8)
+        # column-major, so each hobby word is a contiguous column for the scoring pass
+        self._hobbies = np.zeros((capacity, hobby_bits // 64), dtype=np.uint64, order="F")
+        self._hobby_count = np.zeros(capacity, dtype=np.uint16)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._size = 0               # rows in use, main + delta
+        self._main = 0               # rows [0, _main) are the sorted main segment
+        self._offsets = np.zeros(_BUCKETS + 1, dtype=np.int64)   # bucket b is rows offsets[b]:offsets[b+1]
+        self._postings = {}          # bucket -> array("q") of delta rows
+        self._row_map = None         # user id -> active row, built on demand
+        self._count = 0              # active users
+        self._lock = threading.RLock()
+        self._compaction = None      # background compact() started by aupsert()
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return user_id in self._rows
+
+    @property
+    def _rows(self):
+        if self._row_map is None:
+            ids = self._ids[:self._size].tolist()
+            self._row_map = {ids[row].decode("utf-8"): row for row in np.flatnonzero(self._active[:self._size]).tolist()}
+        return self._row_map
+
+    def _grow(self, needed):
+        capacity = len(self._mbti)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity + capacity // 2, 1024)
+        for name in _COLUMNS + ("active",):
+            old = getattr(self, f"_{name}")
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype, order="F")
+            new[:self._size] = old[:self._size]
+            setattr(self, f"_{name}", new)
+
+    def _append(self, user_id, key, t, g, words):
+        row = self._size
+        self._grow(row + 1)
+        self._size += 1
+        self._ids[row], self._mbti[row], self._goal[row] = key, t, g
+        self._hobbies[row], self._hobby_count[row] = words, _popcount(words)
+        self._active[row] = True
+        self._postings.setdefault(g * len(TYPES) + t, array("q")).append(row)
+        self._rows[user_id] = row
+        self._count += 1
+
+    def upsert(self, user_id, mbti, goal, hobbies):
+        """Add or update one user. `goal` is a category name or free text, `hobbies` free text."""
+        with self._lock:
+            self._upsert(user_id, mbti, goal, hobbies)
+            if self._compact_due():
+                self.compact()
+
+    async def aupsert(self, user_id, mbti, goal, hobbies):
+        """upsert() for code on an event loop: runs on a worker thread, compacts in the background."""
+        await asyncio.to_thread(self._locked_upsert, user_id, mbti, goal, hobbies)
+        if self._compact_due() and (self._compaction is None or self._compaction.done()):
+            self._compaction = asyncio.ensure_future(asyncio.to_thread(self.compact))
+
+    def _locked_upsert(self, user_id, mbti, goal, hobbies):
+        with self._lock:
+            self._upsert(user_id, mbti, goal, hobbies)
+
+    def _compact_due(self):
+        return self._size - self._main > max(MIN_DELTA, DELTA_FRACTION * self._main)
+
+    def _upsert(self, user_id, mbti, goal, hobbies):
+        if mbti not in _TYPE_INDEX:
+            raise ValueError(f"Unknown MBTI type: {mbti!r}")
+        key = user_id.encode("utf-8")
+        if len(key) > ID_WIDTH:
+            raise ValueError(f"User id longer than {ID_WIDTH} bytes: {user_id!r}")
+        t, g = _TYPE_INDEX[mbti], goal_index(goal)
+        words = encode_hobbies(hobbies, self.hobby_bits)
+        row = self._rows.get(user_id)
+        if row is not None and self._mbti[row] == t and self._goal[row] == g:
+            self._hobbies[row], self._hobby_count[row] = words, _popcount(words)
+            return
+        if row is not None:
+            # moves to another bucket: retire the old row
+            self._active[row] = False
+            self._count -= 1
+        self._append(user_id, key, t, g, words)
+
+    def remove(self, user_id):
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            if row is not None:
+                self._active[row] = False
+                self._count -= 1
+
+    def profile(self, user_id):
+        with self._lock:
+            row = self._rows[user_id]
+            return {"user_id": user_id, "mbti": TYPES[self._mbti[row]], "goal": GOALS[self._goal[row]]}
+
+    def top_k(self, mbti, goal, hobbies, k=10, exclude=None):
+        """The k best matches as (user id, score), best first. `exclude` is a user id to leave out."""
+        query = encode_hobbies(hobbies, self.hobby_bits)
+        with self._lock:
+            exclude_row = self._rows.get(exclude, -1) if exclude is not None else -1
+            return self._top_k(_TYPE_INDEX[mbti], goal_index(goal), query, k, exclude_row)
+
+    def top_k_for(self, user_id, k=10):
+        """Matches for a user already in the index."""
+        with self._lock:
+            row = self._rows[user_id]
+            return self._top_k(int(self._mbti[row]), int(self._goal[row]), self._hobbies[row].copy(), k, row)
+
+    def _score(self, rows, type_scores, query, query_count):
+        """Scores of `rows` (a slice or an index array); retired rows get -inf."""
+        shared = np.bitwise_count(self._hobbies[rows, 0] & query[0]).astype(np.uint16)
+        for word in range(1, len(query)):
+            shared += np.bitwise_count(self._hobbies[rows, word] & query[word])
+        union = self._hobby_count[rows] + query_count - shared
+        scores = shared.astype(np.float32)
+        scores /= np.maximum(union, 1).astype(np.float32)
+        scores *= HOBBY_WEIGHT
+        scores += type_scores
+        return np.where(self._active[rows], scores, np.float32(-np.inf))
+
+    def _top_k(self, t, g, query, k, exclude_row):
+        type_scores = TYPE_WEIGHT * _COMPATIBILITY[g, t]
+        query_count = int(_popcount(query))
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        # types from most to least compatible; each is a slice of the main segment plus its delta postings
+        for other in np.argsort(-type_scores, kind="stable").tolist():
+            if len(best_scores) == k and type_scores[other] + HOBBY_WEIGHT <= best_scores.min():
+                break   # no user of this or any less compatible type can make the top k
+            bucket = g * len(TYPES) + other
+            start, end = int(self._offsets[bucket]), int(self._offsets[bucket + 1])
+            parts = []
+            if end > start:
+                parts.append((np.arange(start, end), self._score(slice(start, end), type_scores[other],
+                                                                 query, query_count)))
+            if self._postings.get(bucket):
+                delta = np.frombuffer(self._postings[bucket], dtype=np.int64)
+                parts.append((delta, self._score(delta, type_scores[other], query, query_count)))
+            for rows, scores in parts:
+                if exclude_row >= 0:
+                    scores[rows == exclude_row] = -np.inf
+                if len(scores) > k:
+                    keep = np.argpartition(-scores, k - 1)[:k]
+                    rows, scores = rows[keep], scores[keep]
+                best_rows = np.concatenate([best_rows, rows])
+                best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                keep = np.argpartition(-best_scores, k - 1)[:k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+        order = np.argsort(-best_scores, kind="stable")
+        return [(self._ids[r].decode("utf-8"), float(s))
+                for r, s in zip(best_rows[order].tolist(), best_scores[order].tolist()) if s != -np.inf]
+
+    def insert_many(self, user_ids, mbti, goals, hobby_words):
+        """
+        Bulk insert of new users from arrays: type indexes, goal indexes and encoded hobbies
+        (shape n x HOBBY_BITS/64), followed by one compact(). Used for large batches, e.g. by the benchmark.
+        """
+        with self._lock:
+            n = len(user_ids)
+            start = self._size
+            self._grow(start + n)
+            self._ids[start:start + n] = np.asarray(user_ids, dtype=f"S{ID_WIDTH}")
+            self._mbti[start:start + n] = mbti
+            self._goal[start:start + n] = goals
+            self._hobbies[start:start + n] = hobby_words
+            self._hobby_count[start:start + n] = _popcount(hobby_words)
+            self._active[start:start + n] = True
+            self._size += n
+            self._count += n
+            if self._row_map is not None:
+                for user_id in user_ids:
+                    old = self._row_map.pop(user_id, None)
+                    if old is not None:
+                        self._active[old] = False
+                        self._count -= 1
+                self._row_map.update(zip(user_ids, range(start, start + n)))
+            self.compact()
+
+    def compact(self):
+        """Merge the delta segment into the main segment and drop retired rows."""
+        with self._lock:
+            keep = np.flatnonzero(self._active[:self._size])
+            buckets = self._goal[keep].astype(np.int64) * len(TYPES) + self._mbti[keep]
+            order = keep[np.argsort(buckets, kind="stable")]
+            for name in _COLUMNS:
+                column = getattr(self, f"_{name}")
+                merged = np.zeros((max(len(order), 1024),) + column.shape[1:], dtype=column.dtype, order="F")
+                merged[:len(order)] = column[order]
+                setattr(self, f"_{name}", merged)
+            self._active = np.zeros(len(self._mbti), dtype=bool)
+            self._active[:len(order)] = True
+            self._size = self._main = self._count = len(order)
+            counts = np.bincount(np.sort(buckets), minlength=_BUCKETS)
+            self._offsets = np.concatenate([[0], np.cumsum(counts)])
+            self._postings = {}
+            self._row_map = None
+
+    def save(self, directory):
+        """Compact and write the index to `directory` (replaced as a whole)."""
+        with self._lock:
+            self.compact()
+            tmp = f"{directory}.tmp"
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            for name in _COLUMNS:
+                np.save(os.path.join(tmp, f"{name}.npy"), getattr(self, f"_{name}")[:self._size])
+            np.save(os.path.join(tmp, "offsets.npy"), self._offsets)
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "size": self._size, "hobby_bits": self.hobby_bits,
+                           "goals": GOALS, "types": TYPES}, f)
+            old = f"{directory}.old"
+            shutil.rmtree(old, ignore_errors=True)
+            if os.path.exists(directory):
+                os.replace(directory, old)
+            os.replace(tmp, directory)
+            # files mapped by a loaded index stay readable until it lets go of them
+            shutil.rmtree(old, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["version"] != INDEX_VERSION or meta["goals"] != list(GOALS) or meta["types"] != TYPES:
+            raise ValueError(f"{directory} was written by an incompatible MatchIndex")
+        index = cls(capacity=0, hobby_bits=meta["hobby_bits"])
+        # copy-on-write: pages are read on first touch, changes stay in memory until save()
+        for name in _COLUMNS:
+            setattr(index, f"_{name}", np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="c"))
+        index._offsets = np.load(os.path.join(directory, "offsets.npy"))
+        index._size = index._main = index._count = meta["size"]
+        index._active = np.ones(index._size, dtype=bool)
+        return index
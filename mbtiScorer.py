@@ -0,0 +1,132 @@
+"""
+Deterministic MBTI scoring for the four-question path of learn_mbti.
+
+Q1-Q4 map one-to-one onto the MBTI dichotomies (alone/social, logic/emotion,
+plan/flow, details/big picture). Each answer is scored against a small keyword
+lexicon per pole. The result is a letter and a confidence in [0, 1] per axis.
+Only axes whose confidence is below a threshold need an LLM tie-break.
+"""
+import re
+
+MBTI_TYPES = {
+    "INFP", "INFJ", "INTJ", "INTP",
+    "ISFP", "ISTP", "ISFJ", "ISTJ",
+    "ENFP", "ENFJ", "ENTJ", "ENTP",
+    "ESFP", "ESFJ", "ESTP", "ESTJ",
+}
+
+# (axis name, letter position in the type, question it comes from, poles)
+# each pole: letter, short description (used in the tie-break prompt), keywords
+AXES = [
+    ("EI", 0, "Do you prefer being alone or in social settings?", [
+        ("E", "energized by social settings", [
+            "social", "people", "group", "gathering", "party", "parties", "crowd", "friends", "together",
+            "outgoing", "extrovert", "the more the merrier", "go out", "hang out", "meet", "team",
+        ]),
+        ("I", "recharges alone", [
+            "alone", "by myself", "on my own", "solitude", "quiet", "peaceful", "home", "introvert",
+            "small group", "one-on-one", "one on one", "recharge", "me time", "independent",
+        ]),
+    ]),
+    ("SN", 1, "Do you focus more on details or the big picture?", [
+        ("S", "focuses on concrete details", [
+            "detail", "small things", "specific", "facts", "practical", "concrete", "notice",
+            "step by step", "precise", "accuracy",
+        ]),
+        ("N", "focuses on the big picture", [
+            "big picture", "overall", "direction", "vision", "idea", "possibilities", "future",
+            "abstract", "patterns", "concept", "small stuff",
+        ]),
+    ]),
+    ("TF", 2, "When making decisions, do you rely more on logic or emotion?", [
+        ("T", "decides with logic", [
+            "logic", "logical", "reason", "rational", "facts", "analysis", "analyze", "objective", "data",
+            "pros and cons", "head", "robots",
+        ]),
+        ("F", "decides with emotion and values", [
+            "emotion", "emotional", "feel", "feeling", "heart", "gut", "values", "empathy",
+            "care", "people's", "intuition", "human",
+        ]),
+    ]),
+    ("JP", 3, "Do you like to plan ahead or go with the flow?", [
+        ("J", "likes to plan ahead", [
+            "plan", "planner", "planning", "schedule", "organized", "organised", "list", "ahead",
+            "excel", "structure", "prepare", "routine",
+        ]),
+        ("P", "goes with the flow", [
+            "flow", "spontaneous", "go with", "as they come", "flexible", "improvise", "whatever",
+            "last minute", "wing it", "adapt", "no plan",
+        ]),
+    ]),
+]
+
+# which question each axis is asked in
+QUESTION_KEYS = {"EI": "Q1", "TF": "Q2", "JP": "Q3", "SN": "Q4"}
+
+_NEGATIONS = {"not", "no", "never", "dont", "don't", "hardly", "rarely", "without"}
+_WORD = re.compile(r"[a-z']+")
+_CONTRAST = re.compile(r"\b(?:but|though|although|however|yet)\b")
+
+
+def _pole_score(text, keywords):
+    score = 0.0
+    for keyword in keywords:
+        for match in re.finditer(r"(?<![a-z])" + re.escape(keyword) + r"(?:s|es)?(?![a-z])", text):
+            before = _WORD.findall(text[:match.start()])[-2:]
+            weight = 1.0
+            # whatever comes after "but ..." is what the user actually means
+            if _CONTRAST.search(text[:match.start()]):
+                weight = 2.0
+            if _NEGATIONS.intersection(before):
+                weight = -weight
+            score += weight
+    return score
+
+
+def score_axis(answer, poles):
+    """Return (letter, confidence) for one dichotomy; confidence 0 means no signal at all."""
+    text = (answer or "").lower().replace("’", "'")
+    (first, _, first_words), (second, _, second_words) = poles
+    a = _pole_score(text, first_words)
+    b = _pole_score(text, second_words)
+    # a negated keyword counts for the other pole
+    a, b = max(a, 0.0) + max(-b, 0.0), max(b, 0.0) + max(-a, 0.0)
+    total = a + b
+    if total == 0:
+        return first, 0.0
+    letter = first if a >= b else second
+    return letter, abs(a - b) / total
+
+
+def score_answers(answers):
+    """
+    `answers` maps "Q1".."Q4" to the user's replies.
+    Returns {axis name: (letter, confidence)} in type-letter order.
+    """
+    return {name: score_axis(answers.get(QUESTION_KEYS[name], ""), poles) for name, _, _, poles in AXES}
+
+
+def type_from_scores(scores):
+    letters = [""] * 4
+    for name, position, _, _ in AXES:
+        letters[position] = scores[name][0]
+    mbti = "".join(letters)
+    if not is_valid_type(mbti):
+        raise ValueError(f"Scores produced an invalid MBTI type: {mbti!r}")
+    return mbti
+
+
+def low_confidence_axes(scores, threshold=0.5):
+    return [name for name, _, _, _ in AXES if scores[name][1] < threshold]
+
+
+def axis_info(name):
+    """Return (question, [(letter, description), (letter, description)]) for a tie-break prompt."""
+    for axis_name, _, question, poles in AXES:
+        if axis_name == name:
+            return question, [(letter, description) for letter, description, _ in poles]
+    raise KeyError(name)
+
+
+def is_valid_type(mbti):
+    return (mbti or "").strip().upper() in MBTI_TYPES
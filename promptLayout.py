@@ -0,0 +1,63 @@
+"""
+One layout for every prompt, so providers can cache the prompt prefix.
+
+OpenAI (and most providers) reuse the work done on the longest prompt prefix
+they have seen byte for byte recently; cached tokens are cheaper and come
+back faster. So every template in prompts.py is laid out the same way, most
+stable part first:
+
+    {persona_context}         same for every session with this coach
+    instructions              same for every call of the prompt
+    examples                  few-shot prompts only, picked per request
+    dynamic part              the user's data, ending with the answer cue
+
+with exactly one blank line between sections and no indentation or trailing
+spaces, wherever the template text comes from. Everything before the dynamic
+part is the prompt's prefix; prefix_hash() gives it a short stable id, which
+the instrumentation records with the cached tokens the provider reported
+(see instrumentation.PrefixStats).
+"""
+
+SECTION_SEPARATOR = "\n\n"
+
+
+def clean(text):
+    """`text` without indentation, trailing spaces or leading / trailing blank lines."""
+    return "\n".join(line.strip() for line in text.strip().splitlines())
+
+
+class PromptLayout:
+    __slots__ = ("instructions", "dynamic", "persona")
+
+    def __init__(self, instructions, dynamic, persona=True):
+        self.instructions = clean(instructions)
+        self.dynamic = clean(dynamic)
+        self.persona = persona
+
+    @property
+    def prefix(self):
+        """Template of the static prefix (persona and instructions)."""
+        if self.persona:
+            return "{persona_context}" + SECTION_SEPARATOR + self.instructions
+        return self.instructions
+
+    @property
+    def template(self):
+        """The whole template, for prompts without examples."""
+        return SECTION_SEPARATOR.join(part for part in (self.prefix, self.dynamic) if part)
+
+    def split(self, text, inputs):
+        """(prefix, dynamic part) of the rendered prompt `text`; the prefix is "" if `text` was not built from this layout."""
+        try:
+            dynamic = self.dynamic.format(**inputs)
+        except (KeyError, IndexError, ValueError):
+            return "", text
+        if not text.endswith(dynamic):
+            return "", text
+        return text[:len(text) - len(dynamic)], dynamic
+
+
+def prefix_hash(prefix):
+    import hashlib
+
+    return hashlib.blake2b(prefix.encode("utf-8"), digest_size=8).hexdigest()
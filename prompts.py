@@ -0,0 +1,342 @@
+"""
+Prompt templates used by MBTIBot.
+
+Every template is built once per process by the chain registry (see chainRegistry.py)
+instead of being re-created inside each stage of the conversation.
+LangChain is only imported when the first template is built, so importing this
+module (e.g. for PROMPT_PARAMS) stays cheap.
+Few-shot prompts pick their examples for each request from example_bank.json
+(see exampleBank.py and EXAMPLE_SELECTION below).
+All templates follow one layout, persona and instructions first and the user's
+data last, so the provider can cache the prefix (see promptLayout.py and
+PROMPT_LAYOUTS below).
+"""
+from promptLayout import SECTION_SEPARATOR, PromptLayout
+
+
+def _bank_selector(name):
+    from exampleBank import get_example_bank
+
+    config = EXAMPLE_SELECTION[name]
+    return get_example_bank().selector(name, config["fields"], config["k"], config["max_tokens"])
+
+
+def _template(name):
+    from langchain.prompts import PromptTemplate
+
+    layout = PROMPT_LAYOUTS[name]
+    return PromptTemplate.from_template(layout.template)
+
+
+def _few_shot(name, example_template, example_separator=SECTION_SEPARATOR):
+    from langchain.prompts import PromptTemplate, FewShotPromptTemplate
+
+    # examples go between the instructions and the user's data
+    layout = PROMPT_LAYOUTS[name]
+    return FewShotPromptTemplate(
+        example_selector=_bank_selector(name),
+        example_prompt=PromptTemplate.from_template(example_template),
+        prefix=layout.prefix,
+        suffix=layout.dynamic,
+        input_variables=sorted(PromptTemplate.from_template(layout.template).input_variables),
+        example_separator=example_separator,
+    )
+
+
+def _classification_prompt():
+    return _few_shot("classification", "Q: {dialogue}\nA: {answer}", "\n\n---\n\n")
+
+
+def _direct_mbti_prompt():
+    return _template("direct_mbti")
+
+
+def _intro_prompt():
+    return _template("intro")
+
+
+def _mbti_few_shot_prompt():
+    # examples come from example_bank.json, nearest to the user's answers and type first
+    return _few_shot("mbti_few_shot", "{dialogue}\nMBTI: {mbti}\n\n🧠 Personality Summary:\n{summary}",
+                     "\n\n---\n\n")
+
+
+def _mbti_axis_prompt():
+    # tie-break for one MBTI axis the local scorer (mbtiScorer.py) could not decide
+    return _template("mbti_axis")
+
+
+def _target_guess_prompt():
+    return _few_shot("target_guess", "Description: {description}\nResponse: {output}")
+
+
+def _target_summary_prompt():
+    return _template("target_summary")
+
+
+def _general_matches_prompt():
+    return _template("general_matches")
+
+
+def _compatibility_blurb_prompt():
+    # written offline for compatibilityStore.py, or live when the store has no blurb for this coach
+    return _template("compatibility_blurb")
+
+
+def _bonding_prompt():
+    return _template("bonding")
+
+
+# fused set_goal + boost_connection: the reply is the connection insight, this line, then the suggestions
+SUGGESTIONS_MARKER = "[SUGGESTIONS]"
+
+# what the first part of the fused reply should be, per set_goal path (same asks as target_summary / general_matches)
+GOAL_TASKS = {
+    "target_summary": "Using the user’s MBTI and their relationship goal with a person of the target MBTI, "
+                      "write a short, conversational summary addressed directly to the user (use “you”) "
+                      "that captures their connection goal.",
+    "general_matches": "Given the user's MBTI and their relationship goal, suggest a few compatible MBTI types "
+                       "or personality traits that would align well. Write a short, conversational summary "
+                       "addressed directly to the user (use “you”).",
+}
+
+
+def _goal_and_bonding_prompt():
+    # one request instead of target_summary/general_matches followed by bonding
+    return _template("goal_and_bonding")
+
+
+def _deep_dive_prompt():
+    return _template("deep_dive")
+
+
+def _memory_summary_prompt():
+    return _template("memory_summary")
+
+
+# prompt name -> (instructions, dynamic part): the persona comes first, then the instructions
+# (few-shot examples after them), then the user's data. Anything that changes between calls
+# belongs in the dynamic part, or it splits the provider's prefix cache.
+PROMPT_LAYOUTS = {
+    "classification": PromptLayout(
+        "You are a helpful assistant. Determine if the user knows their MBTI type. "
+        "Only respond with **yes** or **no**.",
+        "Q: {dialogue}\nA:",
+        persona=False,
+    ),
+    "direct_mbti": PromptLayout(
+        """
+        You are a personality assistant. Based on the user's MBTI and hobbies.
+        Guess the most possible MBTI for user and summarize their social style and personal strengths,
+        write this in conversational summary addressed directly to the user (use “you”) in 1-2 short sentences.
+        """,
+        """
+        {dialogue}
+
+        Personality Summary:
+        """,
+    ),
+    "intro": PromptLayout(
+        """
+        Now you’re explaining MBTI to someone who’s never heard of it,
+        and why it can help someone understand their personality in 1–2 sentences
+        """,
+        "",
+    ),
+    "mbti_few_shot": PromptLayout(
+        """
+        You are a personality assistant. The user's MBTI type has already been worked out from their answers.
+        Based on their responses and that type, briefly describe their personality traits, social style, and ideal interactions.
+        Keep it casual, clear. Do not repeat the type letters.
+        """,
+        "{dialogue}\nMBTI: {mbti}\n\nPersonality Summary:",
+    ),
+    "mbti_axis": PromptLayout(
+        "You decide which side of an MBTI axis an answer fits. Reply with the single letter only.",
+        "Question: {question}\nAnswer: {answer}\n\n"
+        "Which fits this answer better: {first} ({first_desc}) or {second} ({second_desc})?",
+        persona=False,
+    ),
+    "target_guess": PromptLayout(
+        "Now, based on the following description of a person, respond in the exact format:\n"
+        "MBTI_TYPE : A one‑sentence summary starting with the plural form of that type.",
+        "Description: {description}\nResponse:",
+    ),
+    "target_summary": PromptLayout(
+        "You are a personality-based matchmaking assistant.\n" + GOAL_TASKS["target_summary"],
+        """
+        {info}
+
+        💡 Relationship Summary:
+        """,
+    ),
+    "general_matches": PromptLayout(
+        "You are a personality-based matchmaking assistant.\n" + GOAL_TASKS["general_matches"],
+        """
+        {info}
+
+        💡 Suggested Matches:
+        """,
+    ),
+    "compatibility_blurb": PromptLayout(
+        "You are a personality-based matchmaking assistant.\n"
+        "In 2-3 short sentences addressed directly to the user (use “you”), suggest the types they match best "
+        "and why they fit.",
+        "The user is an {mbti} looking for a {category} connection. "
+        "By MBTI compatibility their best matches are: {matches}.\n\n"
+        "💡 Suggested Matches:",
+    ),
+    "bonding": PromptLayout(
+        """
+        You are a social chemistry coach.
+        Given the following context, suggest ways the user can connect faster and better with their match or target.
+        """,
+        """
+        {info}
+
+        💬 Suggestions for Quick Bonding:
+        """,
+    ),
+    # {task} is one of the two GOAL_TASKS, so it stays in the prefix
+    "goal_and_bonding": PromptLayout(
+        """
+        You are a personality-based matchmaking assistant and social chemistry coach.
+        Answer in two parts.
+        First: {task}
+        Then write a line containing only """ + SUGGESTIONS_MARKER + """ and after it suggest:
+        1. 2-3 meaningful conversation starters
+        2. 1-2 shared activities or social settings that would help them bond
+        3. 1 short tip on how to move toward deeper connection quickly
+        Keep it concise and friendly. Do not add any other headings.
+        """,
+        """
+        {info}
+
+        💡 Relationship Summary:
+        """,
+    ),
+    # {history} is empty on the first turn, later the earlier turns (see conversationMemory.py)
+    "deep_dive": PromptLayout(
+        """
+        You are a deep-dive social coach helping a user build strong interpersonal connections.
+        Please give personalized, specific and practical suggestions related to the focus area. Include emotional tone if relevant. Be friendly but clear.
+        """,
+        """
+        🧑‍💼 User MBTI: {mbti}
+        🎯 Relationship Goal: {relationship_goal}
+        🤝 Target Info: {target}
+        {history}
+        💬 Focus Area: {topic}
+
+        🧠 Deep Dive Advice:
+        """,
+    ),
+    "memory_summary": PromptLayout(
+        """
+        Progressively summarize a coaching conversation. Add the new exchange to the current summary,
+        keeping the topics the user asked about and the key advice already given. At most 80 words.
+        """,
+        """
+        Current summary:
+        {summary}
+
+        New exchange:
+        {turn}
+
+        New summary:
+        """,
+        persona=False,
+    ),
+}
+
+
+# prompt name -> function that builds the template
+PROMPT_BUILDERS = {
+    "classification": _classification_prompt,
+    "direct_mbti": _direct_mbti_prompt,
+    "intro": _intro_prompt,
+    "mbti_few_shot": _mbti_few_shot_prompt,
+    "mbti_axis": _mbti_axis_prompt,
+    "target_guess": _target_guess_prompt,
+    "target_summary": _target_summary_prompt,
+    "general_matches": _general_matches_prompt,
+    "compatibility_blurb": _compatibility_blurb_prompt,
+    "bonding": _bonding_prompt,
+    "goal_and_bonding": _goal_and_bonding_prompt,
+    "deep_dive": _deep_dive_prompt,
+    "memory_summary": _memory_summary_prompt,
+}
+
+# model parameters used with each prompt
+PROMPT_PARAMS = {
+    # 使用较低温度保证稳定性（只返回 yes/no）
+    "classification": {"temperature": 0, "max_tokens": 1},
+    "direct_mbti": {"temperature": 0.7, "max_tokens": 100},
+    "intro": {"temperature": 0.7, "max_tokens": 100},
+    "mbti_few_shot": {"temperature": 0.7, "max_tokens": 256},
+    "mbti_axis": {"temperature": 0, "max_tokens": 1},
+    "target_guess": {"temperature": 0.7, "max_tokens": 50},
+    "target_summary": {"temperature": 0.7, "max_tokens": 256},
+    "general_matches": {"temperature": 0.7, "max_tokens": 256},
+    "compatibility_blurb": {"temperature": 0.7, "max_tokens": 150},
+    "bonding": {"temperature": 0.7, "max_tokens": 256},
+    "goal_and_bonding": {"temperature": 0.7, "max_tokens": 512},
+    "deep_dive": {"temperature": 0.7, "max_tokens": 256},
+    "memory_summary": {"temperature": 0, "max_tokens": 120},
+}
+
+# prompts whose responses are served from the response cache by default:
+# classification and mbti_axis are temperature 0 and deep dives are often asked the same
+# topic for the same MBTI pair
+CACHED_PROMPTS = {"classification", "mbti_axis", "deep_dive"}
+
+# sampled prompts with so few distinct inputs that many sessions send the very same request:
+# the intro only depends on the persona. They are served from a pool of pre-generated
+# variants (see requestCoalescing.VariantPool) so users still see different texts.
+POOLED_PROMPTS = {"intro"}
+
+# canned replies for when the model cannot be reached (see resilience.py); {opener} is one of the
+# coach's example phrases. Replies that MBTIBot parses keep their format.
+FALLBACK_REPLIES = {
+    "classification": "no",
+    "mbti_axis": "",
+    "target_guess": "UNKNOWN : I can't guess their type right now, so let's look at good matches in general.",
+    "intro": "{opener} MBTI describes your personality with four letters: where you get your energy, "
+             "how you take in information, how you make decisions and how you like to plan. "
+             "Four quick questions will tell us yours.",
+    "direct_mbti": "{opener} Thanks for telling me your type and hobbies. They already say a lot about "
+                   "the kind of people you click with, so let's move on.",
+    "mbti_few_shot": "{opener} Your answers give a clear picture of how you recharge, decide and plan. "
+                     "Let's put it to use.",
+    "bonding": "{opener} Start with a question about something they care about, suggest a small activity "
+               "you both enjoy, and follow up a few days later.",
+}
+DEFAULT_FALLBACK_REPLY = ("{opener} I'm having trouble putting my thoughts together right now. "
+                          "Let's keep going, and ask me again in a moment if you'd like more detail.")
+
+
+# few-shot prompts: which example_bank.json section, which inputs to match examples on (with weights),
+# at most k examples and at most max_tokens (estimated) of examples per request
+EXAMPLE_SELECTION = {
+    "classification": {"fields": {"dialogue": 1.0}, "k": 4, "max_tokens": 48},
+    # the type letters are known before this call; weight them so the same type's example is picked
+    "mbti_few_shot": {"fields": {"dialogue": 1.0, "mbti": 2.0}, "k": 2, "max_tokens": 240},
+    "target_guess": {"fields": {"description": 1.0}, "k": 2, "max_tokens": 120},
+}
+
+
+# multi-turn stages: how much of the conversation their prompts carry (see conversationMemory.py).
+# max_tokens (estimated) bounds the summary plus the turns kept verbatim, keep_turns how many are kept
+CONVERSATION_MEMORY = {
+    "deep_dive": {"max_tokens": 400, "keep_turns": 2},
+}
+
+
+def build_prompt(name):
+    return PROMPT_BUILDERS[name]()
+
+
+def prompt_prefix(name, text, inputs):
+    """The part of the rendered prompt `text` before the user's data: persona, instructions and examples."""
+    layout = PROMPT_LAYOUTS.get(name)
+    return layout.split(text, inputs)[0] if layout is not None else ""
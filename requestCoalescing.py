@@ -0,0 +1,192 @@
+"""
+Sharing model requests between concurrent sessions.
+
+SingleFlight merges identical requests: while a request for a key is in
+flight, every other caller asking for the same key waits for that request
+instead of sending its own. MBTIBot uses it for the cached prompts on a cache
+miss, where the reply is deterministic or meant to be shared anyway.
+
+Sampled prompts that only depend on a tiny input space (the intro only
+depends on the coach, see prompts.POOLED_PROMPTS) must not all show the same
+text, so VariantPool keeps a few pre-generated replies per key instead. They
+are served round-robin, each at most `max_uses` times, and one more is
+generated in the background whenever fewer than `low_water` are left. A caller
+only waits for the model when the pool is empty; then enough requests are sent
+for everyone waiting.
+
+Both count what they do; stats() has the coalescing ratio and the pool hit
+rate. Both are meant to be used from one event loop at a time.
+"""
+import asyncio
+from collections import deque
+
+
+def _in_flight(task):
+    """True if `task` is still running on this loop (sync callers run a new loop per call)."""
+    return task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}  # key -> [task, callers still waiting]
+        self.leaders = 0
+        self.joined = 0
+
+    def in_flight(self, key):
+        """True if a call for `key` is running, so do() would wait for it instead of calling."""
+        entry = self._calls.get(key)
+        return entry is not None and _in_flight(entry[0])
+
+    async def do(self, key, make_coro):
+        """
+        The result of `make_coro()`, or of the identical call already in flight for `key`.
+        When every caller has gone (cancelled), the request is cancelled too.
+        """
+        if self.in_flight(key):
+            entry = self._calls[key]
+            self.joined += 1
+        else:
+            entry = [asyncio.ensure_future(make_coro()), 0]
+            self._calls[key] = entry
+            entry[0].add_done_callback(lambda task: self._forget(key, task))
+            self.leaders += 1
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not entry[0].done():
+                entry[0].cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+    def _forget(self, key, task):
+        entry = self._calls.get(key)
+        if entry is not None and entry[0] is task:
+            del self._calls[key]
+        # the error reaches the callers; don't let asyncio log it as never retrieved
+        task.cancelled() or task.exception()
+
+    def stats(self):
+        requests = self.leaders + self.joined
+        return {
+            "requests": requests,
+            "upstream": self.leaders,
+            "coalesced": self.joined,
+            "coalescing_ratio": self.joined / requests if requests else 0.0,
+        }
+
+
+class _Pool:
+    __slots__ = ("variants", "filling", "waiting")
+
+    def __init__(self):
+        self.variants = deque()  # [text, times served]
+        self.filling = set()     # tasks generating variants
+        self.waiting = 0         # callers waiting for a variant
+
+
+class VariantPool:
+    def __init__(self, size=8, max_uses=4, low_water=None):
+        # at most `size` variants are kept per key; a variant is dropped after `max_uses` serves
+        self.size = size
+        self.max_uses = max_uses
+        self.low_water = size // 2 if low_water is None else low_water
+        self._pools = {}
+        self.takes = 0
+        self.hits = 0
+        self.fills = 0
+        self.fill_errors = 0
+
+    def _pool(self, key):
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = _Pool()
+        # fills started by an event loop that has since closed will never finish
+        pool.filling.difference_update([task for task in pool.filling if not _in_flight(task)])
+        return pool
+
+    def warm(self, key, make_coro):
+        """Start generating a variant for `key` in the background if it has none. True if one was started."""
+        pool = self._pool(key)
+        if pool.variants or pool.filling:
+            return False
+        self._fill(pool, make_coro)
+        return True
+
+    async def take(self, key, make_coro):
+        """
+        A variant for `key`; `make_coro()` generates a new one (a model request returning the text).
+        Returns None when generating failed, the caller then sends its own request.
+        """
+        pool = self._pool(key)
+        self.takes += 1
+        waited = False
+        while not pool.variants:
+            # enough requests in flight to serve everyone waiting, each variant serving max_uses callers
+            pool.waiting += 1
+            needed = min(self.size, -(-pool.waiting // self.max_uses))
+            while len(pool.filling) < needed:
+                self._fill(pool, make_coro)
+            waited = True
+            try:
+                done, _ = await asyncio.wait(pool.filling, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                pool.waiting -= 1
+            if not pool.variants and any(task.cancelled() or task.result() is None for task in done):
+                return None
+        variant = pool.variants.popleft()
+        variant[1] += 1
+        if variant[1] < self.max_uses:
+            pool.variants.append(variant)
+        self.hits += not waited
+        if len(pool.variants) + len(pool.filling) < self.low_water:
+            self._fill(pool, make_coro)
+        return variant[0]
+
+    def _fill(self, pool, make_coro):
+        async def fill():
+            try:
+                text = await make_coro()
+            except Exception:
+                self.fill_errors += 1
+                return None
+            self.fills += 1
+            if len(pool.variants) < self.size:
+                pool.variants.append([text, 0])
+            return text
+
+        task = asyncio.ensure_future(fill())
+        pool.filling.add(task)
+        task.add_done_callback(pool.filling.discard)
+        return task
+
+    async def join(self):
+        """Wait for the variants being generated in the background, e.g. before counting model requests."""
+        while tasks := [task for pool in self._pools.values() for task in pool.filling if _in_flight(task)]:
+            await asyncio.wait(tasks)
+
+    def stats(self):
+        return {
+            "keys": len(self._pools),
+            "variants": sum(len(pool.variants) for pool in self._pools.values()),
+            "takes": self.takes,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.takes if self.takes else 0.0,
+            "fills": self.fills,
+            "fill_errors": self.fill_errors,
+        }
+
+
+_single_flight = SingleFlight()
+_variant_pool = VariantPool()
+
+
+def get_single_flight():
+    """The request coalescer shared by all MBTIBot instances in this process."""
+    return _single_flight
+
+
+def get_variant_pool():
+    """The variant pool shared by all MBTIBot instances in this process."""
+    return _variant_pool
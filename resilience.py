@@ -0,0 +1,354 @@
+"""
+Deadlines, retries, hedged requests and a circuit breaker around every model request.
+
+MBTIBot sends each request through Resilience.acall() (see MBTIBot._acall_model):
+
+- deadline: each request has a time budget that depends on the conversation
+  stage (STAGE_DEADLINES). Retries and hedges must fit in it;
+- retry: failures that look transient (timeouts, connection errors, 429 and
+  5xx responses) are retried up to RetryPolicy.attempts times, sleeping a
+  random backoff ("full jitter") in between, but never past the deadline;
+- hedging, off unless hedge_quantile is set: when a non-streamed request has
+  not answered after the hedge_quantile latency of recent requests with the
+  same prompt, a duplicate is sent and whichever answers first is used;
+- circuit breaker: once breaker_failure_ratio of the recent requests to a
+  model failed, requests to it fail at once for breaker_reset seconds. Then a
+  single trial request decides whether it closes again.
+
+When a request fails for good, or the breaker is open, the reply is degraded:
+to fallback_llm (a cheaper model) if there is one, otherwise to a canned
+prompts.FALLBACK_REPLIES message in the coach's voice. Degraded replies are
+FallbackReply strings, which MBTIBot does not put in the response cache.
+Speculative requests are never retried or degraded; they just fail.
+
+Counters of retries, hedges, missed deadlines, breaker trips and degraded
+replies are kept per prompt. stats() sums them and render() writes them in
+Prometheus text format.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+
+from prompts import DEFAULT_FALLBACK_REPLY, FALLBACK_REPLIES
+
+# seconds one model request may take, retries and hedges included
+STAGE_DEADLINES = {
+    "select_coach": 20.0,     # the speculative intro
+    "learn_mbti": 30.0,
+    "set_goal": 45.0,
+    "boost_connection": 45.0,
+    "deep_dive": 45.0,
+}
+DEFAULT_DEADLINE = 60.0
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# transient errors of the openai / httpx clients, matched by name so neither is imported here
+_RETRYABLE_ERRORS = {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError",
+                     "ConnectError", "ConnectTimeout", "ReadTimeout", "ReadError", "RemoteProtocolError"}
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class FallbackReply(str):
+    """A reply that did not come from the primary model: the fallback model's or a canned one."""
+
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return type(error).__name__ in _RETRYABLE_ERRORS
+
+
+def fallback_reply(prompt_name, profile=None):
+    """The canned reply for `prompt_name`, opened with one of the coach's example phrases."""
+    phrases = profile["speaking_style"]["example_phrases"] if profile else []
+    opener = random.choice(phrases) if phrases else ""
+    return FALLBACK_REPLIES.get(prompt_name, DEFAULT_FALLBACK_REPLY).format(opener=opener).strip()
+
+
+def _model_name(llm):
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+class RetryPolicy:
+    def __init__(self, attempts=3, base_delay=0.25, max_delay=4.0, seed=None):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = random.Random(seed)
+
+    def delay(self, retry):
+        # full jitter: anywhere between 0 and the exponential backoff, so retries from many
+        # sessions hit by the same brownout don't arrive together
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+
+class LatencyTracker:
+    """Latencies of the last `window` successful requests, per prompt and over all prompts."""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}       # prompt -> deque; None -> every prompt
+
+    def add(self, key, seconds):
+        for k in (key, None):
+            samples = self._samples.get(k)
+            if samples is None:
+                samples = self._samples[k] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def quantile(self, key, q, min_samples=50):
+        """
+        The q-quantile of the recent latencies of `key`, or of all prompts while `key` has
+        fewer than min_samples; None until there are that many samples at all.
+        """
+        samples = self._samples.get(key)
+        if samples is None or len(samples) < min_samples:
+            samples = self._samples.get(None)
+            if samples is None or len(samples) < min_samples:
+                return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """
+    Opens when at least `failure_ratio` of the last `window` requests failed (once there are
+    `min_requests` of them). After `reset_after` seconds one trial request is let through:
+    it closes the breaker if it succeeds and opens it again if it fails.
+    """
+
+    def __init__(self, failure_ratio=0.5, window=40, min_requests=20, reset_after=30.0, clock=time.monotonic):
+        self.failure_ratio = failure_ratio
+        self.min_requests = min_requests
+        self.reset_after = reset_after
+        self.clock = clock
+        self.state = "closed"
+        self._outcomes = deque(maxlen=window)   # True for a failed request
+        self._opened_at = 0.0
+        self._trial = False      # a half-open trial request is in flight
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if self.clock() - self._opened_at < self.reset_after:
+                return False
+            self.state = "half_open"
+            self._trial = False
+        if self._trial:
+            return False
+        self._trial = True
+        return True
+
+    def success(self):
+        if self.state == "half_open":
+            self.state = "closed"
+            self._outcomes.clear()
+        self._trial = False
+        self._outcomes.append(False)
+
+    def failure(self):
+        """Count a failed request; returns True when this failure opened the breaker."""
+        self._outcomes.append(True)
+        if self.state == "closed":
+            if len(self._outcomes) < self.min_requests or sum(self._outcomes) < self.failure_ratio * len(self._outcomes):
+                return False
+        elif self.state == "open":
+            return False    # a request started before the breaker opened
+        self.state = "open"
+        self._opened_at = self.clock()
+        self._trial = False
+        return True
+
+    def abandon(self):
+        # the trial request ended without telling us anything about the model
+        self._trial = False
+
+
+class Resilience:
+    def __init__(self, deadlines=None, default_deadline=DEFAULT_DEADLINE, retry=None, hedge_quantile=None,
+                 hedge_min_samples=50, breaker_failure_ratio=0.5, breaker_reset=30.0, fallback_llm=None):
+        self.deadlines = {**STAGE_DEADLINES, **(deadlines or {})}
+        self.default_deadline = default_deadline
+        self.retry = retry or RetryPolicy()
+        # e.g. 0.95: duplicate a request still running after the p95 latency of its prompt.
+        # With few samples the quantile is the slowest one seen, so hedging waits for hedge_min_samples.
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker_failure_ratio = breaker_failure_ratio
+        self.breaker_reset = breaker_reset
+        # cheaper model answering while the primary one fails; None means canned replies
+        self.fallback_llm = fallback_llm
+        self.latency = LatencyTracker()
+        self._breakers = {}      # model name -> CircuitBreaker
+        self.counters = {}       # (event, prompt) -> count
+
+    def breaker(self, llm):
+        name = _model_name(llm)
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = CircuitBreaker(self.breaker_failure_ratio,
+                                                                   reset_after=self.breaker_reset)
+        return breaker
+
+    def _count(self, event, template):
+        key = (event, template)
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    async def acall(self, attempt, chain, template, stage=None, on_chunk=None, fallback_chain=None, canned=None,
+                    speculative=False):
+        """
+        Get a reply for one request. `attempt(chain, on_chunk, retry)` sends it once to `chain`
+        and returns the text. `canned()` makes the last-resort reply; without it the error is raised.
+        """
+        deadline = time.monotonic() + self.deadlines.get(stage, self.default_deadline)
+        shown = []   # chunks already passed to on_chunk
+
+        relay = None
+        if on_chunk is not None:
+            async def relay(chunk):
+                shown.append(chunk)
+                await on_chunk(chunk)
+
+        breaker = self.breaker(chain.llm)
+        if breaker.allow():
+            try:
+                return await self._aretry(attempt, chain, template, relay, shown, deadline, breaker,
+                                          attempts=1 if speculative else self.retry.attempts)
+            except asyncio.CancelledError:
+                breaker.abandon()
+                raise
+            except Exception as e:
+                error = e
+        else:
+            error = CircuitOpen(f"circuit open for {_model_name(chain.llm)}")
+            self._count("short_circuited", template)
+
+        if speculative:
+            raise error
+        if shown:
+            # part of the reply is already on the user's screen; keep it rather than start over
+            self._count("truncated", template)
+            return FallbackReply("".join(shown))
+        remaining = deadline - time.monotonic()
+        if fallback_chain is not None and remaining > 0:
+            try:
+                async with asyncio.timeout(remaining):
+                    text = await attempt(fallback_chain, relay, 0)
+                self._count("fallback_model", template)
+                return FallbackReply(text)
+            except Exception:
+                if shown:
+                    self._count("truncated", template)
+                    return FallbackReply("".join(shown))
+        if canned is None:
+            raise error
+        text = canned()
+        self._count("canned", template)
+        if on_chunk is not None:
+            await on_chunk(text)
+        return FallbackReply(text)
+
+    async def _aretry(self, attempt, chain, template, on_chunk, shown, deadline, breaker, attempts):
+        for retry in range(attempts):
+            timeout = asyncio.timeout(deadline - time.monotonic())
+            try:
+                async with timeout:
+                    text = await self._ahedge(attempt, chain, template, on_chunk, retry)
+            except Exception as e:
+                if timeout.expired():
+                    self._count("deadline_exceeded", template)
+                    e = DeadlineExceeded(f"{template}: no reply before the deadline")
+                # only failures that say something about the model's health count towards the breaker
+                if not is_retryable(e):
+                    breaker.abandon()
+                elif breaker.failure():
+                    self._count("breaker_opened", template)
+                if isinstance(e, DeadlineExceeded):
+                    raise e from None
+                # once chunks are shown a retry would repeat them
+                if shown or retry == attempts - 1 or not is_retryable(e):
+                    raise
+                delay = self.retry.delay(retry)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                self._count("retries", template)
+                await asyncio.sleep(delay)
+            else:
+                breaker.success()
+                return text
+
+    async def _ahedge(self, attempt, chain, template, on_chunk, retry):
+        hedge_after = None
+        if on_chunk is None and self.hedge_quantile is not None:
+            hedge_after = self.latency.quantile(template, self.hedge_quantile, self.hedge_min_samples)
+        started = time.monotonic()
+        if hedge_after is None:
+            text = await attempt(chain, on_chunk, retry)
+            self.latency.add(template, time.monotonic() - started)
+            return text
+
+        first = asyncio.ensure_future(attempt(chain, None, retry))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                self._count("hedged", template)
+                tasks.append(asyncio.ensure_future(attempt(chain, None, retry)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self._count("hedge_won", template)
+                        self.latency.add(template, time.monotonic() - started)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()   # mark a losing failure as seen so asyncio does not log it
+
+    def stats(self):
+        events = {}
+        for (event, _), n in self.counters.items():
+            events[event] = events.get(event, 0) + n
+        return {"events": events, "breakers": {name: b.state for name, b in self._breakers.items()}}
+
+    def render(self, prefix="mbti_resilience"):
+        """Counters and breaker states in Prometheus text format."""
+        lines = [f"# HELP {prefix}_events_total Retries, hedges, missed deadlines, breaker trips, degraded replies.",
+                 f"# TYPE {prefix}_events_total counter"]
+        for (event, template), n in sorted(self.counters.items()):
+            lines.append(f'{prefix}_events_total{{event="{event}",template="{template}"}} {n}')
+        lines += [f"# HELP {prefix}_breaker_open 1 while requests to the model are short-circuited.",
+                  f"# TYPE {prefix}_breaker_open gauge"]
+        for name, breaker in sorted(self._breakers.items()):
+            lines.append(f'{prefix}_breaker_open{{model="{name}"}} {int(breaker.state != "closed")}')
+        return "\n".join(lines) + "\n"
+
+
+_resilience = None
+
+
+def get_resilience():
+    """The process-wide resilience layer (one set of breakers and latency samples), created on first use."""
+    global _resilience
+    if _resilience is None:
+        _resilience = Resilience()
+    return _resilience
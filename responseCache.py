@@ -0,0 +1,190 @@
+"""
+Content-addressed cache for LLM responses.
+
+Entries are keyed on a hash of (rendered prompt, model, temperature, max_tokens).
+They live in a bounded in-memory LRU and, optionally, in a SQLite file that
+survives restarts and can be shared between processes. Both tiers drop
+entries older than `ttl` seconds. Code on an event loop uses aget() / aset() /
+acontains(), which only leave the loop (for a worker thread) when they have to
+touch the SQLite file.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, ttl=24 * 3600, sqlite_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sqlite_path = sqlite_path
+        self._memory = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        if sqlite_path:
+            # the file can be shared by several processes (see workerPool.py): readers don't block the writer
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(prompt, model, temperature, max_tokens):
+        payload = json.dumps([prompt, model, temperature, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, key):
+        """Return the cached response for `key`, or None on a miss."""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is None and self._db is not None:
+            value = self._db_get(key, now)
+        return self._count(value)
+
+    async def aget(self, key):
+        """get() for code on the event loop: the SQLite tier is read on a worker thread."""
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is None and self._db is not None:
+            value = await asyncio.to_thread(self._db_get, key, now)
+        return self._count(value)
+
+    def contains(self, key):
+        """True if `key` has a live entry; unlike get() this does not touch the LRU order or stats."""
+        now = time.time()
+        if self._memory_contains(key, now):
+            return True
+        return self._db is not None and self._db_contains(key, now)
+
+    async def acontains(self, key):
+        """contains() for code on the event loop."""
+        now = time.time()
+        if self._memory_contains(key, now):
+            return True
+        return self._db is not None and await asyncio.to_thread(self._db_contains, key, now)
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if self._db is not None:
+            self._db_set(key, value, now)
+
+    async def aset(self, key, value):
+        """set() for code on the event loop: the memory tier is updated at once, SQLite on a worker thread."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+        if self._db is not None:
+            await asyncio.to_thread(self._db_set, key, value, now)
+
+    def _count(self, value):
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _memory_get(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[0], now):
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry[1]
+
+    def _memory_contains(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            return entry is not None and not self._expired(entry[0], now)
+
+    # the SQLite tier: a commit can wait up to 30s for another process's write lock, so the
+    # async methods call these on a worker thread; _db_lock guards the connection, _lock the memory tier
+    def _db_get(self, key, now):
+        with self._db_lock:
+            row = self._db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self._expired(created_at, now):
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+        # promote to the memory tier
+        with self._lock:
+            self._remember(key, created_at, value)
+        return value
+
+    def _db_contains(self, key, now):
+        with self._db_lock:
+            row = self._db.execute("SELECT created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and not self._expired(row[0], now)
+
+    def _db_set(self, key, value, now):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)", (key, value, now)
+            )
+            self._db.commit()
+
+    def _remember(self, key, created_at, value):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def evict_expired(self):
+        """Drop every expired entry from both tiers."""
+        if self.ttl is None:
+            return
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (created_at, _) in self._memory.items() if self._expired(created_at, now)]:
+                del self._memory[key]
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+
+_cache = ResponseCache()
+
+
+def get_response_cache():
+    """Return the in-memory cache shared by all MBTIBot instances in this process."""
+    return _cache
@@ -0,0 +1,108 @@
+"""
+Explicit, versioned state of one MBTIBot conversation.
+
+Everything a later stage needs from an earlier one lives here: the coach choice,
+the user's MBTI, the relationship goal and target, and the LLM outputs the user
+has already been shown. The state is checkpointed after every completed stage
+(see sessionStore.py), so a restarted process can continue the conversation at
+the first unfinished stage without calling the LLM again for the finished ones.
+
+Serialized as compact JSON; `v` is the format version.
+"""
+import json
+
+STATE_VERSION = 1
+
+STAGES = ("select_coach", "learn_mbti", "set_goal", "boost_connection", "deep_dive")
+
+# serialized field name -> attribute name; short keys keep snapshots small
+_FIELDS = {
+    "id": "session_id",
+    "done": "completed_stages",
+    "coach": "coach",
+    "mbti": "user_mbti",
+    "scores": "mbti_scores",
+    "hobbies": "user_hobbies",
+    "goal": "relationship_goal",
+    "has_target": "has_target",
+    "t_mbti": "target_mbti",
+    "t_desc": "target_description",
+    "t_hobbies": "target_hobbies",
+    "out": "outputs",
+    "token": "resume_token",
+}
+
+
+class SessionState:
+    # one of these per live conversation, so no per-instance __dict__
+    __slots__ = tuple(_FIELDS.values())
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id
+        self.completed_stages = []
+        self.coach = None               # key into assistant_profiles.json
+        self.user_mbti = None
+        self.mbti_scores = None         # {axis: [letter, confidence]} from the four-question path
+        self.user_hobbies = None
+        self.relationship_goal = None
+        self.has_target = None
+        self.target_mbti = None
+        self.target_description = None
+        self.target_hobbies = None
+        self.outputs = {}               # stage -> the LLM reply shown at the end of that stage
+        self.resume_token = None        # chatServer: proof a client may resume this session (see SessionManager.create)
+
+    @property
+    def step2_result(self):
+        # set_goal's reply is both shown to the user and used as deep_dive context
+        return self.outputs.get("set_goal")
+
+    @step2_result.setter
+    def step2_result(self, value):
+        self.outputs["set_goal"] = value
+
+    def complete(self, stage):
+        if stage not in self.completed_stages:
+            self.completed_stages.append(stage)
+
+    def is_complete(self, stage):
+        return stage in self.completed_stages
+
+    @property
+    def next_stage(self):
+        for stage in STAGES:
+            if stage not in self.completed_stages:
+                return stage
+        return None
+
+    @property
+    def finished(self):
+        return self.next_stage is None
+
+    def to_dict(self):
+        data = {"v": STATE_VERSION}
+        for key, attr in _FIELDS.items():
+            value = getattr(self, attr)
+            if value not in (None, [], {}):
+                data[key] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        version = data.get("v")
+        if version != STATE_VERSION:
+            raise ValueError(f"Unsupported session state version: {version!r}")
+        state = cls()
+        for key, attr in _FIELDS.items():
+            if key in data:
+                setattr(state, attr, data[key])
+        if state.mbti_scores:
+            state.mbti_scores = {axis: tuple(score) for axis, score in state.mbti_scores.items()}
+        return state
+
+    def dumps(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, text):
+        return cls.from_dict(json.loads(text))
@@ -0,0 +1,89 @@
+"""
+Stores for SessionState checkpoints.
+
+A store is anything with load(session_id) -> SessionState | None,
+save(state) and delete(session_id). Two are provided: FileSessionStore keeps
+one JSON file per session in a directory, SQLiteSessionStore keeps them in a
+single SQLite table. open_session_store(path) picks one from the path.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from sessionState import SessionState
+
+_SAFE_ID = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class FileSessionStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, _SAFE_ID.sub("_", session_id) + ".json")
+
+    def load(self, session_id):
+        try:
+            with open(self._path(session_id), encoding="utf-8") as f:
+                return SessionState.loads(f.read())
+        except FileNotFoundError:
+            return None
+
+    def save(self, state):
+        path = self._path(state.session_id)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(state.dumps())
+        # a crash mid-write must not leave a truncated checkpoint behind
+        os.replace(tmp, path)
+
+    def delete(self, session_id):
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            pass
+
+
+class SQLiteSessionStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # shared by the workers of workerPool.py, so a session can be resumed on another one
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._db.execute("SELECT state FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return SessionState.loads(row[0]) if row else None
+
+    def save(self, state):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, updated_at) VALUES (?, ?, ?)",
+                (state.session_id, state.dumps(), time.time()),
+            )
+            self._db.commit()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def open_session_store(path):
+    """SQLite for *.db / *.sqlite paths, a directory of JSON files otherwise."""
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        return SQLiteSessionStore(path)
+    return FileSessionStore(path)
@@ -0,0 +1,83 @@
+"""
+Speculative execution of predictable LLM calls.
+
+While the bot waits for the user to type, it can start calls whose inputs are
+already known, such as the intro for the chosen coach or the deep dive for each
+suggested topic. If the conversation later makes exactly that call, the running
+(or finished) task is used instead of a new request. Calls that are never used
+are cancelled. A per-session budget caps how many calls and how many max_tokens
+may be spent speculatively.
+"""
+import asyncio
+
+
+class Speculator:
+    __slots__ = ("max_calls", "max_tokens", "_tasks", "spent_calls", "spent_tokens", "used", "cancelled", "rejected")
+
+    def __init__(self, max_calls=4, max_tokens=1024):
+        self.max_calls = max_calls
+        self.max_tokens = max_tokens
+        self._tasks = {}  # key -> (task, cost)
+        self.spent_calls = 0
+        self.spent_tokens = 0
+        self.used = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    @property
+    def pending(self):
+        return bool(self._tasks)
+
+    def launch(self, key, make_coro, cost=0):
+        """
+        Start `make_coro()` in the background under `key` unless it is already running
+        or the budget is used up. Returns True if a task was started.
+        """
+        if key in self._tasks:
+            return False
+        if self.spent_calls + 1 > self.max_calls or self.spent_tokens + cost > self.max_tokens:
+            self.rejected += 1
+            return False
+        task = asyncio.ensure_future(make_coro())
+        # a failed guess is simply not used, don't let asyncio log it as never retrieved
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[key] = (task, cost)
+        self.spent_calls += 1
+        self.spent_tokens += cost
+        return True
+
+    async def take(self, key):
+        """
+        Return the speculated result for `key`, waiting for it if still running.
+        Returns None when nothing usable was speculated (not launched, cancelled,
+        failed, or started on an event loop that has since closed).
+        """
+        entry = self._tasks.pop(key, None)
+        if entry is None:
+            return None
+        task = entry[0]
+        if task.cancelled() or task.get_loop() is not asyncio.get_running_loop():
+            return None
+        try:
+            result = await task
+        except Exception:
+            return None
+        self.used += 1
+        return result
+
+    def cancel_unused(self):
+        """Cancel (or drop) every speculated call that was not taken."""
+        for task, _ in self._tasks.values():
+            if not task.done():
+                task.cancel()
+            self.cancelled += 1
+        self._tasks.clear()
+
+    def stats(self):
+        return {
+            "launched": self.spent_calls,
+            "used": self.used,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "speculative_tokens": self.spent_tokens,
+        }
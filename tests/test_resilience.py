@@ -0,0 +1,168 @@
+"""
+resilience.py against the fault-injecting stand-in model (benchmarks.fakeLLM.FaultyChatModel).
+
+    python -m pytest -q tests
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+from benchmarks.fakeLLM import FaultyChatModel
+from benchmarks.runBenchmark import build_answers
+from chatApp import MBTIBot
+from mbtiEngine import get_engine
+from resilience import CircuitBreaker, FallbackReply, Resilience, RetryPolicy
+from responseCache import ResponseCache
+
+CANNED = "canned reply"
+
+
+def fast_retries(attempts=3):
+    return RetryPolicy(attempts=attempts, base_delay=0.001, max_delay=0.001, seed=0)
+
+
+def sender(request_timeout=None, models=None):
+    """
+    attempt() for Resilience.acall: sends the request to chain.llm (or to models[n] for the n-th
+    request) with the client-side timeout of the openai client. Records every request it sends.
+    """
+    sent = []
+
+    async def attempt(chain, on_chunk, retry):
+        model = models[len(sent)] if models else chain.llm
+        request = {"model": model, "retry": retry, "cancelled": False}
+        sent.append(request)
+        try:
+            async with asyncio.timeout(request_timeout):
+                return (await model.ainvoke("hello")).content
+        except asyncio.CancelledError:
+            request["cancelled"] = True
+            raise
+
+    return attempt, sent
+
+
+def acall(resilience, attempt, model, **kwargs):
+    return resilience.acall(attempt, SimpleNamespace(llm=model), "intro", canned=lambda: CANNED, **kwargs)
+
+
+def test_timeout_is_retried_then_answered_with_a_canned_reply():
+    model = FaultyChatModel(stall_rate=1.0, stall_seconds=5.0)
+    resilience = Resilience(retry=fast_retries(3))
+    attempt, sent = sender(request_timeout=0.05)
+
+    reply = asyncio.run(acall(resilience, attempt, model))
+
+    assert isinstance(reply, FallbackReply) and reply == CANNED
+    assert [request["retry"] for request in sent] == [0, 1, 2]
+    assert model.counters["stalls"] == 3
+    assert resilience.stats()["events"] == {"retries": 2, "canned": 1}
+
+
+def test_error_that_is_not_transient_is_not_retried():
+    model = FaultyChatModel(outage=True, error_status=400)
+    resilience = Resilience(retry=fast_retries(3))
+    attempt, sent = sender()
+
+    reply = asyncio.run(acall(resilience, attempt, model))
+
+    assert reply == CANNED and len(sent) == 1
+    assert "retries" not in resilience.stats()["events"]
+
+
+def test_breaker_opens_after_threshold_and_closes_after_cooldown():
+    model = FaultyChatModel(outage=True)
+    resilience = Resilience(retry=fast_retries(1), breaker_reset=0.2)
+    breaker = resilience.breaker(model)
+    attempt, sent = sender()
+
+    async def run():
+        for _ in range(breaker.min_requests - 1):
+            assert await acall(resilience, attempt, model) == CANNED
+        assert breaker.state == "closed"
+        # the failure that reaches min_requests trips it
+        await acall(resilience, attempt, model)
+        assert breaker.state == "open"
+        assert resilience.stats()["events"]["breaker_opened"] == 1
+
+        # while open, requests are not sent at all
+        before = len(sent)
+        assert await acall(resilience, attempt, model) == CANNED
+        assert len(sent) == before
+        assert resilience.stats()["events"]["short_circuited"] == 1
+
+        # after the cooldown one trial request is let through; it succeeds and closes the breaker
+        model.outage = False
+        await asyncio.sleep(0.25)
+        reply = await acall(resilience, attempt, model)
+        assert not isinstance(reply, FallbackReply)
+        assert len(sent) == before + 1
+        assert breaker.state == "closed"
+
+    asyncio.run(run())
+
+
+def test_failed_trial_request_opens_the_breaker_again():
+    now = [0.0]
+    breaker = CircuitBreaker(min_requests=4, window=4, reset_after=10.0, clock=lambda: now[0])
+    for _ in range(4):
+        assert breaker.allow()
+        breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 10.0
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()   # only one trial at a time
+    assert breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_hedge_answers_first_and_cancels_the_loser():
+    stalled = FaultyChatModel(stall_rate=1.0, stall_seconds=5.0)
+    healthy = FaultyChatModel(latency_mean=0.01)
+    resilience = Resilience(retry=fast_retries(1), hedge_quantile=0.5, hedge_min_samples=5)
+    for _ in range(5):
+        resilience.latency.add("intro", 0.02)
+    attempt, sent = sender(models=[stalled, healthy])
+
+    async def run():
+        started = time.monotonic()
+        reply = await acall(resilience, attempt, stalled)
+        elapsed = time.monotonic() - started
+        # let the cancellation reach the losing request
+        await asyncio.sleep(0)
+        return reply, elapsed
+
+    reply, elapsed = asyncio.run(run())
+
+    assert not isinstance(reply, FallbackReply) and reply
+    assert elapsed < 1.0
+    assert [request["model"] for request in sent] == [stalled, healthy]
+    assert sent[0]["cancelled"] and not sent[1]["cancelled"]
+    assert resilience.stats()["events"] == {"hedged": 1, "hedge_won": 1}
+
+
+def test_conversation_finishes_on_canned_replies_during_an_outage():
+    model = FaultyChatModel(outage=True, error_latency=0.0)
+    resilience = Resilience(retry=fast_retries(2))
+    engine = get_engine().replace(llm_model=model, response_cache=ResponseCache(), resilience=resilience)
+    script = iter(build_answers(True, "known", 1))
+    said = []
+
+    async def scripted_input(question):
+        # a degraded reply can change the questions that follow; "no" ends every loop
+        return next(script, "no")
+
+    result = asyncio.run(MBTIBot(input_func=scripted_input, print_func=said.append, engine=engine).arun())
+
+    assert result == {"user_mbti": "INFP", "relationship_goal": "romantic"}
+    assert model.counters["calls"] == 0
+    degraded = [text for text in said if isinstance(text, FallbackReply)]
+    # the MBTI summary, the insight, the suggestions and the deep-dive answer
+    assert len(degraded) == 4
+    assert resilience.stats()["events"] == {"retries": 4, "canned": 4}
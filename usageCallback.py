@@ -0,0 +1,40 @@
+"""
+LangChain callback that reads token usage off an LLM result, for instrumentation.py.
+
+Kept in its own module so that importing instrumentation (and chatApp) does not
+import LangChain.
+"""
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Collects token usage from the LLM result of one call, and the prompt text sent."""
+
+    def __init__(self):
+        self.prompt = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        # one HumanMessage holding the rendered template
+        self.prompt = "\n".join(str(message.content) for message in messages[0])
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.prompt = prompts[0]
+
+    def on_llm_end(self, response, **kwargs):
+        found = False
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    found = True
+                    self.prompt_tokens += usage.get("input_tokens", 0)
+                    self.completion_tokens += usage.get("output_tokens", 0)
+                    self.cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        if not found and response.llm_output:
+            usage = response.llm_output.get("token_usage") or {}
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+            self.cached_tokens += (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
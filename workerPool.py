@@ -0,0 +1,476 @@
+"""
+Several chatServer.py workers behind one lightweight front process.
+
+One server process is bound by the GIL (prompt rendering, the input guard,
+JSON) and is a single failure domain. This starts:
+- a fork server that imports chatServer, LangChain and the OpenAI client once.
+  Every worker is forked from it, so they share those pages;
+- --workers chatServer workers, each on its own port on 127.0.0.1. Limits such
+  as --max-in-flight or --max-sessions apply to each worker;
+- the front. It serves the chatServer API on --port and forwards every request
+  to the worker hosting the session.
+
+Routing is sticky. A new session goes to the live worker with the highest
+rendezvous hash of its id, and the front remembers where each session lives.
+A worker that dies is restarted. Its sessions move to the other workers, which
+resume them from their last checkpoint in the shared session store (the front
+keeps each session's resume token for that): the reply that found the worker
+gone is answered with the resumed session's messages and "resumed": true.
+
+The workers share
+- the session store (--session-store, a SQLite file);
+- the response cache (--response-cache, a SQLite file);
+- the coach profiles, as a snapshot. The front loads assistant_profiles.json
+  once and publishes it in profiles.db. Every worker, restarted ones included,
+  reads the snapshot into its own engine, so all of them coach from the same
+  profiles even if the JSON file changes meanwhile (each keeps its own copy in
+  memory; the profiles are small).
+Files that are not given go to --shared-dir (a new temporary directory by
+default). With --match-index every worker keeps its own index in a
+subdirectory, and matches come from the sessions of the same worker.
+
+GET /healthz on the front lists the workers with their own /healthz, and
+/metrics (with --metrics) merges the workers' metrics with a worker label.
+
+    python workerPool.py --workers 4 --port 8080
+    python workerPool.py --workers 4 --port 8080 --openai-base-url http://127.0.0.1:9000/v1
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from chatServer import ChatServer, ServerBusy, build_parser, serve as serve_worker
+from mbtiEngine import load_assistant_profiles
+
+log = logging.getLogger("workerPool")
+
+# imported once by the fork server instead of by every worker
+PRELOAD = ["chatServer", "httpx", "langchain.chains", "langchain.prompts", "langchain_openai"]
+
+
+def publish_profiles(path, profiles):
+    """Write the profile snapshot the workers load."""
+    db = sqlite3.connect(path, timeout=30)
+    try:
+        with db:
+            db.execute("CREATE TABLE IF NOT EXISTS profiles (choice TEXT PRIMARY KEY, profile TEXT NOT NULL)")
+            db.execute("DELETE FROM profiles")
+            db.executemany("INSERT INTO profiles (choice, profile) VALUES (?, ?)",
+                           [(choice, json.dumps(profile, ensure_ascii=False)) for choice, profile in profiles.items()])
+    finally:
+        db.close()
+
+
+def load_profiles(path):
+    db = sqlite3.connect(path, timeout=30)
+    try:
+        return {choice: json.loads(profile) for choice, profile in db.execute("SELECT choice, profile FROM profiles")}
+    finally:
+        db.close()
+
+
+def _worker_main(slot, args, profiles_path, ready):
+    # runs in a process forked from the fork server
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s worker{slot} %(name)s %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    from mbtiEngine import MBTIEngine
+
+    engine = MBTIEngine(profiles=load_profiles(profiles_path))
+    asyncio.run(serve_worker(args, engine=engine, on_listening=ready.send))
+
+
+def _wait_for_port(conn, process, timeout):
+    """The port the worker reported, or None if it died or took longer than `timeout`."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.is_alive():
+        if conn.poll(0.2):
+            try:
+                return conn.recv()
+            except EOFError:
+                return None
+    return None
+
+
+def _finished(data):
+    """Whether a worker's reply body says the session is done."""
+    try:
+        reply = json.loads(data)
+    except ValueError:
+        return False
+    return isinstance(reply, dict) and reply.get("done") is True
+
+
+class WorkerGone(ConnectionError):
+    def __init__(self, worker, reason):
+        super().__init__(f"worker {worker.slot} {reason}")
+        self.worker = worker
+
+
+class Worker:
+    __slots__ = ("slot", "process", "port", "generation", "up", "started_at", "crashes", "restarting", "_idle")
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.process = None
+        self.port = None
+        self.generation = 0       # bumped on every (re)start; sessions of an older one must be resumed
+        self.up = False
+        self.started_at = 0.0
+        self.crashes = 0          # deaths in a row shortly after starting
+        self.restarting = False
+        self._idle = []           # keep-alive connections to the worker
+
+    def close_connections(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+    async def request(self, method, path, body=b""):
+        """Send one request to the worker; returns (status, headers, body). Raises WorkerGone if it is unreachable."""
+        head = (f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1")
+        conn = self._idle.pop() if self._idle else None
+        while True:
+            reused = conn is not None
+            try:
+                if conn is None:
+                    conn = await asyncio.open_connection("127.0.0.1", self.port)
+                reader, writer = conn
+                writer.write(head + body)
+                await writer.drain()
+                status_line = await reader.readline()
+            except OSError:
+                status_line = b""
+            if status_line:
+                break
+            if conn is not None:
+                conn[1].close()
+            conn = None
+            # an idle connection the worker had already closed: the request never arrived, send it again
+            if not reused:
+                raise WorkerGone(self, "is unreachable")
+        try:
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            data = await reader.readexactly(int(headers.get("content-length") or 0))
+        except (OSError, asyncio.IncompleteReadError):
+            writer.close()
+            raise WorkerGone(self, "closed the connection") from None
+        if headers.get("connection", "").lower() == "close":
+            writer.close()
+        else:
+            self._idle.append(conn)
+        return int(status_line.split()[1]), headers, data
+
+
+def _rendezvous(slot, session_id):
+    digest = hashlib.blake2b(f"{slot}/{session_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def merge_metrics(texts):
+    """Merge the Prometheus text of several workers, {slot: text}, adding a worker label to every sample."""
+    families = {}   # metric name -> [HELP / TYPE lines, samples]
+    for slot, text in texts.items():
+        family = None
+        for line in text.splitlines():
+            if line.startswith(("# HELP ", "# TYPE ")):
+                family = families.setdefault(line.split()[2], [[], []])
+                if line not in family[0]:
+                    family[0].append(line)
+            elif line and family is not None:
+                name, brace, rest = line.partition("{")
+                if brace:
+                    family[1].append(f'{name}{{worker="{slot}",{rest}')
+                else:
+                    name, _, value = line.partition(" ")
+                    family[1].append(f'{name}{{worker="{slot}"}} {value}')
+    return "".join("\n".join(header + samples) + "\n" for header, samples in families.values())
+
+
+class WorkerPool:
+    """Starts and restarts the workers and knows which one hosts each session."""
+
+    def __init__(self, args, workers, profiles_path):
+        self.args = args
+        self.profiles_path = profiles_path
+        self.workers = [Worker(slot) for slot in range(workers)]
+        self.homes = {}          # session id -> [worker, its generation, last used, resume token]
+        self.rehomed = 0
+        self.restarts = 0
+        self.draining = False
+        self._ctx = multiprocessing.get_context("forkserver")
+        self._ctx.set_forkserver_preload(PRELOAD)
+        self._monitor = None
+
+    def _worker_args(self, worker):
+        args = argparse.Namespace(**vars(self.args))
+        args.host, args.port = "127.0.0.1", 0
+        if self.args.match_index:
+            args.match_index = os.path.join(self.args.match_index, f"worker{worker.slot}")
+        return args
+
+    async def start(self, timeout=120.0):
+        started = await asyncio.gather(*(self._start_worker(worker, timeout) for worker in self.workers))
+        if not any(started):
+            raise RuntimeError("no worker started")
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def _start_worker(self, worker, timeout=120.0):
+        receive, send = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(target=_worker_main, name=f"worker{worker.slot}",
+                                    args=(worker.slot, self._worker_args(worker), self.profiles_path, send))
+        await asyncio.to_thread(process.start)
+        send.close()
+        worker.process = process
+        port = await asyncio.to_thread(_wait_for_port, receive, process, timeout)
+        receive.close()
+        if port is None:
+            log.error("worker %d did not start", worker.slot)
+            process.kill()
+            return False
+        worker.port = port
+        worker.generation += 1
+        worker.started_at = time.monotonic()
+        worker.up = True
+        log.info("worker %d: pid %d, port %d", worker.slot, process.pid, port)
+        return True
+
+    async def _watch(self, interval=0.5):
+        while not self.draining:
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.up and not worker.process.is_alive():
+                    self.worker_down(worker)
+                if not worker.up and not worker.restarting:
+                    worker.restarting = True
+                    asyncio.create_task(self._restart(worker))
+            # sessions the workers have long expired
+            stale = now - (self.args.idle_timeout + self.args.turn_timeout)
+            for session_id in [sid for sid, home in self.homes.items() if home[2] < stale]:
+                del self.homes[session_id]
+            await asyncio.sleep(interval)
+
+    def worker_down(self, worker):
+        if not worker.up:
+            return
+        worker.up = False
+        worker.close_connections()
+        if time.monotonic() - worker.started_at < 10:
+            worker.crashes += 1
+        else:
+            worker.crashes = 0
+        log.warning("worker %d (pid %d) exited with %s", worker.slot, worker.process.pid, worker.process.exitcode)
+
+    async def _restart(self, worker):
+        try:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.kill()
+                await asyncio.to_thread(worker.process.join, 5)
+            # a worker that keeps dying right after starting is not restarted in a tight loop
+            await asyncio.sleep(min(30, 2 ** worker.crashes) if worker.crashes > 1 else 0)
+            if not self.draining and await self._start_worker(worker):
+                self.restarts += 1
+        finally:
+            worker.restarting = False
+
+    def place(self, session_id, resume_token=None):
+        """The worker a new session goes to."""
+        live = [worker for worker in self.workers if worker.up]
+        if not live:
+            raise ServerBusy("no worker is running", retry_after=2)
+        worker = max(live, key=lambda w: _rendezvous(w.slot, session_id))
+        self.homes[session_id] = [worker, worker.generation, time.monotonic(), resume_token]
+        return worker
+
+    def home(self, session_id):
+        """(worker hosting the session, True if the session has to be resumed there first)."""
+        home = self.homes.get(session_id)
+        if home is not None and home[0].up and home[0].generation == home[1]:
+            home[2] = time.monotonic()
+            return home[0], False
+        # unknown to this front (it was restarted): the rendezvous hash gives the same worker as before
+        return self.place(session_id, home and home[3]), home is not None
+
+    def resume_token(self, session_id):
+        """The token the session's worker gave it, which the front needs to resume it elsewhere."""
+        home = self.homes.get(session_id)
+        return home and home[3]
+
+    def forget(self, session_id):
+        self.homes.pop(session_id, None)
+
+    async def drain(self, timeout=30.0):
+        """Let every worker finish its sessions (they drain on SIGTERM) and wait for them to exit."""
+        self.draining = True
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self.workers:
+            if worker.process is not None:
+                await asyncio.to_thread(worker.process.join, timeout + 5)
+                if worker.process.is_alive():
+                    worker.process.kill()
+            worker.up = False
+            worker.close_connections()
+
+    def stats(self):
+        per_worker = {}
+        for home in self.homes.values():
+            per_worker[home[0].slot] = per_worker.get(home[0].slot, 0) + 1
+        return {
+            "sessions": len(self.homes),
+            "rehomed": self.rehomed,
+            "restarts": self.restarts,
+            "draining": self.draining,
+            "workers": [{"slot": w.slot, "pid": w.process.pid if w.process else None, "port": w.port, "up": w.up,
+                         "generation": w.generation, "sessions": per_worker.get(w.slot, 0)} for w in self.workers],
+        }
+
+
+class FrontServer(ChatServer):
+    """The chatServer API, forwarded to the worker hosting each session."""
+
+    def __init__(self, pool, keep_alive_timeout=75.0):
+        super().__init__(pool, keep_alive_timeout=keep_alive_timeout)
+        self.pool = pool
+
+    async def _dispatch(self, method, path, body):
+        for _ in range(2):
+            try:
+                return await self._route(method, path, body)
+            except WorkerGone as e:
+                # the worker died: its sessions are resumed elsewhere, try once more
+                log.warning("%s", e)
+                await asyncio.to_thread(e.worker.process.join, 1.0)
+                if not e.worker.process.is_alive():
+                    self.pool.worker_down(e.worker)
+            except ServerBusy as e:
+                return 503, {"error": str(e)}, {"Retry-After": e.retry_after}
+        return 503, {"error": "worker unavailable"}, {"Retry-After": 1}
+
+    async def _route(self, method, path, body):
+        parts = path.partition("?")[0].strip("/").split("/")
+        if parts == ["healthz"] and method == "GET":
+            return 200, await self._health(), None
+        if parts == ["metrics"] and method == "GET":
+            return await self._metrics()
+        if parts == ["sessions"] and method == "POST":
+            try:
+                request = json.loads(body or b"{}")
+                session_id, resume_token = request.get("session_id"), request.get("resume_token")
+            except (ValueError, AttributeError):
+                return 400, {"error": "invalid JSON body"}, None
+            session_id = str(session_id) if session_id else uuid.uuid4().hex
+            return await self._create(self.pool.place(session_id), session_id, resume_token)
+        if len(parts) >= 2 and parts[0] == "sessions":
+            session_id = parts[1]
+            worker, resume = self.pool.home(session_id)
+            if resume:
+                self.pool.rehomed += 1
+                if method == "DELETE":
+                    self.pool.forget(session_id)
+                    return 204, None, None
+                if method == "POST" and parts[2:] == ["reply"]:
+                    return await self._resume(worker, session_id)
+            return await self._forward(worker, session_id, method, path, body)
+        return 404, {"error": "not found"}, None
+
+    async def _forward(self, worker, session_id, method, path, body):
+        status, headers, data = await worker.request(method, path, body)
+        # the session is over (or was never there): forget where it lived
+        if status in (204, 404) or status in (200, 201) and _finished(data):
+            self.pool.forget(session_id)
+        extra = {"Retry-After": headers["retry-after"]} if "retry-after" in headers else None
+        return status, data, extra
+
+    async def _create(self, worker, session_id, resume_token=None):
+        """Start (or, with its resume token, resume) `session_id` on `worker`."""
+        body = {"session_id": session_id, "resume_token": resume_token} if resume_token else {"session_id": session_id}
+        status, data, extra = await self._forward(worker, session_id, "POST", "/sessions",
+                                                  json.dumps(body).encode("utf-8"))
+        if status == 201 and session_id in self.pool.homes:
+            self.pool.homes[session_id][3] = json.loads(data).get("resume_token")
+        return status, data, extra
+
+    async def _resume(self, worker, session_id):
+        """Resume a session whose worker died on `worker`, from its last checkpoint."""
+        status, data, _ = await self._create(worker, session_id, self.pool.resume_token(session_id))
+        if status != 201:
+            return status, data, None
+        resumed = json.loads(data)
+        log.info("session %s resumed on worker %d", session_id, worker.slot)
+        return 200, {"messages": resumed["messages"], "done": resumed["done"], "resumed": True}, None
+
+    async def _fan_out(self, path):
+        """{slot: body} of GET `path` from every live worker."""
+        live = [worker for worker in self.pool.workers if worker.up]
+        results = await asyncio.gather(*(worker.request("GET", path) for worker in live), return_exceptions=True)
+        return {worker.slot: result[2] for worker, result in zip(live, results)
+                if not isinstance(result, BaseException) and result[0] == 200}
+
+    async def _health(self):
+        stats = self.pool.stats()
+        bodies = await self._fan_out("/healthz")
+        for worker in stats["workers"]:
+            worker["health"] = json.loads(bodies[worker["slot"]]) if worker["slot"] in bodies else None
+        return stats
+
+    async def _metrics(self):
+        if not self.pool.args.metrics:
+            return 404, {"error": "metrics are disabled"}, None
+        bodies = await self._fan_out("/metrics")
+        return 200, merge_metrics({slot: body.decode("utf-8") for slot, body in bodies.items()}), None
+
+
+async def serve(args):
+    shared_dir = args.shared_dir or tempfile.mkdtemp(prefix="mbti-workers-")
+    os.makedirs(shared_dir, exist_ok=True)
+    args.session_store = args.session_store or os.path.join(shared_dir, "sessions.db")
+    args.response_cache = args.response_cache or os.path.join(shared_dir, "responses.db")
+    profiles_path = os.path.join(shared_dir, "profiles.db")
+    publish_profiles(profiles_path, load_assistant_profiles())
+    log.info("shared files in %s", shared_dir)
+
+    pool = WorkerPool(args, args.workers, profiles_path)
+    await pool.start()
+    server = FrontServer(pool)
+    port = await server.start(args.host, args.port)
+    # the load test reads the port from this line
+    print(f"listening on {args.host}:{port}", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    log.info("draining %d sessions", len(pool.homes))
+    await server.shutdown(args.drain_timeout)
+
+
+def main(argv=None):
+    parser = build_parser()
+    parser.description = __doc__
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--shared-dir", help="directory for the shared SQLite files (default: a new temporary one)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Local yes/no classifier that sits in front of the LLM classification chain.
+
+Short answers such as "yes", "Y", "nope!" or "是的" are resolved in-process.
+Anything that is not an exact (normalized) match for a known synonym, e.g.
+"yes, it starts with i", is handed to the fallback (the LLM chain).
+"""
+import re
+import threading
+import unicodedata
+
+DEFAULT_YES = {
+    "yes", "y", "ye", "yep", "yeah", "yea", "yup", "ya", "yes please", "sure", "of course",
+    "ok", "okay", "absolutely", "definitely", "correct", "i do", "yes i do", "i know",
+    "yes i know", "是", "是的", "对", "对的", "知道", "有", "嗯",
+}
+DEFAULT_NO = {
+    "no", "n", "nope", "nah", "no thanks", "not really", "no idea", "i dont", "i do not",
+    "dont know", "i dont know", "no i dont", "not sure", "never", "not yet",
+    "不", "不是", "不知道", "没有", "否",
+}
+
+_PUNCT = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text):
+    """Case-fold, drop punctuation (so "don't" == "dont") and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = _PUNCT.sub("", text.replace("’", "'"))
+    return _SPACES.sub(" ", text).strip()
+
+
+class YesNoClassifier:
+    def __init__(self, yes_synonyms=None, no_synonyms=None):
+        self.yes_synonyms = {normalize(s) for s in (yes_synonyms or DEFAULT_YES)}
+        self.no_synonyms = {normalize(s) for s in (no_synonyms or DEFAULT_NO)}
+        overlap = self.yes_synonyms & self.no_synonyms
+        if overlap:
+            raise ValueError(f"Synonyms listed as both yes and no: {sorted(overlap)}")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def add_synonyms(self, yes=(), no=()):
+        with self._lock:
+            self.yes_synonyms.update(normalize(s) for s in yes)
+            self.no_synonyms.update(normalize(s) for s in no)
+
+    def classify_local(self, text):
+        """Return "yes", "no", or None when the answer can't be resolved confidently."""
+        key = normalize(text)
+        if key in self.yes_synonyms:
+            return "yes"
+        if key in self.no_synonyms:
+            return "no"
+        return None
+
+    def _count(self, text):
+        answer = self.classify_local(text)
+        with self._lock:
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return answer
+
+    def classify(self, text, fallback=None):
+        """
+        Classify `text` locally, calling `fallback(text)` only on a miss.
+        Without a fallback a miss is treated as "no", like the LLM prompt does for unclear answers.
+        """
+        answer = self._count(text)
+        if answer is not None:
+            return answer
+        if fallback is None:
+            return "no"
+        return fallback(text).strip().lower()
+
+    async def aclassify(self, text, fallback=None):
+        """Same as classify() with an async `fallback`."""
+        answer = self._count(text)
+        if answer is not None:
+            return answer
+        if fallback is None:
+            return "no"
+        return (await fallback(text)).strip().lower()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+_classifier = YesNoClassifier()
+
+
+def get_yes_no_classifier():
+    """Return the classifier shared by all MBTIBot instances in this process."""
+    return _classifier